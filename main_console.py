@@ -10,7 +10,12 @@ from pathlib import Path
 
 from src.config import Config
 from src.audio import AudioRecorder
-from src.ai.datapizza_analyzer import DataPizzaAudioAnalyzer
+from src.ai.client_pool import pool_stats
+from src.ai.engines import create_analyzer
+from src.ai.events import MediaPrepared, Saved, SummaryReady, ToneReady, TranscriptReady
+from src.ai.live_monitor import LiveToneMonitor
+from src.utils.archive import recording_available
+from src.utils.catalog import get_catalog
 
 
 class VibeTalkingConsole:
@@ -18,7 +23,8 @@ class VibeTalkingConsole:
     
     def __init__(self):
         self.recorder = AudioRecorder()
-        self.analyzer = DataPizzaAudioAnalyzer()
+        self.analyzer = create_analyzer()
+        self.catalog = get_catalog()
         
     def print_header(self):
         """Stampa header dell'applicazione"""
@@ -40,6 +46,10 @@ class VibeTalkingConsole:
         print("5️⃣  Analizza Ultimo Audio")
         print("6️⃣  Mostra File Registrati")
         print("7️⃣  Test Completo (Registra + Analizza)")
+        print("8️⃣  Ricostruisci Catalogo")
+        print("9️⃣  Cerca nelle Trascrizioni 🔎")
+        print("🔟 Statistiche del Tono 📈")
+        print("1️⃣1️⃣ Profilo Prestazioni ⚙️")
         print("0️⃣  Esci")
         print("-" * 40)
     
@@ -52,11 +62,24 @@ class VibeTalkingConsole:
         else:
             print(f"\n🎤 Avvio registrazione ({duration} secondi)...")
         
+        # Monitor del tono sulla finestra scorrevole (solo registrazione continua)
+        monitor = None
+        if duration is None and Config.LIVE_MONITOR:
+            client = self.analyzer.google_client if Config.LIVE_MONITOR_MODEL else None
+            monitor = LiveToneMonitor(client=client)
+            self.recorder.set_callback(monitor.feed)
+        
         # Avvia registrazione
         recording_file = self.recorder.start_recording()
         if not recording_file:
             print("❌ Errore nell'avvio della registrazione")
+            if monitor:
+                self.recorder.set_callback(None)
             return ""
+        # Connessioni e client pronti per l'analisi che seguirà
+        warmup = self.analyzer.start_warmup()
+        if monitor:
+            monitor.start()
         
         print(f"✅ Registrazione avviata: {Path(recording_file).name}")
         
@@ -73,7 +96,8 @@ class VibeTalkingConsole:
             try:
                 while True:
                     elapsed = time.time() - start_time
-                    print(f"\r⏱️  Registrando... {elapsed:.1f}s - Premi INVIO per fermare", end="", flush=True)
+                    live = f" | {monitor.indicator()}" if monitor else ""
+                    print(f"\r⏱️  Registrando... {elapsed:.1f}s{live} - Premi INVIO per fermare   ", end="", flush=True)
                     
                     # Controlla se è stato premuto Invio (Linux/Unix)
                     if sys.stdin in select.select([sys.stdin], [], [], 0.1)[0]:
@@ -98,6 +122,18 @@ class VibeTalkingConsole:
         
         # Ferma registrazione
         saved_file = self.recorder.stop_recording()
+        if warmup:
+            warmup.stop()
+            print(f"🔥 Riscaldamento client: {warmup.summary()}")
+        if monitor:
+            monitor.stop()
+            for sub in self.recorder.bus.stats():
+                if sub['dropped']:
+                    print(f"⚠️ Monitor in ritardo: {sub['dropped']} chunk scartati (ritardo massimo {sub['max_lag']})")
+            self.recorder.set_callback(None)
+            if monitor.current and "tono_principale" in monitor.current:
+                print(f"🎭 Ultimo tono provvisorio: {monitor.current['tono_principale']} "
+                      f"({monitor.updates} aggiornamenti, {monitor.analysis_ms:.0f} ms per analisi)")
         if saved_file:
             file_size = Path(saved_file).stat().st_size
             print(f"✅ Registrazione completata!")
@@ -110,7 +146,7 @@ class VibeTalkingConsole:
     
     async def analyze_audio(self, audio_file: str):
         """Analizza un file audio"""
-        if not audio_file or not Path(audio_file).exists():
+        if not audio_file or not recording_available(audio_file):
             print("❌ File audio non trovato")
             return
         
@@ -118,42 +154,35 @@ class VibeTalkingConsole:
         print(f"📁 File: {Path(audio_file).name}")
         
         try:
-            # Analisi
-            results = await self.analyzer.analyze_audio_file(audio_file)
-            
-            if not results:
-                print("❌ Nessun risultato dall'analisi")
-                return
-            
-            # Salva risultati
-            output_file = self.analyzer.save_analysis_results(results)
-            
-            # Mostra risultati
-            self.display_results(results, output_file)
+            # Analisi: ogni sezione viene mostrata appena il suo stadio finisce
+            async for event in self.analyzer.stream_analysis(audio_file):
+                if isinstance(event, MediaPrepared):
+                    duration = f"{event.duration_s:.1f} s" if event.duration_s else "durata ignota"
+                    print(f"🎧 Audio pronto ({duration}) in {event.elapsed_s:.1f} s")
+                elif isinstance(event, TranscriptReady):
+                    self.print_transcription(event.transcription, event.elapsed_s)
+                elif isinstance(event, ToneReady):
+                    self.print_tone(event.tone_analysis, event.tone_timeline, event.elapsed_s)
+                elif isinstance(event, SummaryReady):
+                    self.print_summary(event.summary, event.elapsed_s)
+                elif isinstance(event, Saved):
+                    self.print_footer(event.results, event.output_file or "")
             
         except Exception as e:
             print(f"❌ Errore nell'analisi: {e}")
     
-    def display_results(self, results: dict, output_file: str):
-        """Mostra i risultati dell'analisi"""
-        print("\n" + "="*60)
-        print("🎯 RISULTATI ANALISI DATAPIZZA")
-        print("="*60)
-        
-        # Info file
-        print(f"📁 File Audio: {Path(results.get('file_path', '')).name}")
-        print(f"💾 Risultati JSON: {Path(output_file).name}")
-        print(f"🔧 Analyzer: {results.get('analyzer', 'N/A')}")
-        print(f"⏰ Timestamp: {results.get('timestamp', 'N/A')}")
-        
-        print("\n📝 TRASCRIZIONE:")
+    @staticmethod
+    def _section(title: str, elapsed_s: float = None):
+        suffix = f" (dopo {elapsed_s:.1f} s)" if elapsed_s is not None else ""
+        print(f"\n{title}{suffix}")
         print("-" * 30)
-        transcription = results.get('transcription', 'N/A')
+    
+    def print_transcription(self, transcription: str, elapsed_s: float = None):
+        self._section("📝 TRASCRIZIONE:", elapsed_s)
         print(f"'{transcription}'")
-        
-        print("\n🎭 ANALISI DEL TONO:")
-        print("-" * 30)
-        tone = results.get('tone_analysis', {})
+    
+    def print_tone(self, tone: dict, timeline: list, elapsed_s: float = None):
+        self._section("🎭 ANALISI DEL TONO:", elapsed_s)
         print(f"• Tono principale: {tone.get('tono_principale', 'N/A')}")
         print(f"• Intensità: {tone.get('intensità', 'N/A')}")
         print(f"• Confidenza: {tone.get('confidenza', 'N/A')}%")
@@ -169,45 +198,146 @@ class VibeTalkingConsole:
             for suggestion in suggestions:
                 print(f"  - {suggestion}")
         
-        print("\n📋 RIASSUNTO:")
-        print("-" * 30)
-        summary = results.get('summary', 'N/A')
+        if timeline:
+            print("\n🕐 TIMELINE DEL TONO:")
+            print("-" * 30)
+            for segment in timeline:
+                start, end = int(segment['start']), int(segment['end'])
+                print(f"  {start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}  "
+                      f"{segment.get('tono_principale') or 'N/A':<12} "
+                      f"{segment.get('intensità') or '-'} ({segment.get('confidenza', 'N/A')}%)")
+    
+    def print_summary(self, summary: str, elapsed_s: float = None):
+        self._section("📋 RIASSUNTO:", elapsed_s)
         print(f"'{summary}'")
-        
+    
+    def print_footer(self, results: dict, output_file: str):
         print("\n" + "="*60)
+        print("🎯 RISULTATI ANALISI DATAPIZZA")
+        print("="*60)
+        print(f"📁 File Audio: {Path(results.get('file_path', '')).name}")
+        print(f"💾 Risultati JSON: {Path(output_file).name if output_file else 'non salvati'}")
+        print(f"🔧 Analyzer: {results.get('analyzer', 'N/A')}")
+        engines = results.get('engines')
+        if engines:
+            print(f"⚙️ Motori: {', '.join(f'{stage} {name}' for stage, name in engines.items())}")
+        print(f"⏰ Timestamp: {results.get('timestamp', 'N/A')}")
+        timed_out = results.get('deadline', {}).get('timed_out')
+        if timed_out:
+            print(f"⏱️ Oltre la scadenza (fallback locale): {', '.join(timed_out)}")
         print("🎉 Analisi completata con DataPizzaAI!")
         print("="*60 + "\n")
     
     def show_recordings(self):
         """Mostra i file registrati"""
-        recordings_dir = Path("recordings")
-        if not recordings_dir.exists():
-            print("❌ Directory recordings non trovata")
-            return
-        
-        # File audio
-        audio_files = list(recordings_dir.glob("recording_*.wav"))
-        json_files = list(recordings_dir.glob("datapizza_analysis_*.json"))
+        audio_files = self.catalog.latest_recordings(5)
+        json_files = self.catalog.latest_analyses(5)
         
-        print(f"\n📁 FILE NELLA DIRECTORY recordings/:")
+        print(f"\n📁 FILE NELLA DIRECTORY {Config.OUTPUT_DIR}/:")
         print("-" * 40)
         
         if audio_files:
             print("🎵 FILE AUDIO:")
-            for i, file in enumerate(sorted(audio_files)[-5:], 1):  # Ultimi 5
-                size = file.stat().st_size
-                print(f"  {i}. {file.name} ({size:,} bytes)")
+            for i, entry in enumerate(reversed(audio_files), 1):  # Ultimi 5
+                size = entry['size'] or 0
+                duration = entry['duration']
+                duration_str = f", {duration:.1f}s" if duration else ""
+                print(f"  {i}. {Path(entry['path']).name} ({size:,} bytes{duration_str})")
         
         if json_files:
             print("\n📊 ANALISI JSON:")
-            for i, file in enumerate(sorted(json_files)[-5:], 1):  # Ultimi 5
-                print(f"  {i}. {file.name}")
+            for i, entry in enumerate(reversed(json_files), 1):  # Ultimi 5
+                tone = f" - {entry['tone']}" if entry['tone'] else ""
+                print(f"  {i}. {Path(entry['path']).name}{tone}")
         
         if not audio_files and not json_files:
             print("📂 Nessun file trovato")
         
         print()
     
+    def rebuild_catalog(self):
+        """Ricostruisce il catalogo dalla cartella delle registrazioni"""
+        print(f"\n🔄 Ricostruzione catalogo da {Config.OUTPUT_DIR}/...")
+        start_time = time.time()
+        counts = self.catalog.rebuild()
+        elapsed = time.time() - start_time
+        print(f"✅ Catalogo ricostruito in {elapsed:.2f}s: "
+              f"{counts['recordings']} registrazioni, {counts['analyses']} analisi")
+    
+    def search_transcripts(self):
+        """Ricerca full-text su trascrizioni e riassunti"""
+        print("\n🔎 RICERCA NELLE TRASCRIZIONI")
+        print("-" * 40)
+        query = input("🔤 Testo da cercare: ").strip()
+        if not query:
+            print("❌ Nessun testo inserito")
+            return
+        tone = input("🎭 Filtra per tono (INVIO per tutti): ").strip() or None
+        since = input("📅 Dal giorno YYYY-MM-DD (INVIO per sempre): ").strip() or None
+        
+        start_time = time.perf_counter()
+        hits = self.catalog.search(query, tone=tone, since=since, limit=10)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        
+        if not hits:
+            print(f"📂 Nessun risultato ({elapsed_ms:.1f} ms)")
+            return
+        
+        print(f"\n✅ {len(hits)} risultati in {elapsed_ms:.1f} ms:")
+        for i, hit in enumerate(hits, 1):
+            print(f"  {i}. {Path(hit['path']).name} - {hit['tone'] or 'N/A'} ({hit['created_at'][:16]})")
+            print(f"     {hit['snippet']}")
+    
+    def show_tone_stats(self):
+        """Distribuzione dei toni per ora o giorno"""
+        print("\n📈 STATISTICHE DEL TONO")
+        print("-" * 40)
+        granularity = input("🕐 Raggruppa per (g)iorno o (o)ra? [g]: ").strip().lower()
+        granularity = "hour" if granularity.startswith("o") else "day"
+        
+        timeline = self.catalog.tone_timeline(granularity)[-10:]  # Ultimi 10 bucket
+        if not timeline:
+            print("📂 Nessuna statistica disponibile (usa l'opzione 8 per ricostruire)")
+            return
+        
+        for bucket in timeline:
+            print(f"\n📅 {bucket['bucket']} - {bucket['total']} analisi")
+            for tone, info in bucket['tones'].items():
+                share = 100 * info['count'] / bucket['total']
+                bar = "█" * max(1, round(share / 5))
+                confidence = info['confidenza_media']
+                confidence_str = f", confidenza media {confidence:.0f}%" if confidence is not None else ""
+                intensity = " ".join(f"{k}:{v}" for k, v in info['intensità'].items() if v)
+                print(f"  {tone:<12} {bar} {info['count']} ({share:.0f}%{confidence_str}) {intensity}")
+    
+    def change_profile(self):
+        """Mostra e cambia il profilo di prestazioni senza riavviare"""
+        from src.config import PERFORMANCE_PROFILES
+        print(f"\n⚙️ PROFILO PRESTAZIONI (attivo: {Config.PERF_PROFILE})")
+        print("-" * 40)
+        for key, value in Config.profile_snapshot()["settings"].items():
+            print(f"  {key:<24} {value}")
+        print(f"\n📋 Profili: {', '.join(PERFORMANCE_PROFILES)}")
+        name = input("🔄 Profilo da attivare (INVIO per rileggere .env): ").strip() or None
+        try:
+            Config.apply_profile(name)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+        print(f"✅ Profilo attivo: {Config.PERF_PROFILE}")
+    
+    def show_client_stats(self):
+        """Utilizzo delle API key del pool nella sessione"""
+        rows = [row for row in pool_stats() if row['requests']]
+        if not rows:
+            return
+        print("\n🔑 Utilizzo API key:")
+        for row in rows:
+            latency = f"{row['avg_latency_ms']:.0f} ms" if row['avg_latency_ms'] is not None else "-"
+            status = f", esclusa per {row['ejected_for_s']:.0f}s" if row['ejected_for_s'] else ""
+            print(f"  {row['key']} ({row['model']}): {row['requests']} richieste, "
+                  f"{row['errors']} errori ({row['quota_errors']} quota), latenza media {latency}{status}")
+    
     async def test_complete(self):
         """Test completo: registra + analizza"""
         print("\n🧪 TEST COMPLETO - Registrazione + Analisi")
@@ -223,15 +353,7 @@ class VibeTalkingConsole:
     
     def get_latest_recording(self) -> str:
         """Ottieni l'ultimo file registrato"""
-        recordings_dir = Path("recordings")
-        if not recordings_dir.exists():
-            return ""
-        
-        audio_files = list(recordings_dir.glob("recording_*.wav"))
-        if not audio_files:
-            return ""
-        
-        return str(sorted(audio_files)[-1])
+        return self.catalog.latest_recording() or ""
     
     async def run(self):
         """Loop principale dell'applicazione"""
@@ -241,9 +363,10 @@ class VibeTalkingConsole:
             self.print_menu()
             
             try:
-                choice = input("👉 Scegli opzione (0-7): ").strip()
+                choice = input("👉 Scegli opzione (0-11): ").strip()
                 
                 if choice == "0":
+                    self.show_client_stats()
                     print("\n👋 Arrivederci!")
                     break
                 
@@ -272,6 +395,18 @@ class VibeTalkingConsole:
                 elif choice == "7":
                     await self.test_complete()
                 
+                elif choice == "8":
+                    self.rebuild_catalog()
+                
+                elif choice == "9":
+                    self.search_transcripts()
+                
+                elif choice == "10":
+                    self.show_tone_stats()
+                
+                elif choice == "11":
+                    self.change_profile()
+                
                 else:
                     print("❌ Opzione non valida")
                 
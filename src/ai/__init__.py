@@ -1,10 +1,12 @@
 from .analyzer import AudioAnalyzer
+from .engines import AnalyzerProtocol, create_analyzer, create_engine, register_engine
 
 # Prova a importare DataPizzaAudioAnalyzer
 try:
     from .datapizza_analyzer import DataPizzaAudioAnalyzer
     print("🔧 DataPizzaAudioAnalyzer disponibile")
-    __all__ = ['AudioAnalyzer', 'DataPizzaAudioAnalyzer']
+    __all__ = ['AudioAnalyzer', 'DataPizzaAudioAnalyzer', 'AnalyzerProtocol', 'create_analyzer',
+               'create_engine', 'register_engine']
 except ImportError as e:
     print(f"⚠️ DataPizzaAudioAnalyzer non disponibile: {e}")
-    __all__ = ['AudioAnalyzer']
+    __all__ = ['AudioAnalyzer', 'AnalyzerProtocol', 'create_analyzer', 'create_engine', 'register_engine']
@@ -1,18 +1,28 @@
 """
 Modulo per l'analisi AI dell'audio con trascrizione reale
+
+Analyzer senza datapizzai: i motori degli stadi vengono da ``chosen_engine``
+come per ``DataPizzaAudioAnalyzer``; dove la scelta è ``gemini`` (che qui non
+è disponibile) si usano Google Speech-to-Text (motore ``speech``) e i motori
+locali di ``engines``. Fallback, schema dei risultati, eventi e salvataggio
+sono quelli comuni di ``BaseAnalyzer``.
 """
-import asyncio
-import json
-import random
-import base64
-import certifi
-from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
+
 from ..config import Config
+from ..audio.wav_reader import audio_duration
+from ..utils.archive import open_recording_async
+from .deadline import Deadline, reset_deadline, set_deadline
+from .engines import BaseAnalyzer, LOCAL_ENGINES, chosen_engine, create_engine, demo_transcription, engine_names
+from .events import MediaPrepared, StageEvent, SummaryReady, ToneReady, TranscriptReady
+
 
-class AudioAnalyzer:
+class AudioAnalyzer(BaseAnalyzer):
     """Classe per l'analisi dell'audio con AI"""
     
+    ANALYZER_NAME = "speech-to-text"
+    RESULTS_PREFIX = "analysis"
+    
     def __init__(self):
         # Controlla se abbiamo l'API key per la trascrizione reale
         if Config.GOOGLE_API_KEY:
@@ -21,191 +31,59 @@ class AudioAnalyzer:
         else:
             self.demo_mode = True
             print("🔧 Modalità demo attiva - trascrizione simulata")
-        
-    async def transcribe_audio(self, audio_file_path: str) -> Optional[str]:
-        """Trascrivi un file audio in testo"""
+        self.transcription_engine = self._engine("transcription", "demo" if self.demo_mode else "speech")
+        self.tone_engine = self._engine("tone", LOCAL_ENGINES["tone"])
+        self.summary_engine = self._engine("summary", LOCAL_ENGINES["summary"])
+    
+    def _engine(self, stage: str, default: str) -> Any:
+        """Motore scelto per lo stadio, oppure ``default`` se la scelta qui non è eseguibile"""
+        name = chosen_engine(stage)
+        if name == "gemini" or (self.demo_mode and name == "speech"):
+            name = default
+        elif name not in engine_names(stage):
+            print(f"⚠️ Motore '{name}' non disponibile per {stage}, uso '{default}'")
+            name = default
+        return create_engine(stage, name)
+    
+    async def _transcribe(self, audio_file_path: str) -> Tuple[Optional[str], bool]:
+        """(trascrizione, valida)"""
         try:
             print("🔄 Avvio trascrizione...")
-            
-            if self.demo_mode:
-                # Modalità demo - trascrizione simulata
-                await asyncio.sleep(2)  # Simula il tempo di processing
-                
-                duration = self._get_audio_duration(audio_file_path)
-                
-                if duration < 10:
-                    transcription = "Ciao, questo è un test di registrazione breve. Sto testando l'applicazione VibeTalking per vedere come funziona l'analisi del tono."
-                elif duration < 30:
-                    transcription = "Salve, questa è una registrazione di media durata. Sto parlando con un tono abbastanza neutrale per testare le funzionalità dell'applicazione. Mi sembra che tutto stia funzionando correttamente e sono soddisfatto dei risultati."
-                else:
-                    transcription = "Buongiorno, questa è una registrazione più lunga per testare le capacità dell'applicazione VibeTalking. Sto cercando di variare il mio tono di voce per vedere come l'intelligenza artificiale riesce a rilevare le diverse emozioni. Sono molto entusiasta di questo progetto e penso che possa essere davvero utile per analizzare le conversazioni e migliorare la comunicazione."
-            else:
-                # Modalità completa - trascrizione reale con Google Speech-to-Text
-                transcription = await self._transcribe_with_google_api(audio_file_path)
-                
-                # Se la trascrizione reale fallisce, usa quella simulata come fallback
-                if not transcription:
-                    print("⚠️ Trascrizione reale fallita, uso modalità demo come fallback")
-                    duration = self._get_audio_duration(audio_file_path)
-                    
-                    if duration < 10:
-                        transcription = "Ciao, questo è un test di registrazione breve. Sto testando l'applicazione VibeTalking per vedere come funziona l'analisi del tono."
-                    elif duration < 30:
-                        transcription = "Salve, questa è una registrazione di media durata. Sto parlando con un tono abbastanza neutrale per testare le funzionalità dell'applicazione. Mi sembra che tutto stia funzionando correttamente e sono soddisfatto dei risultati."
-                    else:
-                        transcription = "Buongiorno, questa è una registrazione più lunga per testare le capacità dell'applicazione VibeTalking. Sto cercando di variare il mio tono di voce per vedere come l'intelligenza artificiale riesce a rilevare le diverse emozioni. Sono molto entusiasta di questo progetto e penso che possa essere davvero utile per analizzare le conversazioni e migliorare la comunicazione."
+            transcription, valid = await self.transcription_engine.transcribe(audio_file_path)
+            if not valid:
+                print("⚠️ Trascrizione reale fallita, uso modalità demo come fallback")
             
             if transcription:
                 print(f"✅ Trascrizione completata: {len(transcription)} caratteri")
-                return transcription
+                return transcription, valid
             else:
                 print("❌ Nessun testo trascritto")
-                return None
-                
+                return None, False
+        
         except Exception as e:
             print(f"⚠️ Trascrizione non disponibile, uso fallback: {e}")
-            return None
-    
-    def _get_audio_duration(self, audio_file_path: str) -> float:
-        """Ottiene la durata del file audio"""
-        try:
-            import wave
-            with wave.open(audio_file_path, 'rb') as audio_file:
-                frames = audio_file.getnframes()
-                sample_rate = audio_file.getframerate()
-                duration = frames / float(sample_rate)
-                return duration
-        except:
-            return 15.0  # Durata di default
+            return demo_transcription(self._get_audio_duration(audio_file_path)), False
     
-    async def _transcribe_with_google_api(self, audio_file_path: str) -> Optional[str]:
-        """Trascrizione reale usando Google Speech-to-Text API"""
-        try:
-            import requests
-            from requests.exceptions import SSLError, RequestException
-            
-            # Leggi il file audio
-            with open(audio_file_path, 'rb') as audio_file:
-                audio_content = audio_file.read()
-            
-            # Codifica in base64
-            audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-            
-            # Prepara la richiesta per Google Speech-to-Text API
-            url = f"https://speech.googleapis.com/v1/speech:recognize?key={Config.GOOGLE_API_KEY}"
-            
-            payload = {
-                "config": {
-                    "encoding": "LINEAR16",
-                    "sampleRateHertz": Config.SAMPLE_RATE,
-                    "languageCode": "it-IT",  # Italiano
-                    "enableAutomaticPunctuation": True,
-                    "model": "latest_long"  # Modello ottimizzato per audio lunghi
-                },
-                "audio": {
-                    "content": audio_base64
-                }
-            }
-            
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            # Esegui la richiesta in modo asincrono
-            response = await asyncio.to_thread(
-                requests.post,
-                url,
-                json=payload,
-                headers=headers,
-                timeout=(10, 60),
-                verify=certifi.where(),
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                if 'results' in result and len(result['results']) > 0:
-                    # Combina tutte le trascrizioni
-                    transcriptions = []
-                    for res in result['results']:
-                        if 'alternatives' in res and len(res['alternatives']) > 0:
-                            transcriptions.append(res['alternatives'][0]['transcript'])
-                    
-                    return ' '.join(transcriptions)
-                else:
-                    print("⚠️ Nessuna trascrizione trovata nell'audio")
-                    return None
-            else:
-                print(f"⚠️ Google Speech-to-Text non disponibile ({response.status_code}). Uso fallback.")
-                return None
-                
-        except ImportError:
-            print("❌ Libreria 'requests' non trovata. Installa con: uv pip install requests")
-            return None
-        except SSLError as e:
-            print("⚠️ Problema SSL con Google Speech-to-Text. Uso fallback.")
-            return None
-        except RequestException as e:
-            print(f"⚠️ Errore di rete con Google Speech-to-Text. Uso fallback.")
-            return None
-        except Exception as e:
-            print(f"⚠️ Errore inatteso con Google Speech-to-Text. Uso fallback.")
-            # Prova con un servizio alternativo
-            return await self._transcribe_with_alternative_service(audio_file_path)
+    async def transcribe_audio(self, audio_file_path: str) -> Optional[str]:
+        """Trascrivi un file audio in testo"""
+        transcription, _ = await self._transcribe(audio_file_path)
+        return transcription
     
-    async def _transcribe_with_alternative_service(self, audio_file_path: str) -> Optional[str]:
-        """Trascrizione alternativa usando servizi gratuiti o locali"""
-        try:
-            print("🔄 Tentativo trascrizione con servizio alternativo...")
-            
-            # Qui potresti integrare altri servizi come:
-            # - OpenAI Whisper (locale)
-            # - AssemblyAI (gratuito con limiti)
-            # - Wit.ai di Facebook
-            # - Azure Speech Services
-            
-            # Per ora, ritorniamo None per usare il fallback
-            print("⚠️ Servizi alternativi non configurati")
-            return None
-            
-        except Exception as e:
-            print(f"❌ Errore nel servizio alternativo: {e}")
-            return None
+    def _get_audio_duration(self, audio_file_path: str) -> float:
+        """Ottiene la durata del file audio (solo header)"""
+        return audio_duration(audio_file_path, default=15.0)  # Durata di default
     
     async def analyze_tone(self, text: str) -> Optional[Dict]:
         """Analizza il tono del testo trascritto"""
         if not text:
             return None
-            
+        
         try:
             print("🔄 Avvio analisi del tono...")
-            
-            # Prompt per l'analisi del tono
-            prompt = f"""
-            Analizza il tono e l'emozione del seguente testo trascritto da audio.
-            
-            Testo: "{text}"
-            
-            Fornisci un'analisi strutturata in formato JSON con:
-            1. tono_principale: (entusiasta, neutrale, preoccupato, arrabbiato, felice, triste, calmo, eccitato)
-            2. intensità: (bassa, media, alta) 
-            3. confidenza: (percentuale da 0 a 100)
-            4. emozioni_secondarie: (lista di emozioni aggiuntive rilevate)
-            5. descrizione: (breve descrizione del tono rilevato)
-            6. suggerimenti: (consigli per migliorare la comunicazione)
-            
-            Rispondi SOLO con il JSON, senza altro testo.
-            """
-            
-            # Simulazione analisi del tono basata sul contenuto del testo
-            await asyncio.sleep(1)  # Simula il tempo di processing
-            
-            # Analisi semplificata basata su parole chiave
-            tone_analysis = self._analyze_tone_keywords(text)
-            
+            tone_analysis, _ = await self.tone_engine.analyze(text)
             print("✅ Analisi del tono completata")
             return tone_analysis
-                
+        
         except Exception as e:
             print(f"⚠️ Analisi del tono non disponibile: {e}")
             return None
@@ -214,27 +92,10 @@ class AudioAnalyzer:
         """Genera un riassunto del testo trascritto"""
         if not text:
             return None
-            
+        
         try:
             print("🔄 Generazione riassunto...")
-            
-            prompt = f"""
-            Crea un riassunto conciso e ben strutturato del seguente testo trascritto da audio.
-            
-            Testo: "{text}"
-            
-            Il riassunto deve:
-            - Essere lungo massimo 3-4 frasi
-            - Catturare i punti principali
-            - Essere scritto in italiano
-            - Essere chiaro e professionale
-            """
-            
-            # Simulazione riassunto
-            await asyncio.sleep(1)  # Simula il tempo di processing
-            
-            # Genera un riassunto semplificato
-            summary = self._generate_simple_summary(text)
+            summary, _ = await self.summary_engine.summarize(text)
             
             if summary:
                 print("✅ Riassunto generato")
@@ -242,155 +103,58 @@ class AudioAnalyzer:
             else:
                 print("❌ Impossibile generare il riassunto")
                 return None
-                
+        
         except Exception as e:
             print(f"⚠️ Riassunto non disponibile: {e}")
             return None
     
-    async def full_analysis(self, audio_file_path: str) -> Dict:
-        """Esegue l'analisi completa di un file audio"""
+    async def analyze_audio_file(self, audio_file_path: str,
+                                 on_event: Optional[Callable[[StageEvent], None]] = None,
+                                 deadline_s: Optional[float] = None, **_: object) -> Dict:
+        """Interfaccia comune degli analyzer (``engines.AnalyzerProtocol``)"""
+        return await self.full_analysis(audio_file_path, deadline_s, on_event)
+    
+    async def full_analysis(self, audio_file_path: str, deadline_s: Optional[float] = None,
+                            on_event: Optional[Callable[[StageEvent], None]] = None) -> Dict:
+        """Esegue l'analisi completa di un file audio entro ``deadline_s`` (default da Config)"""
+        deadline = Deadline(deadline_s)
+        token = set_deadline(deadline)
+        try:
+            async with open_recording_async(audio_file_path):
+                results = await self._full_analysis(audio_file_path, on_event)
+        finally:
+            reset_deadline(token)
+        results["deadline"] = deadline.snapshot()
+        return results
+    
+    async def _full_analysis(self, audio_file_path: str,
+                             on_event: Optional[Callable[[StageEvent], None]] = None) -> Dict:
         print(f"🎯 Avvio analisi completa di: {audio_file_path}")
-        
-        results = {
-            "file_path": audio_file_path,
-            "transcription": None,
-            "tone_analysis": None,
-            "summary": None,
-            "timestamp": None
-        }
+        emit = self._emitter(audio_file_path, on_event)
+        stages = {"media": "computed"}
+        emit(MediaPrepared, duration_s=audio_duration(audio_file_path), status=stages["media"])
         
         # Trascrizione
-        transcription = await self.transcribe_audio(audio_file_path)
-        results["transcription"] = transcription
+        transcription, valid = await self._transcribe(audio_file_path)
+        stages["transcription"] = "computed" if valid else "fallback"
+        emit(TranscriptReady, transcription=transcription or "", status=stages["transcription"])
+        tone_analysis = summary = None
         
         if transcription:
             # Analisi del tono
             if Config.TONE_ANALYSIS_ENABLED:
                 tone_analysis = await self.analyze_tone(transcription)
-                results["tone_analysis"] = tone_analysis
             
             # Riassunto
             summary = await self.generate_summary(transcription)
-            results["summary"] = summary
         
-        # Timestamp
-        from datetime import datetime
-        results["timestamp"] = datetime.now().isoformat()
+        stages["tone"] = "computed" if tone_analysis else "fallback"
+        emit(ToneReady, tone_analysis=tone_analysis or {}, tone_timeline=[], status=stages["tone"])
+        stages["summary"] = "computed" if summary else "fallback"
+        emit(SummaryReady, summary=summary or "", status=stages["summary"])
         
+        engines = {"transcription": self.transcription_engine.name, "tone": self.tone_engine.name,
+                   "summary": self.summary_engine.name}
         print("🎉 Analisi completa terminata")
-        return results
-    
-    def save_analysis_results(self, results: Dict, output_file: Optional[str] = None) -> str:
-        """Salva i risultati dell'analisi in un file JSON"""
-        import json
-        from datetime import datetime
-        
-        if not output_file:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = Config.OUTPUT_DIR / f"analysis_{timestamp}.json"
-        
-        try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
-            
-            print(f"💾 Risultati salvati in: {output_file}")
-            return str(output_file)
-            
-        except Exception as e:
-            print(f"❌ Errore nel salvataggio: {e}")
-            return ""
-    
-    def _analyze_tone_keywords(self, text: str) -> Dict:
-        """Analizza il tono basandosi su parole chiave"""
-        text_lower = text.lower()
-        
-        # Dizionari di parole chiave per diversi toni
-        tone_keywords = {
-            "entusiasta": ["fantastico", "eccellente", "meraviglioso", "entusiasta", "incredibile", "straordinario"],
-            "felice": ["felice", "contento", "soddisfatto", "allegro", "gioioso", "bene"],
-            "calmo": ["tranquillo", "calmo", "rilassato", "sereno", "pacifico", "neutrale"],
-            "preoccupato": ["preoccupato", "ansioso", "nervoso", "dubbioso", "incerto", "problema"],
-            "arrabbiato": ["arrabbiato", "furioso", "irritato", "infastidito", "sbagliato", "errore"],
-            "triste": ["triste", "deluso", "sconfortato", "male", "difficile", "peccato"],
-            "eccitato": ["eccitato", "emozionante", "incredibile", "wow", "fantastico", "stupendo"]
-        }
-        
-        # Conta le occorrenze per ogni tono
-        tone_scores = {}
-        for tone, keywords in tone_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in text_lower)
-            tone_scores[tone] = score
-        
-        # Trova il tono dominante
-        if max(tone_scores.values()) == 0:
-            main_tone = "neutrale"
-            intensity = "media"
-            confidence = 60
-        else:
-            main_tone = max(tone_scores, key=tone_scores.get)
-            max_score = tone_scores[main_tone]
-            
-            # Calcola intensità e confidenza basate sul punteggio
-            if max_score >= 3:
-                intensity = "alta"
-                confidence = 85
-            elif max_score >= 2:
-                intensity = "media"
-                confidence = 75
-            else:
-                intensity = "bassa"
-                confidence = 65
-        
-        # Trova emozioni secondarie
-        secondary_emotions = [tone for tone, score in tone_scores.items() 
-                            if score > 0 and tone != main_tone][:2]
-        
-        # Genera descrizione e suggerimenti
-        descriptions = {
-            "entusiasta": "Il parlante mostra grande entusiasmo e energia positiva",
-            "felice": "Il tono è positivo e soddisfatto",
-            "calmo": "Il parlante mantiene un tono equilibrato e sereno",
-            "preoccupato": "Si percepisce una certa preoccupazione o ansia",
-            "arrabbiato": "Il tono indica frustrazione o irritazione",
-            "triste": "Il parlante sembra deluso o sconfortato",
-            "eccitato": "Grande eccitazione ed energia nel discorso",
-            "neutrale": "Tono equilibrato senza particolari emozioni"
-        }
-        
-        suggestions = {
-            "entusiasta": ["Mantieni questa energia positiva", "Condividi il tuo entusiasmo con gli altri"],
-            "felice": ["Continua con questo atteggiamento positivo", "La tua soddisfazione è contagiosa"],
-            "calmo": ["Ottimo controllo emotivo", "La calma aiuta la comunicazione"],
-            "preoccupato": ["Cerca di identificare le cause della preoccupazione", "Respira profondamente"],
-            "arrabbiato": ["Prova a fare una pausa", "Considera il punto di vista degli altri"],
-            "triste": ["È normale sentirsi così a volte", "Cerca supporto se necessario"],
-            "eccitato": ["Canalizza questa energia in modo produttivo", "Condividi il tuo entusiasmo"],
-            "neutrale": ["Considera di aggiungere più espressività", "Va bene essere equilibrati"]
-        }
-        
-        return {
-            "tono_principale": main_tone,
-            "intensità": intensity,
-            "confidenza": confidence,
-            "emozioni_secondarie": secondary_emotions,
-            "descrizione": descriptions.get(main_tone, "Tono non identificato"),
-            "suggerimenti": suggestions.get(main_tone, ["Continua così"])
-        }
-    
-    def _generate_simple_summary(self, text: str) -> str:
-        """Genera un riassunto semplificato del testo"""
-        sentences = text.split('.')
-        
-        # Prendi le prime 2-3 frasi più significative
-        if len(sentences) <= 2:
-            return text
-        elif len(sentences) <= 4:
-            return '. '.join(sentences[:2]) + '.'
-        else:
-            # Prendi la prima, una del mezzo e l'ultima
-            summary_sentences = [
-                sentences[0],
-                sentences[len(sentences)//2],
-                sentences[-2] if sentences[-1].strip() == '' else sentences[-1]
-            ]
-            return '. '.join(s.strip() for s in summary_sentences if s.strip()) + '.'
+        return self._build_results(audio_file_path, transcription, tone_analysis, summary,
+                                   stages=stages, engines=engines)
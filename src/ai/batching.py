@@ -0,0 +1,208 @@
+"""
+Micro-batching delle richieste a Gemini per le registrazioni brevi
+
+Per una nota vocale di pochi secondi il costo di una richiesta (round-trip,
+handshake, token del prompt) supera quello del contenuto, e ogni
+registrazione ne fa tre. ``MicroBatcher`` raccoglie le richieste di uno
+stadio che arrivano entro ``BATCH_MAX_WAIT_MS`` (al più ``BATCH_MAX_SIZE``)
+e le invia come *una* richiesta multi-parte: gli audio (o i testi) sono
+numerati e il modello risponde con un array JSON che ha un elemento per
+``id``. La risposta viene poi divisa tra le registrazioni.
+
+Un elemento mancante o non valido nella risposta, un errore della richiesta
+o un gruppo di un solo elemento restituiscono None: il motore ripete allora
+la richiesta singola, quindi il raggruppamento non cambia mai il risultato
+in peggio. Con ``BATCH_MAX_SIZE=1`` (profilo ``interactive``) è spento.
+
+I batcher vivono nell'event loop che li usa: ogni ``asyncio.run`` ha i suoi.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+from datapizzai.memory import Memory
+from datapizzai.type import ROLE, TextBlock
+
+from ..config import Config
+from .deadline import run_model_call
+
+TRANSCRIPTION_PROMPT = """
+            Trascrivi in italiano ciascuno dei {n} audio allegati, indicati come "Audio <id>".
+            Rispondi SOLO con un array JSON di oggetti, id da 1 a {n}:
+            [{{"id": 1, "testo": "..."}}, ...]
+            con il solo testo trascritto, senza commenti aggiuntivi.
+            """
+
+TONE_PROMPT = """
+            Analizza il tono e l'emozione di ciascuno dei seguenti {n} testi trascritti da audio.
+
+            {items}
+
+            Rispondi SOLO con un array JSON di oggetti, id da 1 a {n}, ciascuno con:
+            id, tono_principale (entusiasta, neutrale, preoccupato, arrabbiato, felice, triste, calmo,
+            eccitato), intensità (bassa, media, alta), confidenza (da 0 a 100), emozioni_secondarie
+            (lista), descrizione (breve) e suggerimenti (lista di consigli per la comunicazione).
+            """
+
+SUMMARY_PROMPT = """
+            Crea un riassunto conciso (massimo 2-3 frasi, in italiano, chiaro e diretto) di ciascuno
+            dei seguenti {n} testi trascritti da audio.
+
+            {items}
+
+            Rispondi SOLO con un array JSON di oggetti, id da 1 a {n}:
+            [{{"id": 1, "riassunto": "..."}}, ...]
+            """
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def _numbered(texts: List[str]) -> str:
+    return "\n".join(f'[{i}] "{text}"' for i, text in enumerate(texts, 1))
+
+
+def build_request(stage: str, payloads: List[Any]) -> Tuple[str, Optional[Memory]]:
+    """Prompt (e memoria con gli audio) della richiesta raggruppata"""
+    n = len(payloads)
+    if stage == "transcription":
+        memory = Memory()
+        blocks: List[Any] = []
+        for i, media_block in enumerate(payloads, 1):
+            blocks += [TextBlock(content=f"Audio {i}:"), media_block]
+        memory.add_turn(blocks, ROLE.USER)
+        return TRANSCRIPTION_PROMPT.format(n=n), memory
+    prompt = TONE_PROMPT if stage == "tone" else SUMMARY_PROMPT
+    return prompt.format(n=n, items=_numbered(payloads)), None
+
+
+def split_response(stage: str, response: Any, n: int) -> List[Optional[Any]]:
+    """Risultato per elemento (None dove la risposta non lo contiene)"""
+    outputs: List[Optional[Any]] = [None] * n
+    if not response.content or not isinstance(response.content[0], TextBlock):
+        return outputs
+    try:
+        items = json.loads(_FENCE_RE.sub("", response.content[0].content.strip()))
+    except json.JSONDecodeError:
+        return outputs
+    if not isinstance(items, list):
+        return outputs
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.pop("id")) - 1
+        except (KeyError, TypeError, ValueError):
+            continue
+        if not 0 <= index < n:
+            continue
+        if stage == "tone":
+            outputs[index] = item if "tono_principale" in item else None
+        else:
+            value = item.get("testo" if stage == "transcription" else "riassunto")
+            outputs[index] = value.strip() if isinstance(value, str) and value.strip() else None
+    return outputs
+
+
+class MicroBatcher:
+    """Raggruppa le richieste di uno stadio verso un modello"""
+
+    def __init__(self, stage: str, client: Any, max_size: int, max_wait_ms: float) -> None:
+        self.stage = stage
+        self.client = client
+        self.max_size = max_size
+        self.max_wait_ms = max_wait_ms
+        self.stats = {"requests": 0, "items": 0, "split_misses": 0, "errors": 0}
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    async def submit(self, payload: Any) -> Optional[Any]:
+        """Risultato dell'elemento, o None se va richiesto da solo"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((payload, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Gli elementi abbandonati (es. scadenza dello stadio) non vengono inviati
+        batch = [(payload, future) for payload, future in self._pending if not future.done()]
+        self._pending = []
+        if len(batch) == 1:
+            batch[0][1].set_result(None)
+        elif batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        prompt, memory = build_request(self.stage, [payload for payload, _ in batch])
+        started = time.perf_counter()
+        try:
+            if memory is None:
+                response = await run_model_call(self.client.invoke, input=prompt,
+                                                timeout=Config.HTTP_TIMEOUT_SECONDS)
+            else:
+                response = await run_model_call(self.client.invoke, input=prompt, memory=memory,
+                                                timeout=Config.HTTP_TIMEOUT_SECONDS)
+            outputs = split_response(self.stage, response, len(batch))
+        except Exception as e:
+            print(f"⚠️ Richiesta raggruppata ({self.stage}, {len(batch)} elementi) non riuscita: {e}")
+            self.stats["errors"] += 1
+            outputs = [None] * len(batch)
+        self.stats["requests"] += 1
+        self.stats["items"] += len(batch)
+        self.stats["split_misses"] += sum(1 for output in outputs if output is None)
+        print(f"📦 {self.stage}: {len(batch)} registrazioni in una richiesta "
+              f"({1000 * (time.perf_counter() - started):.0f} ms)")
+        for (_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
+
+
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], MicroBatcher]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def batching_enabled() -> bool:
+    return Config.BATCH_MAX_SIZE > 1
+
+
+def get_batcher(stage: str, model: str, client: Any) -> Optional[MicroBatcher]:
+    """Batcher di (stadio, modello) nell'event loop corrente; None se spento"""
+    if not batching_enabled() or client is None:
+        return None
+    by_key = _batchers.setdefault(asyncio.get_running_loop(), {})
+    batcher = by_key.get((stage, model))
+    if batcher is None:
+        batcher = by_key[(stage, model)] = MicroBatcher(stage, client, Config.BATCH_MAX_SIZE,
+                                                        Config.BATCH_MAX_WAIT_MS)
+    # Il profilo può cambiare a runtime
+    batcher.max_size, batcher.max_wait_ms = Config.BATCH_MAX_SIZE, Config.BATCH_MAX_WAIT_MS
+    return batcher
+
+
+def reset_batch_stats() -> None:
+    for by_key in list(_batchers.values()):
+        for batcher in by_key.values():
+            batcher.stats = {key: 0 for key in batcher.stats}
+
+
+def batch_stats() -> Dict[str, Dict[str, int]]:
+    """Richieste ed elementi raggruppati per stadio:modello (loop corrente)"""
+    try:
+        by_key = _batchers.get(asyncio.get_running_loop(), {})
+    except RuntimeError:
+        return {}
+    return {f"{stage}:{model}": dict(b.stats) for (stage, model), b in by_key.items()}
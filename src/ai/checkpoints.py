@@ -0,0 +1,141 @@
+"""
+Checkpoint degli stadi di analisi
+
+Ogni stadio di ``DataPizzaAudioAnalyzer.analyze_audio_file`` (preparazione del
+MediaBlock, trascrizione, tono, riassunto) salva il proprio output sotto una
+chiave che è l'hash dei suoi ingressi e della sua configurazione:
+
+- media:         digest SHA-256 del file audio
+- trascrizione:  chiave media + prompt + modello + temperatura
+- tono/riassunto: testo trascritto + prompt + modello + temperatura
+
+Cambiare il prompt del tono invalida quindi solo lo stadio del tono: una nuova
+analisi riusa la trascrizione (la chiamata costosa) e ripete le sole chiamate
+testuali. Il digest dei file è memorizzato per (percorso, dimensione, mtime)
+per non rileggere l'audio a ogni analisi. Con ``CHECKPOINT_MAX_ENTRIES`` si
+conservano solo gli output più recenti.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+from ..config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_digests (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest   TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS stage_outputs (
+    key        TEXT PRIMARY KEY,
+    stage      TEXT NOT NULL,
+    audio_path TEXT,
+    output     TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stage_outputs_audio ON stage_outputs(audio_path);
+"""
+
+STAGES = ("media", "transcription", "tone", "summary")
+
+
+def stage_key(stage: str, *parts: Any) -> str:
+    """Fingerprint di uno stadio a partire dai suoi ingressi e dalla configurazione"""
+    payload = json.dumps([stage, *parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageCheckpointStore:
+    """Output degli stadi indicizzati per fingerprint, su SQLite"""
+
+    def __init__(self, db_path: Optional[Path] = None) -> None:
+        self.db_path = Path(db_path or Config.CHECKPOINT_DB)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if Config.SQLITE_CACHE_KB:
+            self.conn.execute(f"PRAGMA cache_size=-{Config.SQLITE_CACHE_KB}")
+        self.conn.executescript(SCHEMA)
+        self._puts = 0
+
+    def file_digest(self, path: str) -> str:
+        """SHA-256 del file, ricalcolato solo se dimensione o mtime cambiano"""
+        path = str(Path(path))
+        st = os.stat(path)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT digest FROM file_digests WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        if row:
+            return row[0]
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_digests (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, digest),
+            )
+        return digest
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self.conn.execute("SELECT output FROM stage_outputs WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, stage: str, output: Any, audio_path: Optional[str] = None) -> None:
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO stage_outputs (key, stage, audio_path, output, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, stage, audio_path, json.dumps(output, ensure_ascii=False),
+                 datetime.now().isoformat()),
+            )
+            self._puts += 1
+            if Config.CHECKPOINT_MAX_ENTRIES and self._puts % 100 == 1:
+                self._prune(Config.CHECKPOINT_MAX_ENTRIES)
+
+    def _prune(self, max_entries: int) -> None:
+        """Tiene solo gli output più recenti (da chiamare con il lock)"""
+        self.conn.execute(
+            "DELETE FROM stage_outputs WHERE key IN (SELECT key FROM stage_outputs "
+            "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (max_entries,),
+        )
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self.conn.execute("SELECT stage, COUNT(*) FROM stage_outputs GROUP BY stage").fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+_store: Optional[StageCheckpointStore] = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> StageCheckpointStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StageCheckpointStore()
+        return _store
@@ -0,0 +1,269 @@
+"""
+Pool di client Gemini su più credenziali
+
+Con una sola API key il throughput è limitato dalla quota di un progetto.
+``ClientPool`` tiene un ``GoogleClient`` per ogni chiave configurata
+(``GOOGLE_API_KEYS="chiave1,chiave2:3"``, il numero dopo ``:`` è il peso) ed
+espone lo stesso ``invoke`` del client singolo, quindi i componenti della
+pipeline non cambiano.
+
+- Dispatch ``least_loaded`` (richieste in corso / peso, default) oppure
+  ``round_robin`` pesato (smooth WRR).
+- Una chiave che risponde con un errore di quota (429, RESOURCE_EXHAUSTED)
+  viene esclusa per ``CLIENT_POOL_EJECT_SECONDS``, con backoff esponenziale se
+  l'errore si ripete, e la richiesta viene ritentata su un'altra chiave.
+- Con ``MODEL_MAX_RPM`` le richieste al modello vengono distanziate per non
+  superare quel numero al minuto (letto a ogni chiamata, segue il profilo).
+- ``invoke(..., timeout=)`` inoltra il timeout al client solo se il suo
+  ``invoke`` ha un parametro ``timeout``; altrimenti la chiamata resta
+  limitata solo dalla scadenza dello stadio (vedi ``deadline``).
+- ``stats()`` riporta per chiave richieste, errori, latenza media e stato.
+- ``warm_up()`` inizializza ogni client con una richiesta minima (vedi
+  ``warmup``), fuori dalle statistiche ma dentro il limite di frequenza: un
+  ping che dovrebbe attendere uno slot viene saltato, e un errore di quota
+  esclude la chiave come per le richieste normali.
+"""
+from __future__ import annotations
+
+import inspect
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from datapizzai.clients.google_client import GoogleClient
+
+from ..config import Config
+
+QUOTA_MARKERS = ("429", "resource_exhausted", "resource exhausted", "quota", "rate limit")
+
+# Costruttore dei client per chiave; sostituibile (es. dal generatore di carico)
+_client_factory: Optional[Callable[..., Any]] = None
+
+
+def parse_keys(spec: Optional[str], fallback: Optional[str] = None) -> List[Tuple[str, int]]:
+    """``"k1,k2:3"`` → ``[("k1", 1), ("k2", 3)]``; senza elenco usa la chiave singola"""
+    keys: List[Tuple[str, int]] = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, weight = item.partition(":")
+        keys.append((key.strip(), max(1, int(weight)) if weight.strip().isdigit() else 1))
+    if not keys and fallback:
+        keys.append((fallback, 1))
+    return keys
+
+
+def accepts_timeout(client: Any) -> bool:
+    """True se ``client.invoke`` accetta un parametro ``timeout``"""
+    try:
+        return "timeout" in inspect.signature(client.invoke).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def is_quota_error(error: Exception) -> bool:
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in QUOTA_MARKERS)
+
+
+class _Member:
+    """Una credenziale del pool con i suoi contatori"""
+
+    def __init__(self, label: str, client: GoogleClient, weight: int) -> None:
+        self.label = label
+        self.client = client
+        self.timeout_supported = accepts_timeout(client)
+        self.weight = weight
+        self.in_flight = 0
+        self.current_weight = 0      # per lo smooth WRR
+        self.requests = 0
+        self.errors = 0
+        self.quota_errors = 0
+        self.latency_total = 0.0
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class ClientPool:
+    """Client con la stessa interfaccia di ``GoogleClient``, distribuito su più chiavi"""
+
+    def __init__(self, model: str, temperature: float,
+                 keys: Optional[List[Tuple[str, int]]] = None,
+                 strategy: Optional[str] = None,
+                 client_factory: Optional[Callable[..., Any]] = None) -> None:
+        keys = keys if keys is not None else parse_keys(Config.GOOGLE_API_KEYS, Config.GOOGLE_API_KEY)
+        if not keys:
+            raise ValueError("nessuna API key configurata")
+        self.model = model
+        self.strategy = strategy or Config.CLIENT_POOL_STRATEGY
+        if self.strategy not in ("least_loaded", "round_robin"):
+            raise ValueError(f"strategia non valida: {self.strategy}")
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        factory = client_factory or _client_factory or GoogleClient
+        self.members = [
+            _Member(f"key{i + 1}…{key[-4:]}", factory(api_key=key, model=model, temperature=temperature), weight)
+            for i, (key, weight) in enumerate(keys)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    # -- Selezione ---------------------------------------------------------
+
+    def _pick(self, exclude: set) -> _Member:
+        now = time.monotonic()
+        candidates = [m for m in self.members if m not in exclude and m.available(now)]
+        if not candidates:
+            # Tutte escluse: prova quella che rientra prima invece di fallire subito
+            remaining = [m for m in self.members if m not in exclude] or self.members
+            candidates = [min(remaining, key=lambda m: m.ejected_until)]
+
+        if self.strategy == "round_robin":
+            total = sum(m.weight for m in candidates)
+            for m in candidates:
+                m.current_weight += m.weight
+            chosen = max(candidates, key=lambda m: m.current_weight)
+            chosen.current_weight -= total
+        else:
+            chosen = min(candidates, key=lambda m: (m.in_flight / m.weight, m.requests / m.weight))
+        chosen.in_flight += 1
+        return chosen
+
+    def _eject(self, member: _Member) -> None:
+        # Backoff esponenziale sulle esclusioni ripetute, al massimo 16×
+        member.ejections += 1
+        seconds = Config.CLIENT_POOL_EJECT_SECONDS * 2 ** min(member.ejections - 1, 4)
+        member.ejected_until = time.monotonic() + seconds
+        print(f"⏸️ Chiave {member.label} esclusa per {seconds:.0f}s (quota esaurita)")
+
+    def _throttle(self, wait: bool = True) -> bool:
+        """Prenota il prossimo slot se c'è un limite di richieste al minuto
+
+        Con ``wait=False`` non attende: restituisce False (senza prenotare)
+        se lo slot non è libero subito.
+        """
+        rpm = Config.MODEL_MAX_RPM
+        if not rpm:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            if slot > now and not wait:
+                return False
+            self._next_slot = slot + 60.0 / rpm
+        if slot > now:
+            time.sleep(slot - now)
+        return True
+
+    # -- Interfaccia del client --------------------------------------------
+
+    def invoke(self, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        self._throttle()
+        tried: set = set()
+        last_error: Optional[Exception] = None
+        for _ in range(len(self.members)):
+            with self._lock:
+                member = self._pick(tried)
+            tried.add(member)
+            started = time.perf_counter()
+            try:
+                if timeout is not None and member.timeout_supported:
+                    response = member.client.invoke(*args, timeout=timeout, **kwargs)
+                else:
+                    response = member.client.invoke(*args, **kwargs)
+            except Exception as e:
+                with self._lock:
+                    member.in_flight -= 1
+                    member.requests += 1
+                    member.errors += 1
+                    if is_quota_error(e):
+                        member.quota_errors += 1
+                        self._eject(member)
+                        last_error = e
+                        continue
+                raise
+            with self._lock:
+                member.in_flight -= 1
+                member.requests += 1
+                member.latency_total += time.perf_counter() - started
+                member.ejections = 0
+            return response
+        raise last_error
+
+    def warm_up(self, prompt: str) -> List[Dict]:
+        """Una richiesta minima per chiave; latenza in ms o errore per ciascuna
+
+        Le chiavi escluse e quelle per cui il limite di frequenza non ha uno
+        slot libero vengono saltate: il ping non deve togliere quota all'analisi.
+        """
+        timings = []
+        for member in self.members:
+            if not member.available(time.monotonic()):
+                continue
+            if not self._throttle(wait=False):
+                timings.append({"key": member.label, "ms": None, "skipped": "rpm"})
+                continue
+            started = time.perf_counter()
+            try:
+                member.client.invoke(input=prompt)
+            except Exception as e:
+                if is_quota_error(e):
+                    with self._lock:
+                        member.quota_errors += 1
+                        self._eject(member)
+                timings.append({"key": member.label, "ms": None, "error": str(e)[:200]})
+                continue
+            timings.append({"key": member.label, "ms": round(1000 * (time.perf_counter() - started), 1)})
+        return timings
+
+    # -- Statistiche -------------------------------------------------------
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": m.label,
+                    "model": self.model,
+                    "weight": m.weight,
+                    "requests": m.requests,
+                    "errors": m.errors,
+                    "quota_errors": m.quota_errors,
+                    "in_flight": m.in_flight,
+                    "avg_latency_ms": round(1000 * m.latency_total / (m.requests - m.errors), 1)
+                    if m.requests > m.errors else None,
+                    "ejected_for_s": round(max(0.0, m.ejected_until - now), 1),
+                }
+                for m in self.members
+            ]
+
+
+_pools: Dict[str, ClientPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_client_pool(model: str, temperature: float) -> ClientPool:
+    """Pool condiviso per modello"""
+    with _pools_lock:
+        if model not in _pools:
+            _pools[model] = ClientPool(model, temperature)
+        return _pools[model]
+
+
+def use_client_factory(factory: Optional[Callable[..., Any]]) -> None:
+    """Crea i prossimi pool con ``factory(api_key=, model=, temperature=)``"""
+    global _client_factory
+    with _pools_lock:
+        _client_factory = factory
+        _pools.clear()
+
+
+def pool_stats() -> List[Dict]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [row for pool in pools for row in pool.stats()]
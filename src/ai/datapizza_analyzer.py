@@ -2,18 +2,35 @@
 Modulo per l'analisi AI dell'audio utilizzando datapizzai con MediaBlock e Pipeline
 """
 import asyncio
+import contextlib
 import json
+import tempfile
+import time
 import base64
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 from datapizzai.clients.google_client import GoogleClient
-from datapizzai.pipeline.functional_pipeline import FunctionalPipeline, Dependency
 from datapizzai.type import Media, MediaBlock, TextBlock, ROLE
 from datapizzai.memory import Memory
 from datapizzai.core.models import PipelineComponent
 
 from ..config import Config
+from .batching import get_batcher
+from .checkpoints import STAGES, StageCheckpointStore, get_checkpoint_store, stage_key
+from .client_pool import ClientPool, get_client_pool
+from .deadline import Deadline, current_deadline, model_call_timeout, reset_deadline, run_model_call, set_deadline
+from .engines import (BaseAnalyzer, LOCAL_ENGINES, SIMULATED_ENGINES, chosen_engine, create_engine,
+                      extractive_summary, keyword_tone_analysis, register_engine)
+from .events import MediaPrepared, StageEvent, SummaryReady, ToneReady, TranscriptReady
+from .routing import LOCAL, RouteDecision, get_router
+from .timeline import format_offset, rollup, write_segment
+from .warmup import ClientWarmup
+from ..audio.fingerprint import fingerprint_available, fingerprint_file, get_fingerprint_index
+from ..audio.segmenter import segment_file
+from ..audio.wav_reader import WavFile, audio_duration
+from ..utils.archive import open_recording_async
+from ..utils.memprofile import get_memory_profiler
 
 
 class AudioToMediaBlockComponent(PipelineComponent):
@@ -48,16 +65,21 @@ class AudioToMediaBlockComponent(PipelineComponent):
 class AudioTranscriptionComponent(PipelineComponent):
     """Componente per la trascrizione audio usando GoogleClient"""
     
+    PROMPT = "Trascrivi questo audio in italiano. Fornisci solo il testo trascritto senza commenti aggiuntivi."
+    TIMEOUT_TEXT = "Trascrizione non disponibile - tempo scaduto"
+    
     def __init__(self, google_client: GoogleClient):
         self.google_client = google_client
+        self.used_fallback = False
     
     def _run(self, media_block: MediaBlock) -> TextBlock:
         """Trascrivi l'audio nel MediaBlock"""
+        self.used_fallback = False
         try:
             print("🔄 Avvio trascrizione con Gemini...")
             
             # Prepara il prompt per la trascrizione
-            prompt = "Trascrivi questo audio in italiano. Fornisci solo il testo trascritto senza commenti aggiuntivi."
+            prompt = self.PROMPT
             
             # Crea la memoria con il MediaBlock
             memory = Memory()
@@ -66,7 +88,8 @@ class AudioTranscriptionComponent(PipelineComponent):
             # Esegui la trascrizione
             response = self.google_client.invoke(
                 input=prompt,
-                memory=memory
+                memory=memory,
+                timeout=model_call_timeout("transcription")
             )
             
             # Estrai il testo dalla risposta
@@ -79,35 +102,27 @@ class AudioTranscriptionComponent(PipelineComponent):
             
             # Fallback se non c'è risposta
             print("⚠️ Nessuna trascrizione ricevuta, uso fallback")
+            self.used_fallback = True
             fallback_text = "Trascrizione non disponibile - modalità demo attiva"
             return TextBlock(content=fallback_text)
             
         except Exception as e:
             print(f"⚠️ Errore nella trascrizione: {e}")
             # Fallback in caso di errore
+            self.used_fallback = True
             fallback_text = "Trascrizione non disponibile - errore nella connessione"
             return TextBlock(content=fallback_text)
     
     async def _a_run(self, media_block: MediaBlock) -> TextBlock:
         """Versione asincrona"""
-        return await asyncio.to_thread(self._run, media_block)
+        return await run_model_call(self._run, media_block)
 
 
 class ToneAnalysisComponent(PipelineComponent):
     """Componente per l'analisi del tono usando GoogleClient"""
     
-    def __init__(self, google_client: GoogleClient):
-        self.google_client = google_client
-    
-    def _run(self, text_block: TextBlock) -> Dict:
-        """Analizza il tono del testo"""
-        try:
-            print("🔄 Avvio analisi del tono con Gemini...")
-            
-            text = text_block.content
-            
-            # Prompt strutturato per l'analisi del tono
-            prompt = f"""
+    # Prompt strutturato per l'analisi del tono
+    PROMPT = """
             Analizza il tono e l'emozione del seguente testo trascritto da audio.
             
             Testo: "{text}"
@@ -122,9 +137,22 @@ class ToneAnalysisComponent(PipelineComponent):
             
             Rispondi SOLO con il JSON valido, senza altro testo.
             """
+    
+    def __init__(self, google_client: GoogleClient):
+        self.google_client = google_client
+        self.used_fallback = False
+    
+    def _run(self, text_block: TextBlock) -> Dict:
+        """Analizza il tono del testo"""
+        self.used_fallback = False
+        try:
+            print("🔄 Avvio analisi del tono con Gemini...")
+            
+            text = text_block.content
+            prompt = self.PROMPT.format(text=text)
             
             # Esegui l'analisi
-            response = self.google_client.invoke(input=prompt)
+            response = self.google_client.invoke(input=prompt, timeout=model_call_timeout("tone"))
             
             if response.content and len(response.content) > 0:
                 first_block = response.content[0]
@@ -146,60 +174,18 @@ class ToneAnalysisComponent(PipelineComponent):
     
     def _fallback_tone_analysis(self, text: str) -> Dict:
         """Analisi del tono di fallback basata su parole chiave"""
-        text_lower = text.lower()
-        
-        # Parole chiave per diversi toni
-        tone_keywords = {
-            "entusiasta": ["fantastico", "eccellente", "meraviglioso", "incredibile"],
-            "felice": ["felice", "contento", "soddisfatto", "bene", "ottimo"],
-            "calmo": ["tranquillo", "calmo", "sereno", "neutrale"],
-            "preoccupato": ["preoccupato", "ansioso", "problema", "difficile"],
-            "arrabbiato": ["arrabbiato", "irritato", "sbagliato", "errore"],
-            "triste": ["triste", "deluso", "male", "peccato"],
-        }
-        
-        # Conta occorrenze
-        tone_scores = {}
-        for tone, keywords in tone_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in text_lower)
-            tone_scores[tone] = score
-        
-        # Determina il tono principale
-        if max(tone_scores.values()) == 0:
-            main_tone = "neutrale"
-            confidence = 60
-        else:
-            main_tone = max(tone_scores, key=tone_scores.get)
-            confidence = min(85, 60 + tone_scores[main_tone] * 10)
-        
-        return {
-            "tono_principale": main_tone,
-            "intensità": "media",
-            "confidenza": confidence,
-            "emozioni_secondarie": [],
-            "descrizione": f"Tono rilevato: {main_tone}",
-            "suggerimenti": ["Continua così", "Mantieni questo atteggiamento"]
-        }
+        self.used_fallback = True
+        return keyword_tone_analysis(text)
     
     async def _a_run(self, text_block: TextBlock) -> Dict:
         """Versione asincrona"""
-        return await asyncio.to_thread(self._run, text_block)
+        return await run_model_call(self._run, text_block)
 
 
 class SummaryComponent(PipelineComponent):
     """Componente per la generazione del riassunto usando GoogleClient"""
     
-    def __init__(self, google_client: GoogleClient):
-        self.google_client = google_client
-    
-    def _run(self, text_block: TextBlock) -> str:
-        """Genera un riassunto del testo"""
-        try:
-            print("🔄 Generazione riassunto con Gemini...")
-            
-            text = text_block.content
-            
-            prompt = f"""
+    PROMPT = """
             Crea un riassunto conciso del seguente testo trascritto da audio.
             
             Testo: "{text}"
@@ -212,8 +198,21 @@ class SummaryComponent(PipelineComponent):
             
             Fornisci solo il riassunto, senza introduzioni.
             """
+    
+    def __init__(self, google_client: GoogleClient):
+        self.google_client = google_client
+        self.used_fallback = False
+    
+    def _run(self, text_block: TextBlock) -> str:
+        """Genera un riassunto del testo"""
+        self.used_fallback = False
+        try:
+            print("🔄 Generazione riassunto con Gemini...")
+            
+            text = text_block.content
+            prompt = self.PROMPT.format(text=text)
             
-            response = self.google_client.invoke(input=prompt)
+            response = self.google_client.invoke(input=prompt, timeout=model_call_timeout("summary"))
             
             if response.content and len(response.content) > 0:
                 first_block = response.content[0]
@@ -230,33 +229,108 @@ class SummaryComponent(PipelineComponent):
             return self._fallback_summary(text_block.content)
     
     def _fallback_summary(self, text: str) -> str:
-        """Riassunto di fallback semplificato"""
-        sentences = text.split('.')
-        if len(sentences) <= 2:
-            return text
-        else:
-            # Prendi le prime 2 frasi
-            return '. '.join(sentences[:2]).strip() + '.'
+        """Riassunto di fallback con le frasi del testo"""
+        self.used_fallback = True
+        return extractive_summary(text)
     
     async def _a_run(self, text_block: TextBlock) -> str:
         """Versione asincrona"""
-        return await asyncio.to_thread(self._run, text_block)
+        return await run_model_call(self._run, text_block)
+
+
+class GeminiTranscription:
+    """Motore ``gemini`` della trascrizione (``AudioTranscriptionComponent``)"""
+    name = "gemini"
+    
+    def __init__(self, client=None, model: Optional[str] = None, temperature: float = 0.3, **_: Any):
+        self.component = AudioTranscriptionComponent(client)
+        self.model = model or Config.MODEL_DEFAULT
+        self.temperature = temperature
+    
+    def key_parts(self) -> Tuple:
+        return (AudioTranscriptionComponent.PROMPT, self.model, self.temperature)
+    
+    async def transcribe(self, audio_path: str, media_block: Optional[MediaBlock] = None) -> Tuple[str, bool]:
+        if media_block is None:
+            media_block = await AudioToMediaBlockComponent().a_run(audio_path)
+        batcher = get_batcher("transcription", self.model, self.component.google_client)
+        if batcher and audio_duration(audio_path, default=float("inf")) <= Config.BATCH_MAX_AUDIO_SECONDS:
+            text = await batcher.submit(media_block)
+            if text is not None:
+                return text, True
+        text_block = await self.component.a_run(media_block)
+        return text_block.content, not self.component.used_fallback
+
 
+class GeminiTone:
+    """Motore ``gemini`` del tono (``ToneAnalysisComponent``)"""
+    name = "gemini"
+    
+    def __init__(self, client=None, model: Optional[str] = None, temperature: float = 0.3, **_: Any):
+        self.component = ToneAnalysisComponent(client)
+        self.model = model or Config.MODEL_DEFAULT
+        self.temperature = temperature
+    
+    def key_parts(self) -> Tuple:
+        return (ToneAnalysisComponent.PROMPT, self.model, self.temperature)
+    
+    async def analyze(self, text: str) -> Tuple[Dict, bool]:
+        batcher = get_batcher("tone", self.model, self.component.google_client)
+        if batcher and len(text.split()) <= Config.BATCH_MAX_TEXT_WORDS:
+            tone = await batcher.submit(text)
+            if tone is not None:
+                return tone, True
+        tone = await self.component.a_run(TextBlock(content=text))
+        return tone, not self.component.used_fallback
 
-class DataPizzaAudioAnalyzer:
+
+class GeminiSummary:
+    """Motore ``gemini`` del riassunto (``SummaryComponent``)"""
+    name = "gemini"
+    
+    def __init__(self, client=None, model: Optional[str] = None, temperature: float = 0.3, **_: Any):
+        self.component = SummaryComponent(client)
+        self.model = model or Config.MODEL_DEFAULT
+        self.temperature = temperature
+    
+    def key_parts(self) -> Tuple:
+        return (SummaryComponent.PROMPT, self.model, self.temperature)
+    
+    async def summarize(self, text: str) -> Tuple[str, bool]:
+        batcher = get_batcher("summary", self.model, self.component.google_client)
+        if batcher and len(text.split()) <= Config.BATCH_MAX_TEXT_WORDS:
+            summary = await batcher.submit(text)
+            if summary is not None:
+                return summary, True
+        summary = await self.component.a_run(TextBlock(content=text))
+        return summary, not self.component.used_fallback
+
+
+register_engine("transcription", "gemini", GeminiTranscription)
+register_engine("tone", "gemini", GeminiTone)
+register_engine("summary", "gemini", GeminiSummary)
+
+
+class DataPizzaAudioAnalyzer(BaseAnalyzer):
     """Analyzer principale che usa datapizzai Pipeline"""
     
+    ANALYZER_NAME = "datapizzai"
+    RESULTS_PREFIX = "datapizza_analysis"
+    
     def __init__(self):
-        # Inizializza il client Google
-        if Config.GOOGLE_API_KEY:
+        # Modello e temperatura entrano nel fingerprint degli stadi
+        self.model_name = Config.MODEL_DEFAULT
+        self.temperature = 0.3
+        self.router = get_router()
+        
+        # Inizializza il client Google (un pool se ci sono più API key)
+        if Config.GOOGLE_API_KEY or Config.GOOGLE_API_KEYS:
             try:
-                self.google_client = GoogleClient(
-                    api_key=Config.GOOGLE_API_KEY,
-                    model="gemini-2.0-flash-exp",
-                    temperature=0.3
-                )
+                self.google_client = get_client_pool(self.model_name, self.temperature)
                 self.demo_mode = False
                 print("🔧 DataPizza modalità completa - Gemini 2.0 Flash")
+                if len(self.google_client) > 1:
+                    print(f"🔑 Pool di {len(self.google_client)} API key ({self.google_client.strategy})")
             except Exception as e:
                 print(f"⚠️ Errore inizializzazione GoogleClient: {e}")
                 self.google_client = None
@@ -267,65 +341,217 @@ class DataPizzaAudioAnalyzer:
             self.demo_mode = True
             print("🔧 DataPizza modalità demo - nessuna API key")
     
-    async def analyze_audio_file(self, audio_file_path: str) -> Dict:
-        """Analizza un file audio usando la pipeline datapizzai"""
+    def start_warmup(self) -> Optional[ClientWarmup]:
+        """Riscalda in background i client che la prossima analisi userà
+        
+        Da chiamare all'inizio della registrazione; None in modalità demo.
+        """
+        if self.demo_mode or not Config.WARMUP_ENABLED:
+            return None
+        models = [self.model_name]
+        if Config.ROUTING_ENABLED:
+            models.append(Config.MODEL_LIGHT)  # tono e riassunto dei testi brevi
+        return ClientWarmup(models, self.temperature).start()
+    
+    def _client_for(self, model: Optional[str]) -> ClientPool:
+        """Pool di client per il modello scelto dal router (creato al primo uso)"""
+        if not model or model == self.model_name:
+            return self.google_client
+        try:
+            return get_client_pool(model, self.temperature)
+        except Exception as e:
+            print(f"⚠️ Modello {model} non disponibile, uso {self.model_name}: {e}")
+            return self.google_client
+    
+    def _engine_for(self, stage: str, input_size: float,
+                    full_mode: bool) -> Tuple[Any, Optional[RouteDecision], bool]:
+        """Motore dello stadio: (motore, decisione del router, instradato in locale)
+        
+        Il motore viene da ``chosen_engine``; senza client (modalità demo) è
+        quello locale. Per ``gemini`` il router sceglie il modello oppure
+        l'analisi locale, che in quel caso non va salvata come checkpoint;
+        lo stesso vale per un motore simulato (``demo``) in modalità completa.
+        """
+        name = chosen_engine(stage)
+        if name == "gemini" and not full_mode:
+            name = LOCAL_ENGINES[stage]
+        if name != "gemini":
+            return create_engine(stage, name), None, full_mode and name in SIMULATED_ENGINES
+        decision = self.router.choose(stage, input_size)
+        if decision.backend == LOCAL:
+            return create_engine(stage, LOCAL_ENGINES[stage]), decision, True
+        engine = create_engine(stage, name, client=self._client_for(decision.model),
+                               model=decision.model, temperature=self.temperature)
+        return engine, decision, False
+    
+    async def analyze_audio_file(self, audio_file_path: str, force_stages: Iterable[str] = (),
+                                 use_dedup: bool = True,
+                                 on_event: Optional[Callable[[StageEvent], None]] = None,
+                                 deadline_s: Optional[float] = None) -> Dict:
+        """Analizza un file audio usando la pipeline datapizzai
+        
+        Gli stadi con un checkpoint valido vengono riusati; ``force_stages``
+        (es. ``("tone", "summary")``) li ricalcola comunque, insieme a quelli
+        che ne dipendono. Il modello di ogni stadio è scelto dal router in base
+        alla dimensione dell'input e alle latenze misurate. ``on_event`` riceve
+        gli eventi di ``events`` man mano che gli stadi finiscono.
+        
+        L'analisi dura al più ``deadline_s`` secondi (default
+        ``ANALYSIS_DEADLINE_SECONDS``): uno stadio che supera la sua quota usa
+        il fallback locale ed è elencato in ``results["deadline"]["timed_out"]``.
+        
+        Le registrazioni archiviate vengono decodificate dall'archivio per la
+        durata dell'analisi (``utils.archive.open_recording``).
+        """
+        deadline = Deadline(deadline_s)
+        token = set_deadline(deadline)
+        try:
+            async with open_recording_async(audio_file_path):
+                profiler = get_memory_profiler()
+                if profiler is None:
+                    results = await self._analyze_audio_file(audio_file_path, force_stages, use_dedup, on_event)
+                else:
+                    with profiler.recording(audio_file_path,
+                                            audio_duration(audio_file_path, default=0.0)) as record:
+                        results = await self._analyze_audio_file(audio_file_path, force_stages, use_dedup,
+                                                                 on_event)
+                    results["memory"] = {"total": record["total"], "stages": record["stages"]}
+        finally:
+            reset_deadline(token)
+        results["deadline"] = deadline.snapshot()
+        return results
+    
+    async def _analyze_audio_file(self, audio_file_path: str, force_stages: Iterable[str],
+                                  use_dedup: bool,
+                                  on_event: Optional[Callable[[StageEvent], None]] = None) -> Dict:
         print(f"🎯 Avvio analisi DataPizza di: {audio_file_path}")
+        force = set(force_stages)
+        emit = self._emitter(audio_file_path, on_event)
         
         try:
-            # Crea la pipeline
-            pipeline = FunctionalPipeline()
+            # Step 0: Registrazioni già analizzate (anche se ricodificate)
+            fingerprint = await self._compute_fingerprint(audio_file_path)
+            if use_dedup and not force:
+                duplicate = await self._reuse_duplicate(audio_file_path, fingerprint)
+                if duplicate:
+                    return duplicate
             
             # Componenti della pipeline
             audio_to_media = AudioToMediaBlockComponent()
+            full_mode = bool(self.google_client and not self.demo_mode)
             
-            if self.google_client and not self.demo_mode:
-                # Modalità completa con Gemini
-                transcription_comp = AudioTranscriptionComponent(self.google_client)
-                tone_comp = ToneAnalysisComponent(self.google_client)
-                summary_comp = SummaryComponent(self.google_client)
-            else:
-                # Modalità demo con fallback
-                transcription_comp = None
-                tone_comp = None
-                summary_comp = None
+            # I risultati demo non vanno salvati come checkpoint
+            store = self._checkpoint_store() if full_mode else None
+            stages: Dict[str, str] = {}
+            routing: Dict[str, Dict] = {}
             
             # Esegui la pipeline step by step
             
             # Step 1: Converti audio in MediaBlock
-            media_block = await audio_to_media.a_run(audio_file_path)
+            media_key = None
+            if store:
+                # sha256 dell'intero WAV: in un thread, per non bloccare l'event loop
+                digest = await asyncio.to_thread(store.file_digest, audio_file_path)
+                media_key = stage_key("media", digest, "wav")
+                if "media" in force:
+                    force.update(STAGES)
+            with self._memory_stage("media"):
+                media_block = await audio_to_media.a_run(audio_file_path)
+            if store:
+                store.put(media_key, "media", {"source": audio_file_path, "extension": "wav"}, audio_file_path)
+            stages["media"] = "computed"
+            emit(MediaPrepared, duration_s=audio_duration(audio_file_path), status=stages["media"])
+            
+            # Audio lunghi: trascrizione e tono per segmento, in parallelo
+            timeline = await self._analyze_segments(audio_file_path, store, force) if full_mode else None
             
             # Step 2: Trascrizione
-            if transcription_comp:
-                text_block = await transcription_comp.a_run(media_block)
-                transcription = text_block.content
+            engines: Dict[str, str] = {}
+            if timeline:
+                transcription = " ".join(seg["transcription"] for seg in timeline).strip()
+                stages["transcription"] = self._merge_status(seg["stages"]["transcription"] for seg in timeline)
+                engines["transcription"] = ",".join(sorted({seg["engines"]["transcription"] for seg in timeline}))
+                if stages["transcription"] != "reused":
+                    force.add("summary")
             else:
-                # Fallback locale
-                transcription = self._get_demo_transcription(audio_file_path)
-                text_block = TextBlock(content=transcription)
+                engine, decision, simulated = self._engine_for(
+                    "transcription", audio_duration(audio_file_path, default=0.0), full_mode)
+                
+                async def transcribe():
+                    output, valid = await engine.transcribe(audio_file_path, media_block)
+                    return output, valid and not simulated
+                
+                key = stage_key("transcription", media_key, *engine.key_parts())
+                transcription = await self._run_stage("transcription", key, transcribe, store,
+                                                      force, stages, audio_file_path, decision, routing,
+                                                      fallback=lambda: AudioTranscriptionComponent.TIMEOUT_TEXT)
+                engines["transcription"] = engine.name
+                if stages["transcription"] != "reused":
+                    # Testo nuovo: tono e riassunto vanno ricalcolati
+                    force.update(("tone", "summary"))
+            
+            emit(TranscriptReady, transcription=transcription, status=stages["transcription"])
+            n_words = len(transcription.split())
             
             # Step 3: Analisi del tono
-            if tone_comp:
-                tone_analysis = await tone_comp.a_run(text_block)
+            if timeline:
+                tone_analysis = rollup(timeline)
+                stages["tone"] = self._merge_status(seg["stages"]["tone"] for seg in timeline)
+                engines["tone"] = ",".join(sorted({seg["engines"]["tone"] for seg in timeline}))
             else:
-                # Fallback locale
-                tone_analysis = self._get_demo_tone_analysis(transcription)
+                tone_engine, decision, routed_local = self._engine_for("tone", n_words, full_mode)
+                
+                async def analyze_tone():
+                    output, valid = await tone_engine.analyze(transcription)
+                    return output, valid and not routed_local
+                
+                key = stage_key("tone", transcription, *tone_engine.key_parts())
+                tone_analysis = await self._run_stage("tone", key, analyze_tone, store,
+                                                      force, stages, audio_file_path, decision, routing,
+                                                      fallback=lambda: keyword_tone_analysis(transcription))
+                engines["tone"] = tone_engine.name
+            
+            tone_timeline = [
+                {
+                    "start": seg["start"],
+                    "end": seg["end"],
+                    "tono_principale": seg["tone_analysis"].get("tono_principale"),
+                    "intensità": seg["tone_analysis"].get("intensità"),
+                    "confidenza": seg["tone_analysis"].get("confidenza"),
+                    "transcription": seg["transcription"],
+                }
+                for seg in timeline or []
+            ]
+            emit(ToneReady, tone_analysis=tone_analysis, tone_timeline=tone_timeline, status=stages["tone"])
             
             # Step 4: Riassunto
-            if summary_comp:
-                summary = await summary_comp.a_run(text_block)
-            else:
-                # Fallback locale
-                summary = self._get_demo_summary(transcription)
+            summary_engine, decision, routed_local = self._engine_for("summary", n_words, full_mode)
+            
+            async def summarize():
+                output, valid = await summary_engine.summarize(transcription)
+                return output, valid and not routed_local
+            
+            key = stage_key("summary", transcription, *summary_engine.key_parts())
+            summary = await self._run_stage("summary", key, summarize, store,
+                                            force, stages, audio_file_path, decision, routing,
+                                            fallback=lambda: extractive_summary(transcription))
+            engines["summary"] = summary_engine.name
+            emit(SummaryReady, summary=summary, status=stages["summary"])
             
             # Risultato finale
-            results = {
-                "file_path": audio_file_path,
-                "transcription": transcription,
-                "tone_analysis": tone_analysis,
-                "summary": summary,
-                "timestamp": self._get_timestamp(),
-                "analyzer": "datapizzai"
-            }
+            results = self._build_results(audio_file_path, transcription, tone_analysis, summary,
+                                          stages=stages, engines=engines)
+            if routing:
+                results["routing"] = routing
+            if tone_timeline:
+                results["tone_timeline"] = tone_timeline
+            
+            # Solo risultati completi: demo, fallback e stadi scaduti non vanno
+            # riusati, altrimenti la prossima analisi non riproverebbe il modello
+            simulated = SIMULATED_ENGINES.intersection(engines["transcription"].split(","))
+            degraded = "fallback" in stages.values() or bool(current_deadline().timed_out)
+            if fingerprint is not None and not self.demo_mode and not simulated and not degraded:
+                await self._index_fingerprint(audio_file_path, fingerprint, results)
             
             print("🎉 Analisi DataPizza completata")
             return results
@@ -335,80 +561,179 @@ class DataPizzaAudioAnalyzer:
             # Fallback completo
             return self._get_fallback_results(audio_file_path)
     
-    def _get_demo_transcription(self, audio_file_path: str) -> str:
-        """Trascrizione demo basata sulla durata"""
+    async def _analyze_segments(self, audio_file_path: str, store: Optional[StageCheckpointStore],
+                                force: Set[str]) -> Optional[List[Dict]]:
+        """Trascrizione e tono per segmento, con al più ``SEGMENT_CONCURRENCY`` segmenti in volo
+        
+        Restituisce None per audio brevi o non segmentabili: in quel caso si
+        usa la pipeline sull'intero file.
+        """
+        if not Config.SEGMENT_TIMELINE:
+            return None
+        if audio_duration(audio_file_path, default=0.0) < Config.SEGMENT_MIN_AUDIO_SECONDS:
+            return None
         try:
-            import wave
-            with wave.open(audio_file_path, 'rb') as wf:
-                frames = wf.getnframes()
-                rate = wf.getframerate()
-                duration = frames / float(rate)
-        except:
-            duration = 15.0
+            with self._memory_stage("segmentation"):
+                segments = await current_deadline().run("segmentation", segment_file(audio_file_path))
+        except Exception as e:
+            print(f"⚠️ Segmentazione non disponibile: {e}")
+            return None
+        if len(segments) < 2:
+            return None
         
-        if duration < 10:
-            return "Ciao, questo è un test di registrazione breve. Sto testando l'applicazione VibeTalking."
-        elif duration < 30:
-            return "Salve, questa è una registrazione di media durata. Sto parlando per testare le funzionalità dell'applicazione."
-        else:
-            return "Buongiorno, questa è una registrazione più lunga per testare le capacità dell'applicazione VibeTalking con datapizzai."
-    
-    def _get_demo_tone_analysis(self, text: str) -> Dict:
-        """Analisi del tono demo"""
-        return {
-            "tono_principale": "neutrale",
-            "intensità": "media",
-            "confidenza": 70,
-            "emozioni_secondarie": [],
-            "descrizione": "Tono equilibrato (modalità demo)",
-            "suggerimenti": ["Test completato con successo"]
-        }
-    
-    def _get_demo_summary(self, text: str) -> str:
-        """Riassunto demo"""
-        sentences = text.split('.')
-        if len(sentences) <= 2:
-            return text
-        return '. '.join(sentences[:2]).strip() + '.'
-    
-    def _get_timestamp(self) -> str:
-        """Timestamp ISO"""
-        from datetime import datetime
-        return datetime.now().isoformat()
-    
-    def _get_fallback_results(self, audio_file_path: str) -> Dict:
-        """Risultati di fallback in caso di errore totale"""
-        return {
-            "file_path": audio_file_path,
-            "transcription": "Trascrizione non disponibile",
-            "tone_analysis": {
-                "tono_principale": "neutrale",
-                "intensità": "media", 
-                "confidenza": 50,
-                "emozioni_secondarie": [],
-                "descrizione": "Analisi non disponibile",
-                "suggerimenti": ["Riprova più tardi"]
-            },
-            "summary": "Riassunto non disponibile",
-            "timestamp": self._get_timestamp(),
-            "analyzer": "datapizzai-fallback"
-        }
+        print(f"✂️ {len(segments)} segmenti, analisi in parallelo (max {Config.SEGMENT_CONCURRENCY})")
+        semaphore = asyncio.Semaphore(max(1, Config.SEGMENT_CONCURRENCY))
+        
+        with tempfile.TemporaryDirectory(prefix="vibetalking-seg-") as tmp, WavFile(audio_file_path) as wav:
+            async def analyze(index: int, start: float, end: float) -> Dict:
+                async with semaphore:
+                    segment_path = Path(tmp) / f"segment_{index:03d}.wav"
+                    digest = write_segment(wav, start, end, segment_path)
+                    segment_force = set(force)
+                    segment_stages: Dict[str, str] = {}
+                    
+                    engine, decision, simulated = self._engine_for("transcription", end - start, True)
+                    
+                    async def transcribe():
+                        output, valid = await engine.transcribe(str(segment_path))
+                        return output, valid and not simulated
+                    
+                    key = stage_key("segment_transcription", digest, wav.sample_rate, wav.channels,
+                                    *engine.key_parts())
+                    text = await self._run_stage("transcription", key, transcribe, store, segment_force,
+                                                 segment_stages, audio_file_path, decision,
+                                                 fallback=lambda: AudioTranscriptionComponent.TIMEOUT_TEXT)
+                    if segment_stages["transcription"] != "reused":
+                        segment_force.add("tone")
+                    
+                    tone_engine, decision, routed_local = self._engine_for("tone", len(text.split()), True)
+                    
+                    async def analyze_tone():
+                        output, valid = await tone_engine.analyze(text)
+                        return output, valid and not routed_local
+                    
+                    key = stage_key("tone", text, *tone_engine.key_parts())
+                    tone = await self._run_stage("tone", key, analyze_tone, store, segment_force,
+                                                 segment_stages, audio_file_path, decision,
+                                                 fallback=lambda: keyword_tone_analysis(text))
+                    print(f"   🎭 {format_offset(start)}-{format_offset(end)}: {tone.get('tono_principale', 'N/A')}")
+                    return {"start": start, "end": end, "transcription": text,
+                            "tone_analysis": tone, "stages": segment_stages,
+                            "engines": {"transcription": engine.name, "tone": tone_engine.name}}
+            
+            return list(await asyncio.gather(*(analyze(i, s, e) for i, (s, e) in enumerate(segments))))
+    
+    @staticmethod
+    def _merge_status(statuses: Iterable[str]) -> str:
+        statuses = list(statuses)
+        if all(s == "reused" for s in statuses):
+            return "reused"
+        return "fallback" if "fallback" in statuses else "computed"
+    
+    @staticmethod
+    def _memory_stage(name: str):
+        """Misura la memoria dello stadio se ``MEMORY_PROFILE`` è attivo"""
+        profiler = get_memory_profiler()
+        return profiler.stage(name) if profiler else contextlib.nullcontext()
     
-    def save_analysis_results(self, results: Dict, output_file: Optional[str] = None) -> str:
-        """Salva i risultati dell'analisi in un file JSON"""
-        from datetime import datetime
+    def _checkpoint_store(self) -> Optional[StageCheckpointStore]:
+        if not Config.CHECKPOINTS_ENABLED:
+            return None
+        try:
+            return get_checkpoint_store()
+        except Exception as e:
+            print(f"⚠️ Checkpoint non disponibili: {e}")
+            return None
+    
+    async def _run_stage(self, name: str, key: str, compute: Callable[[], Awaitable[Tuple[Any, bool]]],
+                         store: Optional[StageCheckpointStore], force: Set[str],
+                         stages: Dict[str, str], audio_file_path: str,
+                         decision: Optional[RouteDecision] = None,
+                         routing: Optional[Dict[str, Dict]] = None,
+                         fallback: Optional[Callable[[], Any]] = None) -> Any:
+        """Esegue uno stadio oppure ne riusa il checkpoint
+        
+        ``compute`` restituisce (output, valido): gli output di fallback non
+        vengono salvati, così la prossima analisi riprova lo stadio, e lo stadio
+        risulta "fallback" (salvo scelta deliberata dell'analisi locale). La
+        latenza misurata alimenta gli istogrammi del router.
         
-        if not output_file:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = Config.OUTPUT_DIR / f"datapizza_analysis_{timestamp}.json"
+        ``compute`` ha a disposizione la quota dello stadio nella scadenza
+        dell'analisi: oltre quella viene abbandonato e si usa ``fallback()``.
+        """
+        if decision is not None and routing is not None:
+            routing[name] = {"backend": decision.backend, "model": decision.model, "reason": decision.reason}
         
+        if store and name not in force:
+            cached = store.get(key)
+            if cached is not None:
+                print(f"♻️ Stadio '{name}' invariato: riuso il checkpoint")
+                stages[name] = "reused"
+                if decision is not None:
+                    self.router.observe(decision, None, audio_file_path, status="reused")
+                return cached
+        
+        started = time.perf_counter()
+        timed_out = False
+        with self._memory_stage(name):
+            try:
+                if fallback is None:
+                    output, valid = await compute()
+                else:
+                    output, valid = await current_deadline().run(name, compute())
+            except asyncio.TimeoutError:
+                output, valid, timed_out = fallback(), False, True
+        latency_ms = (time.perf_counter() - started) * 1000
+        if store and valid:
+            store.put(key, name, output, audio_file_path)
+        local = decision is not None and decision.backend == LOCAL
+        stages[name] = "computed" if valid or local else "fallback"
+        if decision is not None:
+            # Un fallback non misura il backend scelto; una scadenza sì (per difetto)
+            if timed_out:
+                self.router.observe(decision, latency_ms, audio_file_path, status="timeout")
+            else:
+                self.router.observe(decision, latency_ms if valid else None, audio_file_path)
+        return output
+    
+    async def _compute_fingerprint(self, audio_file_path: str) -> Optional[Dict]:
+        """Fingerprint spettrale del file, se la deduplicazione è attiva"""
+        if not Config.DEDUP_ENABLED or not fingerprint_available():
+            return None
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
-            
-            print(f"💾 Risultati DataPizza salvati in: {output_file}")
-            return str(output_file)
-            
+            with self._memory_stage("fingerprint"):
+                return await current_deadline().run("fingerprint", fingerprint_file(audio_file_path))
+        except Exception as e:
+            print(f"⚠️ Fingerprint non disponibile: {e}")
+            return None
+    
+    async def _reuse_duplicate(self, audio_file_path: str, fingerprint: Optional[Dict]) -> Optional[Dict]:
+        """Risultati di un'analisi precedente dello stesso audio, se esiste"""
+        if fingerprint is None:
+            return None
+        try:
+            match = await asyncio.to_thread(get_fingerprint_index().lookup, fingerprint)
+        except Exception as e:
+            print(f"⚠️ Ricerca duplicati non disponibile: {e}")
+            return None
+        if not match or match["similarity"] < Config.DEDUP_THRESHOLD:
+            return None
+        
+        print(f"♻️ Audio già analizzato ({Path(match['audio_path']).name}, "
+              f"somiglianza {match['similarity']:.0%}): riuso i risultati")
+        results = dict(match["results"])
+        results.update({
+            "file_path": audio_file_path,
+            "timestamp": self._get_timestamp(),
+            "deduplicated_from": {
+                "file_path": match["audio_path"],
+                "similarity": round(match["similarity"], 3),
+            },
+        })
+        return results
+    
+    async def _index_fingerprint(self, audio_file_path: str, fingerprint: Dict, results: Dict) -> None:
+        try:
+            await asyncio.to_thread(get_fingerprint_index().add, audio_file_path, fingerprint, results)
         except Exception as e:
-            print(f"❌ Errore nel salvataggio: {e}")
-            return ""
+            print(f"⚠️ Fingerprint non indicizzato: {e}")
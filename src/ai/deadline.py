@@ -0,0 +1,162 @@
+"""
+Scadenze per analisi e per stadio
+
+Ogni analisi ha un budget complessivo (``ANALYSIS_DEADLINE_SECONDS``, 0 =
+nessuno). Ogni stadio riceve una quota del budget *residuo* proporzionale al
+suo peso rispetto agli stadi che mancano (``DEADLINE_STAGE_WEIGHTS``): uno
+stadio veloce lascia più tempo ai successivi, uno lento non può consumare
+quello degli altri. La somma delle quote non supera mai il budget, quindi la
+latenza dell'analisi ha un limite superiore (più il tempo, trascurabile, dei
+fallback locali).
+
+Uno stadio oltre la sua quota viene abbandonato: la coroutine che lo attende
+viene annullata e il chiamante usa il fallback locale. Le chiamate bloccanti
+non si possono interrompere: il thread finisce per conto suo e il suo
+risultato viene scartato. Per questo le chiamate ai modelli girano in un
+executor dedicato e limitato (``run_model_call``, ``MODEL_CALL_WORKERS``
+thread) invece che in quello predefinito di ``asyncio.to_thread``: un endpoint
+bloccato occupa al più quei thread, mentre I/O su file e fallback locali non
+restano in coda dietro di lui. Ogni chiamata riceve inoltre un timeout pari
+alla quota dello stadio (``model_call_timeout``), così il client può chiudere
+la richiesta da sé dove la libreria lo consente.
+
+La scadenza attiva viaggia in un ContextVar, così arriva anche agli stadi
+eseguiti in task figli (es. i segmenti analizzati in parallelo).
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..config import Config
+
+_current: ContextVar[Optional["Deadline"]] = ContextVar("analysis_deadline", default=None)
+
+_model_executor: Optional[ThreadPoolExecutor] = None
+_model_executor_size = 0
+_model_executor_lock = threading.Lock()
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """``"fingerprint:1,transcription:10"`` → pesi nell'ordine di esecuzione"""
+    weights: Dict[str, float] = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition(":")
+        if not name:
+            continue
+        try:
+            weights[name] = max(0.0, float(weight or 1))
+        except ValueError:
+            print(f"⚠️ Peso di scadenza non valido per '{name}': {weight!r}")
+    return weights
+
+
+class Deadline:
+    """Budget di tempo di un'analisi, ripartito tra gli stadi"""
+
+    def __init__(self, budget_s: Optional[float] = None, weights: Optional[Dict[str, float]] = None) -> None:
+        budget_s = Config.ANALYSIS_DEADLINE_SECONDS if budget_s is None else budget_s
+        self.budget_s = budget_s if budget_s and budget_s > 0 else None
+        self.weights = weights if weights is not None else parse_weights(Config.DEADLINE_STAGE_WEIGHTS)
+        self.started = time.monotonic()
+        self.timed_out: Dict[str, int] = {}
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> Optional[float]:
+        """Secondi rimasti; None se non c'è scadenza"""
+        if self.budget_s is None:
+            return None
+        return max(0.0, self.budget_s - self.elapsed())
+
+    def share(self, stage: str) -> Optional[float]:
+        """Tempo concesso a ``stage``: quota del residuo in base al peso degli stadi mancanti"""
+        remaining = self.remaining()
+        if remaining is None or stage not in self.weights:
+            return None
+        stages = list(self.weights)
+        pending = sum(self.weights[s] for s in stages[stages.index(stage):])
+        return remaining * self.weights[stage] / pending if pending else remaining
+
+    async def run(self, stage: str, awaitable: Awaitable[Any]) -> Any:
+        """Attende ``awaitable`` entro la quota dello stadio
+
+        Solleva ``asyncio.TimeoutError`` (annullando l'attesa) se la quota
+        scade; lo stadio viene registrato in ``timed_out``.
+        """
+        timeout = self.share(stage)
+        if timeout is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            self.timed_out[stage] = self.timed_out.get(stage, 0) + 1
+            print(f"⏱️ Stadio '{stage}' oltre la scadenza ({timeout:.1f} s): uso il fallback locale")
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Budget, tempo usato e stadi scaduti, da salvare con i risultati"""
+        return {
+            "budget_s": self.budget_s,
+            "elapsed_s": round(self.elapsed(), 3),
+            "timed_out": dict(self.timed_out),
+        }
+
+
+def current_deadline() -> Deadline:
+    """Scadenza dell'analisi in corso (senza limite fuori da un'analisi)"""
+    deadline = _current.get()
+    return deadline if deadline is not None else Deadline(0)
+
+
+def set_deadline(deadline: Deadline):
+    """Attiva ``deadline`` nel contesto corrente; restituisce il token per ``reset_deadline``"""
+    return _current.set(deadline)
+
+
+def reset_deadline(token) -> None:
+    _current.reset(token)
+
+
+def model_call_timeout(stage: str) -> float:
+    """Timeout da passare al client per una chiamata dello stadio ``stage``
+
+    La quota residua dello stadio, al massimo ``HTTP_TIMEOUT_SECONDS``.
+    """
+    share = current_deadline().share(stage)
+    timeout = Config.HTTP_TIMEOUT_SECONDS
+    return max(1.0, min(timeout, share)) if share is not None else timeout
+
+
+def model_executor() -> ThreadPoolExecutor:
+    """Executor condiviso per le chiamate ai modelli
+
+    Creato al primo uso e ricreato se il profilo cambia ``MODEL_CALL_WORKERS``
+    (le chiamate già partite finiscono nel vecchio).
+    """
+    global _model_executor, _model_executor_size
+    with _model_executor_lock:
+        if _model_executor is None or _model_executor_size != Config.MODEL_CALL_WORKERS:
+            if _model_executor is not None:
+                _model_executor.shutdown(wait=False)
+            _model_executor_size = Config.MODEL_CALL_WORKERS
+            _model_executor = ThreadPoolExecutor(max_workers=_model_executor_size,
+                                                 thread_name_prefix="model-call")
+        return _model_executor
+
+
+async def run_model_call(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Come ``asyncio.to_thread``, ma nell'executor dei modelli
+
+    Il contesto (e quindi la scadenza attiva) viene copiato nel thread.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(model_executor(), call)
@@ -0,0 +1,302 @@
+"""
+Confronto dei motori di analisi e scelta del più veloce abbastanza accurato
+
+Per ogni stadio esegue tutti i motori registrati (``engines``) sulle stesse
+registrazioni e misura latenza media e p90 e accuratezza:
+
+- trascrizione: 1 - WER rispetto al testo di riferimento;
+- tono: quota di registrazioni con lo stesso ``tono_principale``;
+- riassunto: F1 delle parole significative rispetto al riassunto di riferimento.
+
+Tono e riassunto girano sui testi di riferimento, così non ereditano gli
+errori della trascrizione. I riferimenti vengono da ``--manifest`` (JSONL con
+``audio`` e, facoltativi, ``transcript``, ``tone``, ``summary``); dove
+mancano fa da riferimento il motore remoto ``--reference`` (default
+``gemini``). Un motore che ha prodotto i riferimenti non può essere scelto
+(si confronterebbe con sé stesso); uno stadio senza riferimenti reali (né
+nel manifest né da un motore remoto, ad esempio senza API key) viene
+saltato. Senza manifest si usano le ultime registrazioni del catalogo.
+
+Per ogni stadio viene scelto il motore con la latenza media più bassa tra
+quelli che raggiungono ``ENGINE_MIN_*_ACCURACY`` e non sono mai ripiegati su
+un fallback; ``demo`` non viene mai scelto. La scelta va in
+``recordings/engine_selection.json`` ed è usata dagli stadi configurati con
+``auto``.
+
+    python -m src.ai.enginebench --limit 10
+    python -m src.ai.enginebench --manifest riferimenti.jsonl --dry-run
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import Config
+from ..utils.italian_text import tokenize
+from ..utils.storage import atomic_write_bytes
+from .engines import SIMULATED_ENGINES, create_engine, engine_names
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+MIN_ACCURACY = {
+    "transcription": "ENGINE_MIN_TRANSCRIPTION_ACCURACY",
+    "tone": "ENGINE_MIN_TONE_ACCURACY",
+    "summary": "ENGINE_MIN_SUMMARY_ACCURACY",
+}
+# Motori che analizzano davvero (richiedono una API key): gli unici validi come riferimento
+REMOTE_ENGINES = ("gemini", "speech")
+
+
+# -- Metriche ------------------------------------------------------------------
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Distanza di edit tra le parole, divisa per le parole del riferimento"""
+    ref, hyp = _WORD_RE.findall(reference.lower()), _WORD_RE.findall(hypothesis.lower())
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i]
+        for j, h in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def unigram_f1(reference: str, hypothesis: str) -> float:
+    """F1 delle parole significative in comune (con molteplicità)"""
+    ref, hyp = tokenize(reference), tokenize(hypothesis)
+    if not ref or not hyp:
+        return float(ref == hyp)
+    remaining = list(ref)
+    common = 0
+    for word in hyp:
+        if word in remaining:
+            remaining.remove(word)
+            common += 1
+    if not common:
+        return 0.0
+    precision, recall = common / len(hyp), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def score(stage: str, reference: Any, output: Any) -> float:
+    if stage == "transcription":
+        return max(0.0, 1.0 - word_error_rate(reference, output))
+    if stage == "tone":
+        return float(reference.get("tono_principale") == (output or {}).get("tono_principale"))
+    return unigram_f1(reference, output)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# -- Registrazioni ---------------------------------------------------------------
+
+def load_samples(manifest: Optional[str], limit: int) -> List[Dict]:
+    """Registrazioni da confrontare, con gli eventuali riferimenti"""
+    if manifest:
+        samples = []
+        base = Path(manifest).parent
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    sample = json.loads(line)
+                    sample["audio"] = str(base / sample["audio"])
+                    samples.append(sample)
+        return samples[:limit] if limit else samples
+
+    from ..utils.catalog import get_catalog
+
+    rows = get_catalog().latest_recordings(limit)
+    return [{"audio": row["path"]} for row in rows if Path(row["path"]).exists()]
+
+
+def _engine_kwargs(name: str) -> Dict:
+    if name != "gemini":
+        return {}
+    from .client_pool import get_client_pool
+
+    return {"client": get_client_pool(Config.MODEL_DEFAULT, 0.3), "model": Config.MODEL_DEFAULT}
+
+
+def available_engines(stage: str) -> List[str]:
+    """Motori eseguibili qui: quelli remoti solo con una API key"""
+    has_key = bool(Config.GOOGLE_API_KEY or Config.GOOGLE_API_KEYS)
+    return [name for name in engine_names(stage) if has_key or name not in REMOTE_ENGINES]
+
+
+# -- Confronto -----------------------------------------------------------------
+
+async def _call(stage: str, engine: Any, value: str) -> Tuple[Any, bool, float]:
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stage == "transcription":
+            output, valid = await engine.transcribe(value)
+        elif stage == "tone":
+            output, valid = await engine.analyze(value)
+        else:
+            output, valid = await engine.summarize(value)
+    return output, valid, (time.perf_counter() - started) * 1000
+
+
+async def run_stage(stage: str, names: List[str], inputs: List[str],
+                    references: List[Any]) -> Dict[str, Dict]:
+    """Latenze e accuratezza di ogni motore dello stadio"""
+    results: Dict[str, Dict] = {}
+    for name in names:
+        engine = create_engine(stage, name, **_engine_kwargs(name))
+        latencies: List[float] = []
+        scores: List[float] = []
+        fallbacks = 0
+        for value, reference in zip(inputs, references):
+            output, valid, ms = await _call(stage, engine, value)
+            latencies.append(ms)
+            fallbacks += not valid
+            scores.append(score(stage, reference, output) if valid else 0.0)
+        results[name] = {
+            "mean_ms": round(sum(latencies) / len(latencies), 1),
+            "p90_ms": round(percentile(latencies, 0.9), 1),
+            "accuracy": round(sum(scores) / len(scores), 3),
+            "fallbacks": fallbacks,
+        }
+    return results
+
+
+async def _reference_outputs(stage: str, reference_engine: Optional[str], inputs: List[str],
+                             given: List[Any]) -> Optional[List[Any]]:
+    """Riferimenti mancanti calcolati con il motore di riferimento; None se non ce n'è uno"""
+    missing = [i for i, value in enumerate(given) if value is None]
+    if not missing:
+        return given
+    if reference_engine is None:
+        return None
+    engine = create_engine(stage, reference_engine, **_engine_kwargs(reference_engine))
+    filled = list(given)
+    for i in missing:
+        output, valid, _ = await _call(stage, engine, inputs[i])
+        if not valid:
+            print(f"⚠️ Riferimento '{reference_engine}' ripiegato su un fallback per {stage}")
+        filled[i] = output
+    return filled
+
+
+def select(results: Dict[str, Dict[str, Dict]]) -> Dict[str, str]:
+    """Per stadio, il motore più veloce che raggiunge la soglia di accuratezza"""
+    selected: Dict[str, str] = {}
+    for stage, by_engine in results.items():
+        threshold = getattr(Config, MIN_ACCURACY[stage])
+        eligible = [(stats["mean_ms"], name) for name, stats in by_engine.items()
+                    if stats["accuracy"] >= threshold and not stats["fallbacks"]
+                    and not stats.get("reference") and name not in SIMULATED_ENGINES]
+        if eligible:
+            selected[stage] = min(eligible)[1]
+    return selected
+
+
+async def benchmark(samples: List[Dict], reference_engine: str) -> Dict[str, Dict[str, Dict]]:
+    # I motori gemini si registrano con il loro modulo (richiede datapizzai)
+    with contextlib.suppress(ImportError), contextlib.redirect_stdout(io.StringIO()):
+        from . import datapizza_analyzer  # noqa: F401
+
+    audio = [s["audio"] for s in samples]
+    stage_names = {stage: available_engines(stage) for stage in MIN_ACCURACY}
+
+    def reference_for(stage: str) -> Optional[str]:
+        """Motore remoto che calcola i riferimenti mancanti (None senza API key)"""
+        remote = [name for name in stage_names[stage] if name in REMOTE_ENGINES]
+        if reference_engine in remote:
+            return reference_engine
+        if remote:
+            print(f"⚠️ Motore di riferimento '{reference_engine}' non disponibile per {stage}, "
+                  f"uso '{remote[0]}'")
+            return remote[0]
+        return None
+
+    print("🎯 Riferimenti...")
+    references: Dict[str, Optional[List[Any]]] = {}
+    engines_used: Dict[str, Optional[str]] = {}
+    given = [s.get("transcript") for s in samples]
+    engines_used["transcription"] = reference_for("transcription") if None in given else None
+    transcripts = references["transcription"] = await _reference_outputs(
+        "transcription", engines_used["transcription"], audio, given)
+    for stage in ("tone", "summary"):
+        given = [s.get(stage) for s in samples]
+        engines_used[stage] = reference_for(stage) if None in given else None
+        # Senza trascrizioni di riferimento tono e riassunto non hanno un ingresso
+        references[stage] = None if transcripts is None else await _reference_outputs(
+            stage, engines_used[stage], transcripts, given)
+    if references["tone"] is not None:
+        references["tone"] = [t if isinstance(t, dict) else {"tono_principale": t} for t in references["tone"]]
+
+    results: Dict[str, Dict[str, Dict]] = {}
+    for stage, inputs in (("transcription", audio), ("tone", transcripts), ("summary", transcripts)):
+        if references[stage] is None:
+            print(f"⚠️ {stage}: nessun riferimento reale (manifest o motore remoto con API key), stadio saltato")
+            continue
+        print(f"⏱️ {stage}: {', '.join(stage_names[stage])}")
+        results[stage] = await run_stage(stage, stage_names[stage], inputs, references[stage])
+        if engines_used[stage] in results[stage]:
+            results[stage][engines_used[stage]]["reference"] = True
+    return results
+
+
+def print_table(results: Dict[str, Dict[str, Dict]], selected: Dict[str, str]) -> None:
+    print("\n📊 MOTORI PER STADIO")
+    for stage, by_engine in results.items():
+        threshold = getattr(Config, MIN_ACCURACY[stage])
+        print(f"  {stage} (accuratezza minima {threshold:.2f})")
+        for name, stats in sorted(by_engine.items(), key=lambda kv: kv[1]["mean_ms"]):
+            mark = "✅" if selected.get(stage) == name else "  "
+            fallbacks = f", {stats['fallbacks']} fallback" if stats["fallbacks"] else ""
+            reference = " (riferimento)" if stats.get("reference") else ""
+            print(f"   {mark} {name:<12} media {stats['mean_ms']:9.1f} ms  p90 {stats['p90_ms']:9.1f} ms  "
+                  f"accuratezza {stats['accuracy']:.3f}{fallbacks}{reference}")
+
+
+def main(args: argparse.Namespace) -> int:
+    samples = load_samples(args.manifest, args.limit)
+    if not samples:
+        print("📂 Nessuna registrazione da confrontare (registra qualcosa o usa --manifest)")
+        return 1
+    print(f"🧪 {len(samples)} registrazioni")
+
+    results = asyncio.run(benchmark(samples, args.reference))
+    if not results:
+        print("⚠️ Nessuno stadio confrontabile: aggiungi i riferimenti al manifest o configura GOOGLE_API_KEY")
+        return 1
+    selected = select(results)
+    print_table(results, selected)
+    for stage in MIN_ACCURACY:
+        if stage in results and stage not in selected:
+            print(f"⚠️ Nessun motore di {stage} raggiunge la soglia: resta il default")
+
+    if args.dry_run:
+        print("\nℹ️ --dry-run: scelta non salvata")
+        return 0
+    report = {"timestamp": datetime.now().isoformat(), "recordings": len(samples),
+              "reference": args.reference, "selected": selected, "results": results}
+    atomic_write_bytes(Config.ENGINE_SELECTION_PATH,
+                       json.dumps(report, indent=2, ensure_ascii=False).encode("utf-8"))
+    print(f"\n💾 Scelta salvata: {Config.ENGINE_SELECTION_PATH}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Confronto dei motori di analisi VibeTalking")
+    parser.add_argument("--manifest", default=None, help="JSONL con audio e riferimenti")
+    parser.add_argument("--limit", type=int, default=10, help="registrazioni da usare (0 = tutte nel manifest)")
+    parser.add_argument("--reference", default="gemini", help="motore che fa da riferimento dove manca")
+    parser.add_argument("--dry-run", action="store_true", help="mostra la scelta senza salvarla")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,504 @@
+"""
+Motori intercambiabili per trascrizione, tono e riassunto
+
+Ogni stadio dell'analisi è svolto da un *motore* registrato per nome:
+
+================  ==========================================================
+stadio            motori
+================  ==========================================================
+transcription     ``gemini`` (``datapizza_analyzer``), ``speech`` (Google
+                  Speech-to-Text via REST), ``demo`` (testo in base alla durata)
+tone              ``gemini``, ``keywords`` (lessico locale)
+summary           ``gemini``, ``extractive`` (frasi del testo)
+================  ==========================================================
+
+I motori restituiscono ``(output, valido)``: un output non valido è un
+fallback, che non va salvato nei checkpoint. Il motore di ogni stadio si
+sceglie con ``TRANSCRIPTION_ENGINE`` / ``TONE_ENGINE`` / ``SUMMARY_ENGINE``;
+con ``auto`` (default) vale la scelta salvata da ``python -m
+src.ai.enginebench`` in ``recordings/engine_selection.json``, altrimenti
+``gemini``.
+
+Qui vivono anche la logica di fallback, lo schema dei risultati e lo
+streaming degli eventi comuni a ``AudioAnalyzer`` e ``DataPizzaAudioAnalyzer``
+(``BaseAnalyzer``).
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import time
+from datetime import datetime
+from typing import (Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Protocol, Set, Tuple,
+                    runtime_checkable)
+
+from ..config import Config
+from ..audio.wav_reader import WavFile, audio_duration
+from ..utils.storage import save_results
+from .deadline import current_deadline, model_call_timeout, run_model_call
+from .events import MediaPrepared, Saved, StageEvent, SummaryReady, ToneReady, TranscriptReady
+
+STAGE_ENGINE_SETTINGS = {
+    "transcription": "TRANSCRIPTION_ENGINE",
+    "tone": "TONE_ENGINE",
+    "summary": "SUMMARY_ENGINE",
+}
+# Motore locale di ogni stadio: modalità demo e fallback
+LOCAL_ENGINES = {"transcription": "demo", "tone": "keywords", "summary": "extractive"}
+# Motori che non analizzano davvero l'input: mai scelti con ``auto``
+SIMULATED_ENGINES = {"demo"}
+
+
+# -- Protocolli ------------------------------------------------------------
+
+@runtime_checkable
+class TranscriptionEngine(Protocol):
+    name: str
+
+    def key_parts(self) -> Tuple: ...
+
+    async def transcribe(self, audio_path: str, media_block: Any = None) -> Tuple[str, bool]: ...
+
+
+@runtime_checkable
+class ToneEngine(Protocol):
+    name: str
+
+    def key_parts(self) -> Tuple: ...
+
+    async def analyze(self, text: str) -> Tuple[Dict, bool]: ...
+
+
+@runtime_checkable
+class SummaryEngine(Protocol):
+    name: str
+
+    def key_parts(self) -> Tuple: ...
+
+    async def summarize(self, text: str) -> Tuple[str, bool]: ...
+
+
+@runtime_checkable
+class AnalyzerProtocol(Protocol):
+    """Interfaccia comune degli analyzer usata da console e strumenti"""
+
+    google_client: Any
+
+    async def analyze_audio_file(self, audio_file_path: str, **kwargs: Any) -> Dict: ...
+
+    def stream_analysis(self, audio_file_path: str, **kwargs: Any) -> AsyncIterator[StageEvent]: ...
+
+    def start_warmup(self) -> Optional[Any]: ...
+
+    def save_analysis_results(self, results: Dict, output_file: Optional[str] = None) -> str: ...
+
+
+# -- Logica locale condivisa -------------------------------------------------
+
+TONE_KEYWORDS = {
+    "entusiasta": ["fantastico", "eccellente", "meraviglioso", "entusiasta", "incredibile", "straordinario"],
+    "felice": ["felice", "contento", "soddisfatto", "allegro", "gioioso", "bene", "ottimo"],
+    "calmo": ["tranquillo", "calmo", "rilassato", "sereno", "pacifico", "neutrale"],
+    "preoccupato": ["preoccupato", "ansioso", "nervoso", "dubbioso", "incerto", "problema"],
+    "arrabbiato": ["arrabbiato", "furioso", "irritato", "infastidito", "sbagliato", "errore"],
+    "triste": ["triste", "deluso", "sconfortato", "male", "difficile", "peccato"],
+    "eccitato": ["eccitato", "emozionante", "incredibile", "wow", "fantastico", "stupendo"],
+}
+
+TONE_DESCRIPTIONS = {
+    "entusiasta": "Il parlante mostra grande entusiasmo e energia positiva",
+    "felice": "Il tono è positivo e soddisfatto",
+    "calmo": "Il parlante mantiene un tono equilibrato e sereno",
+    "preoccupato": "Si percepisce una certa preoccupazione o ansia",
+    "arrabbiato": "Il tono indica frustrazione o irritazione",
+    "triste": "Il parlante sembra deluso o sconfortato",
+    "eccitato": "Grande eccitazione ed energia nel discorso",
+    "neutrale": "Tono equilibrato senza particolari emozioni",
+}
+
+TONE_SUGGESTIONS = {
+    "entusiasta": ["Mantieni questa energia positiva", "Condividi il tuo entusiasmo con gli altri"],
+    "felice": ["Continua con questo atteggiamento positivo", "La tua soddisfazione è contagiosa"],
+    "calmo": ["Ottimo controllo emotivo", "La calma aiuta la comunicazione"],
+    "preoccupato": ["Cerca di identificare le cause della preoccupazione", "Respira profondamente"],
+    "arrabbiato": ["Prova a fare una pausa", "Considera il punto di vista degli altri"],
+    "triste": ["È normale sentirsi così a volte", "Cerca supporto se necessario"],
+    "eccitato": ["Canalizza questa energia in modo produttivo", "Condividi il tuo entusiasmo"],
+    "neutrale": ["Considera di aggiungere più espressività", "Va bene essere equilibrati"],
+}
+
+
+def keyword_tone_analysis(text: str) -> Dict:
+    """Analisi del tono basata su parole chiave"""
+    text_lower = text.lower()
+    tone_scores = {tone: sum(1 for keyword in keywords if keyword in text_lower)
+                   for tone, keywords in TONE_KEYWORDS.items()}
+
+    if max(tone_scores.values()) == 0:
+        main_tone, intensity, confidence = "neutrale", "media", 60
+    else:
+        main_tone = max(tone_scores, key=tone_scores.get)
+        max_score = tone_scores[main_tone]
+        if max_score >= 3:
+            intensity, confidence = "alta", 85
+        elif max_score >= 2:
+            intensity, confidence = "media", 75
+        else:
+            intensity, confidence = "bassa", 65
+
+    return {
+        "tono_principale": main_tone,
+        "intensità": intensity,
+        "confidenza": confidence,
+        "emozioni_secondarie": [tone for tone, score in tone_scores.items()
+                                if score > 0 and tone != main_tone][:2],
+        "descrizione": TONE_DESCRIPTIONS.get(main_tone, "Tono non identificato"),
+        "suggerimenti": TONE_SUGGESTIONS.get(main_tone, ["Continua così"]),
+    }
+
+
+def extractive_summary(text: str) -> str:
+    """Riassunto con le frasi del testo: le prime due, oppure prima, centrale e ultima"""
+    sentences = text.split('.')
+    if len(sentences) <= 2:
+        return text
+    if len(sentences) <= 4:
+        return '. '.join(s.strip() for s in sentences[:2]) + '.'
+    summary_sentences = [
+        sentences[0],
+        sentences[len(sentences) // 2],
+        sentences[-2] if sentences[-1].strip() == '' else sentences[-1],
+    ]
+    return '. '.join(s.strip() for s in summary_sentences if s.strip()) + '.'
+
+
+def demo_transcription(duration: float) -> str:
+    """Trascrizione simulata in base alla durata"""
+    if duration < 10:
+        return ("Ciao, questo è un test di registrazione breve. Sto testando l'applicazione "
+                "VibeTalking per vedere come funziona l'analisi del tono.")
+    if duration < 30:
+        return ("Salve, questa è una registrazione di media durata. Sto parlando con un tono abbastanza "
+                "neutrale per testare le funzionalità dell'applicazione. Mi sembra che tutto stia "
+                "funzionando correttamente e sono soddisfatto dei risultati.")
+    return ("Buongiorno, questa è una registrazione più lunga per testare le capacità dell'applicazione "
+            "VibeTalking. Sto cercando di variare il mio tono di voce per vedere come l'intelligenza "
+            "artificiale riesce a rilevare le diverse emozioni. Sono molto entusiasta di questo progetto "
+            "e penso che possa essere davvero utile per analizzare le conversazioni e migliorare la "
+            "comunicazione.")
+
+
+def unavailable_tone(description: str = "Analisi non disponibile") -> Dict:
+    return {
+        "tono_principale": "neutrale",
+        "intensità": "media",
+        "confidenza": 50,
+        "emozioni_secondarie": [],
+        "descrizione": description,
+        "suggerimenti": ["Riprova più tardi"],
+    }
+
+
+async def google_speech_transcribe(audio_file_path: str) -> Optional[str]:
+    """Trascrizione con Google Speech-to-Text (REST); None se non disponibile"""
+    try:
+        import certifi
+        import requests
+        from requests.exceptions import SSLError, RequestException
+    except ImportError:
+        print("❌ Libreria 'requests' non trovata. Installa con: uv pip install requests")
+        return None
+
+    try:
+        # Codifica in base64 direttamente dal file mappato in memoria
+        with WavFile(audio_file_path) as wav:
+            audio_base64 = base64.b64encode(wav.raw()).decode('utf-8')
+            sample_rate = wav.sample_rate
+
+        url = f"https://speech.googleapis.com/v1/speech:recognize?key={Config.GOOGLE_API_KEY}"
+        payload = {
+            "config": {
+                "encoding": "LINEAR16",
+                "sampleRateHertz": sample_rate,
+                "languageCode": "it-IT",  # Italiano
+                "enableAutomaticPunctuation": True,
+                "model": "latest_long"  # Modello ottimizzato per audio lunghi
+            },
+            "audio": {
+                "content": audio_base64
+            }
+        }
+
+        # Richiesta nell'executor dei modelli, entro la scadenza dello stadio
+        response = await current_deadline().run("transcription", run_model_call(
+            requests.post,
+            url,
+            json=payload,
+            headers={"Content-Type": "application/json"},
+            timeout=(10, model_call_timeout("transcription")),
+            verify=certifi.where(),
+        ))
+
+        if response.status_code != 200:
+            print(f"⚠️ Google Speech-to-Text non disponibile ({response.status_code}). Uso fallback.")
+            return None
+        result = response.json()
+        transcriptions = [res['alternatives'][0]['transcript']
+                          for res in result.get('results', []) if res.get('alternatives')]
+        if not transcriptions:
+            print("⚠️ Nessuna trascrizione trovata nell'audio")
+            return None
+        return ' '.join(transcriptions)
+
+    except asyncio.TimeoutError:
+        return None
+    except SSLError:
+        print("⚠️ Problema SSL con Google Speech-to-Text. Uso fallback.")
+        return None
+    except RequestException:
+        print("⚠️ Errore di rete con Google Speech-to-Text. Uso fallback.")
+        return None
+    except Exception as e:
+        print(f"⚠️ Errore inatteso con Google Speech-to-Text ({e}). Uso fallback.")
+        return None
+
+
+# -- Motori locali e REST ------------------------------------------------------
+
+class DemoTranscription:
+    """Testo simulato in base alla durata (nessuna trascrizione reale)"""
+    name = "demo"
+
+    def __init__(self, **_: Any) -> None:
+        pass
+
+    def key_parts(self) -> Tuple:
+        return (self.name,)
+
+    async def transcribe(self, audio_path: str, media_block: Any = None) -> Tuple[str, bool]:
+        return demo_transcription(audio_duration(audio_path, default=15.0)), True
+
+
+class SpeechToTextTranscription:
+    """Google Speech-to-Text via REST, con il testo demo come fallback"""
+    name = "speech"
+
+    def __init__(self, **_: Any) -> None:
+        pass
+
+    def key_parts(self) -> Tuple:
+        return (self.name, "latest_long", "it-IT")
+
+    async def transcribe(self, audio_path: str, media_block: Any = None) -> Tuple[str, bool]:
+        text = await google_speech_transcribe(audio_path) if Config.GOOGLE_API_KEY else None
+        if text:
+            return text, True
+        return demo_transcription(audio_duration(audio_path, default=15.0)), False
+
+
+class KeywordTone:
+    """Tono dal lessico locale"""
+    name = "keywords"
+
+    def __init__(self, **_: Any) -> None:
+        pass
+
+    def key_parts(self) -> Tuple:
+        return (self.name,)
+
+    async def analyze(self, text: str) -> Tuple[Dict, bool]:
+        return keyword_tone_analysis(text), True
+
+
+class ExtractiveSummary:
+    """Riassunto con le frasi del testo"""
+    name = "extractive"
+
+    def __init__(self, **_: Any) -> None:
+        pass
+
+    def key_parts(self) -> Tuple:
+        return (self.name,)
+
+    async def summarize(self, text: str) -> Tuple[str, bool]:
+        return extractive_summary(text), True
+
+
+# -- Registro --------------------------------------------------------------
+
+_ENGINES: Dict[str, Dict[str, Callable[..., Any]]] = {stage: {} for stage in STAGE_ENGINE_SETTINGS}
+
+
+def register_engine(stage: str, name: str, factory: Callable[..., Any]) -> None:
+    """Registra ``factory(client=, model=, temperature=)`` come motore ``name`` di ``stage``"""
+    _ENGINES[stage][name] = factory
+
+
+def engine_names(stage: str) -> List[str]:
+    return list(_ENGINES[stage])
+
+
+def create_engine(stage: str, name: str, **kwargs: Any) -> Any:
+    try:
+        factory = _ENGINES[stage][name]
+    except KeyError:
+        raise ValueError(f"motore '{name}' sconosciuto per lo stadio {stage} "
+                         f"(disponibili: {', '.join(engine_names(stage))})") from None
+    return factory(**kwargs)
+
+
+register_engine("transcription", "demo", DemoTranscription)
+register_engine("transcription", "speech", SpeechToTextTranscription)
+register_engine("tone", "keywords", KeywordTone)
+register_engine("summary", "extractive", ExtractiveSummary)
+
+
+def load_selection() -> Dict[str, str]:
+    """Motori scelti dall'ultimo confronto (vuoto se non è mai stato eseguito)"""
+    try:
+        with open(Config.ENGINE_SELECTION_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get("selected", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def create_analyzer() -> AnalyzerProtocol:
+    """Analyzer disponibile: ``DataPizzaAudioAnalyzer`` se c'è datapizzai, altrimenti ``AudioAnalyzer``"""
+    try:
+        from .datapizza_analyzer import DataPizzaAudioAnalyzer
+    except ImportError as e:
+        print(f"⚠️ DataPizzaAudioAnalyzer non disponibile ({e}), uso AudioAnalyzer")
+        from .analyzer import AudioAnalyzer
+        return AudioAnalyzer()
+    return DataPizzaAudioAnalyzer()
+
+
+def chosen_engine(stage: str) -> str:
+    """Motore configurato per lo stadio: variabile d'ambiente, poi confronto, poi ``gemini``"""
+    name = getattr(Config, STAGE_ENGINE_SETTINGS[stage])
+    if name and name != "auto":
+        return name
+    selected = load_selection().get(stage, "gemini")
+    return "gemini" if selected in SIMULATED_ENGINES else selected
+
+
+# -- Base comune degli analyzer ------------------------------------------------
+
+class BaseAnalyzer:
+    """Schema dei risultati, fallback, eventi e salvataggio condivisi dagli analyzer
+
+    Le sottoclassi implementano ``analyze_audio_file(path, on_event=...,
+    **opzioni)`` chiamando ``on_event`` con gli eventi di ``events``;
+    ``stream_analysis`` ne ricava l'iteratore asincrono.
+    """
+
+    ANALYZER_NAME = "base"
+    RESULTS_PREFIX = "analysis"
+    google_client: Any = None  # client del modello, se l'analyzer ne usa uno
+
+    def start_warmup(self) -> Optional[Any]:
+        """Riscaldamento dei client durante la registrazione (None se non serve)"""
+        return None
+
+    async def analyze_audio_file(self, audio_file_path: str,
+                                 on_event: Optional[Callable[[StageEvent], None]] = None,
+                                 **kwargs: Any) -> Dict:
+        raise NotImplementedError
+
+    async def stream_analysis(self, audio_file_path: str, force_stages: Iterable[str] = (),
+                              use_dedup: bool = True, save: bool = True,
+                              deadline_s: Optional[float] = None) -> AsyncIterator[StageEvent]:
+        """Come ``analyze_audio_file``, ma produce gli eventi degli stadi appena pronti
+
+        L'ultimo evento è ``Saved`` con i risultati completi (salvati solo se
+        ``save``). Se chi consuma smette di iterare, l'analisi viene annullata.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self.analyze_audio_file(audio_file_path, force_stages=force_stages,
+                                                           use_dedup=use_dedup, on_event=queue.put_nowait,
+                                                           deadline_s=deadline_s))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        emit = self._emitter(audio_file_path, queue.put_nowait)
+        seen: Set[str] = set()
+        try:
+            while (event := await queue.get()) is not None:
+                seen.add(event.kind)
+                yield event
+            results = task.result()
+        finally:
+            if not task.done():
+                task.cancel()
+
+        # Duplicati e fallback completi non passano dagli stadi: le sezioni
+        # mancanti vengono dai risultati finali
+        for event_type, fields in self._result_sections(audio_file_path, results):
+            if event_type.kind not in seen:
+                emit(event_type, **fields)
+        output_file = self.save_analysis_results(results) if save else None
+        emit(Saved, output_file=output_file, results=results)
+        while not queue.empty():
+            yield queue.get_nowait()
+
+    @staticmethod
+    def _emitter(audio_file_path: str, on_event: Optional[Callable[[StageEvent], None]]):
+        """Funzione ``emit(tipo, **campi)`` che completa e inoltra gli eventi"""
+        started = time.perf_counter()
+
+        def emit(event_type, **fields) -> None:
+            if on_event is not None:
+                on_event(event_type(file_path=audio_file_path,
+                                    elapsed_s=round(time.perf_counter() - started, 3), **fields))
+        return emit
+
+    @staticmethod
+    def _result_sections(audio_file_path: str, results: Dict) -> List[Tuple[type, Dict]]:
+        """Eventi degli stadi ricavati da risultati già completi"""
+        stages = results.get("stages", {})
+
+        def status(stage: str) -> str:
+            if "deduplicated_from" in results:
+                return "reused"
+            return stages.get(stage, "fallback")
+
+        return [
+            (MediaPrepared, {"duration_s": audio_duration(audio_file_path), "status": status("media")}),
+            (TranscriptReady, {"transcription": results.get("transcription", ""),
+                               "status": status("transcription")}),
+            (ToneReady, {"tone_analysis": results.get("tone_analysis", {}),
+                         "tone_timeline": results.get("tone_timeline", []), "status": status("tone")}),
+            (SummaryReady, {"summary": results.get("summary", ""), "status": status("summary")}),
+        ]
+
+    def _get_timestamp(self) -> str:
+        """Timestamp ISO"""
+        return datetime.now().isoformat()
+
+    def _build_results(self, audio_file_path: str, transcription: Optional[str],
+                       tone_analysis: Optional[Dict], summary: Optional[str], **extra: Any) -> Dict:
+        """Risultati nello schema comune; ``extra`` aggiunge campi specifici"""
+        return {
+            "file_path": audio_file_path,
+            "transcription": transcription,
+            "tone_analysis": tone_analysis,
+            "summary": summary,
+            "timestamp": self._get_timestamp(),
+            "analyzer": self.ANALYZER_NAME,
+            **extra,
+            "profile": Config.profile_snapshot(),
+        }
+
+    def _get_fallback_results(self, audio_file_path: str) -> Dict:
+        """Risultati di fallback in caso di errore totale"""
+        return self._build_results(audio_file_path, "Trascrizione non disponibile", unavailable_tone(),
+                                   "Riassunto non disponibile", analyzer=f"{self.ANALYZER_NAME}-fallback")
+
+    def save_analysis_results(self, results: Dict, output_file: Optional[str] = None) -> str:
+        """Salva i risultati dell'analisi in un file JSON"""
+        try:
+            output_file = save_results(results, self.RESULTS_PREFIX, output_file)
+            print(f"💾 Risultati salvati in: {output_file}")
+            return output_file
+        except Exception as e:
+            print(f"❌ Errore nel salvataggio: {e}")
+            return ""
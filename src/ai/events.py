@@ -0,0 +1,89 @@
+"""
+Eventi progressivi dell'analisi
+
+``stream_analysis`` degli analyzer (``engines.BaseAnalyzer``) produce questi
+eventi man mano che gli stadi finiscono, nell'ordine:
+
+    MediaPrepared → TranscriptReady → ToneReady → SummaryReady → Saved
+
+Ogni sezione arriva esattamente una volta, anche quando l'analisi riusa un
+duplicato o ripiega sui risultati di fallback (in quel caso le sezioni
+mancanti vengono ricavate dai risultati finali). ``status`` è quello di
+``results["stages"]``: "computed", "reused" o "fallback".
+
+``event_to_dict`` / ``event_to_json`` servono a inoltrare gli eventi a un
+client, ad esempio come righe NDJSON o Server-Sent Events.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+MEDIA = "media_prepared"
+TRANSCRIPT = "transcript"
+TONE = "tone"
+SUMMARY = "summary"
+SAVED = "saved"
+
+
+class MediaPrepared(NamedTuple):
+    """Audio letto e pronto per il modello"""
+    file_path: str
+    duration_s: Optional[float]
+    status: str
+    elapsed_s: float
+
+    kind = MEDIA
+
+
+class TranscriptReady(NamedTuple):
+    """Trascrizione completa (unione dei segmenti per gli audio lunghi)"""
+    file_path: str
+    transcription: str
+    status: str
+    elapsed_s: float
+
+    kind = TRANSCRIPT
+
+
+class ToneReady(NamedTuple):
+    """Analisi del tono, con la timeline per segmento se disponibile"""
+    file_path: str
+    tone_analysis: Dict[str, Any]
+    tone_timeline: List[Dict[str, Any]]
+    status: str
+    elapsed_s: float
+
+    kind = TONE
+
+
+class SummaryReady(NamedTuple):
+    """Riassunto della trascrizione"""
+    file_path: str
+    summary: str
+    status: str
+    elapsed_s: float
+
+    kind = SUMMARY
+
+
+class Saved(NamedTuple):
+    """Ultimo evento: risultati completi e dove sono stati salvati (None se non salvati)"""
+    file_path: str
+    output_file: Optional[str]
+    results: Dict[str, Any]
+    elapsed_s: float
+
+    kind = SAVED
+
+
+StageEvent = Union[MediaPrepared, TranscriptReady, ToneReady, SummaryReady, Saved]
+
+
+def event_to_dict(event: StageEvent) -> Dict[str, Any]:
+    """Evento serializzabile, con il tipo nel campo ``event``"""
+    return {"event": event.kind, **event._asdict()}
+
+
+def event_to_json(event: StageEvent) -> str:
+    return json.dumps(event_to_dict(event), ensure_ascii=False)
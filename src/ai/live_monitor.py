@@ -0,0 +1,158 @@
+"""
+Monitor del tono in tempo reale durante la registrazione
+
+``LiveToneMonitor.feed`` si aggancia al callback del registratore e copia ogni
+chunk in un buffer circolare degli ultimi ``LIVE_WINDOW_SECONDS`` secondi: è
+un append sotto lock, quindi il thread di lettura non rallenta e l'audio
+registrato su disco non perde nulla.
+
+Un thread separato analizza la finestra ogni ``LIVE_INTERVAL_SECONDS`` secondi
+con la sola prosodia locale (``audio.prosody``). Se il costo di un'analisi
+supera ``LIVE_CPU_BUDGET`` dell'intervallo, l'intervallo si allunga di
+conseguenza. Con ``LIVE_MONITOR_MODEL=true`` la finestra viene anche trascritta
+dal modello (al più una chiamata in corso) e il lessico dell'analisi di
+fallback raffina il tono provvisorio.
+"""
+from __future__ import annotations
+
+import tempfile
+import threading
+import time
+import wave
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from ..audio.prosody import prosodic_tone, prosody_features
+from ..config import Config
+
+
+class LiveToneMonitor:
+    """Tono provvisorio su finestra scorrevole, aggiornato in background"""
+
+    def __init__(self, sample_rate: Optional[int] = None, channels: Optional[int] = None,
+                 window_s: Optional[float] = None, interval_s: Optional[float] = None,
+                 client: Any = None) -> None:
+        self.sample_rate = sample_rate or Config.SAMPLE_RATE
+        self.channels = channels or Config.CHANNELS
+        self.window_s = window_s or Config.LIVE_WINDOW_SECONDS
+        self.interval_s = interval_s or Config.LIVE_INTERVAL_SECONDS
+        self.client = client
+        self._max_bytes = int(self.window_s * self.sample_rate) * self.channels * 2
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._model_busy = False
+        self._lexicon: Optional[Dict] = None
+        self.started_at = 0.0
+        self.current: Optional[Dict] = None
+        self.updates = 0
+        self.bytes_seen = 0
+        self.analysis_ms = 0.0
+
+    # -- Lato registratore -------------------------------------------------
+
+    def feed(self, chunk: bytes) -> None:
+        """Callback del registratore: solo copia nel buffer"""
+        with self._lock:
+            self._buffer += chunk
+            self.bytes_seen += len(chunk)
+            # Taglio ammortizzato: si sposta memoria solo ogni finestra
+            if len(self._buffer) > 2 * self._max_bytes:
+                del self._buffer[:len(self._buffer) - self._max_bytes]
+
+    # -- Ciclo di analisi --------------------------------------------------
+
+    def start(self) -> None:
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="live-tone", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _window(self) -> bytes:
+        with self._lock:
+            return bytes(self._buffer[-self._max_bytes:])
+
+    def _loop(self) -> None:
+        wait = self.interval_s
+        while not self._stop.wait(wait):
+            started = time.perf_counter()
+            try:
+                self._analyze(self._window())
+            except Exception as e:
+                self.current = {"errore": str(e)}
+            cost = time.perf_counter() - started
+            self.analysis_ms = cost * 1000
+            # Budget di CPU: costo / intervallo non oltre LIVE_CPU_BUDGET
+            wait = max(self.interval_s, cost / max(Config.LIVE_CPU_BUDGET, 0.01))
+
+    def _analyze(self, window: bytes) -> None:
+        frame_bytes = 2 * self.channels
+        window = window[: len(window) - len(window) % frame_bytes]
+        samples = array("h", window)
+        if self.channels > 1:
+            samples = samples[::self.channels]
+        features = prosody_features(samples, self.sample_rate)
+        if features is None:
+            return
+
+        tone = prosodic_tone(features)
+        tone["fonte"] = "prosodia"
+        lexicon = self._lexicon
+        if lexicon and time.monotonic() - lexicon["at"] < 2 * self.window_s:
+            if lexicon["tono_principale"] != "neutrale":
+                tone.update(tono_principale=lexicon["tono_principale"],
+                            confidenza=max(tone["confidenza"], lexicon["confidenza"]))
+            tone["fonte"] = "prosodia+lessico"
+            tone["testo"] = lexicon["testo"]
+
+        tone["secondi"] = round(time.monotonic() - self.started_at, 1)
+        self.current = tone
+        self.updates += 1
+
+        if self.client is not None and not self._model_busy:
+            self._model_busy = True
+            threading.Thread(target=self._model_pass, args=(window,), daemon=True).start()
+
+    def _model_pass(self, window: bytes) -> None:
+        """Trascrizione della finestra e tono lessicale (una chiamata alla volta)"""
+        from .datapizza_analyzer import (AudioToMediaBlockComponent, AudioTranscriptionComponent,
+                                         ToneAnalysisComponent)
+        try:
+            with tempfile.TemporaryDirectory(prefix="vibetalking-live-") as tmp:
+                path = Path(tmp) / "window.wav"
+                with wave.open(str(path), "wb") as wf:
+                    wf.setnchannels(self.channels)
+                    wf.setsampwidth(2)
+                    wf.setframerate(self.sample_rate)
+                    wf.writeframes(window)
+                media_block = AudioToMediaBlockComponent()._run(str(path))
+                transcription_comp = AudioTranscriptionComponent(self.client)
+                text = transcription_comp._run(media_block).content
+            if not transcription_comp.used_fallback and text.strip():
+                lexical = ToneAnalysisComponent(None)._fallback_tone_analysis(text)
+                self._lexicon = {
+                    "tono_principale": lexical["tono_principale"],
+                    "confidenza": lexical["confidenza"],
+                    "testo": text[-80:],
+                    "at": time.monotonic(),
+                }
+        except Exception:
+            pass
+        finally:
+            self._model_busy = False
+
+    def indicator(self) -> str:
+        """Riga breve per la console"""
+        if not self.current:
+            return "🎭 …"
+        if "errore" in self.current:
+            return "🎭 n/d"
+        return f"🎭 {self.current['tono_principale']} ({self.current['intensità']})"
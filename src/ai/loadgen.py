@@ -0,0 +1,243 @@
+"""
+Generatore di carico per la pipeline di analisi
+
+Sintetizza N registrazioni con il segnale del registratore demo
+(``stage_synthesize``, nel pool di processi) e le fa arrivare a
+``DataPizzaAudioAnalyzer`` con arrivi di Poisson alla frequenza indicata
+(0 = tutte insieme). Il modello è ``StubModelServer``, con latenza, capacità
+ed errori configurabili; pool di client, router e componenti sono quelli
+reali. Checkpoint, deduplicazione e log di routing sono dirottati in una
+cartella temporanea, quindi i dati dell'utente non vengono toccati.
+
+Con più frequenze (``--rates 1,2,4,8``) il carico viene ripetuto per
+ciascuna e il report mostra la curva di saturazione: throughput ottenuto e
+latenze al crescere del carico offerto. Il report completo viene salvato in
+``recordings/loadgen/``.
+
+    python -m src.ai.loadgen --recordings 50 --rates 0 --length 5-30
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import tempfile
+import time
+import wave
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from ..audio.process_pool import get_stage_runner, stage_synthesize
+from ..config import Config
+from ..utils.storage import atomic_write_bytes, new_id
+from .batching import batch_stats, reset_batch_stats
+from .client_pool import use_client_factory
+from .routing import get_router
+from .stub_server import StubModelServer
+
+
+def _quantile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def synthesize_recordings(count: int, lengths: Tuple[float, float], sample_rate: int,
+                                seed: int, directory: Path) -> List[Tuple[Path, float]]:
+    """WAV sintetici di durata casuale (seed fisso), generati in parallelo"""
+    rng = random.Random(seed)
+    durations = [rng.uniform(*lengths) for _ in range(count)]
+    runner = get_stage_runner()
+    pcms = await asyncio.gather(*(
+        runner.run(stage_synthesize, n_samples=int(d * sample_rate), sample_rate=sample_rate,
+                   seed=seed + i)
+        for i, d in enumerate(durations)
+    ))
+    recordings = []
+    for i, (pcm, duration) in enumerate(zip(pcms, durations)):
+        path = directory / f"load_{i:04d}.wav"
+        with wave.open(str(path), "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(pcm)
+        recordings.append((path, duration))
+    return recordings
+
+
+async def run_load(analyzer, server: StubModelServer, recordings: List[Tuple[Path, float]],
+                   rate: float, seed: int) -> Dict:
+    """Un passaggio di carico a ``rate`` arrivi al secondo (0 = tutti subito)"""
+    rng = random.Random(seed)
+    offsets, t = [], 0.0
+    for _ in recordings:
+        offsets.append(t)
+        if rate > 0:
+            t += rng.expovariate(rate)
+
+    server.reset_stats()
+    reset_batch_stats()
+    samples: List[Dict] = []
+    in_flight = max_in_flight = 0
+    started = time.perf_counter()
+
+    async def one(path: Path, duration: float, offset: float) -> None:
+        nonlocal in_flight, max_in_flight
+        await asyncio.sleep(max(0.0, started + offset - time.perf_counter()))
+        arrived = time.perf_counter()
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            results = await analyzer.analyze_audio_file(str(path), use_dedup=False)
+        finally:
+            in_flight -= 1
+        if results.get("analyzer") == "datapizzai-fallback":
+            status = "failed"
+        elif "fallback" in results.get("stages", {}).values():
+            status = "degraded"
+        else:
+            status = "ok"
+        samples.append({"latency_s": time.perf_counter() - arrived, "audio_s": duration, "status": status})
+
+    await asyncio.gather(*(one(p, d, o) for (p, d), o in zip(recordings, offsets)))
+    wall = time.perf_counter() - started
+
+    latencies = [s["latency_s"] for s in samples]
+    ok = [s for s in samples if s["status"] == "ok"]
+    return {
+        "offered_rate": rate,
+        "recordings": len(samples),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(samples) / wall, 3) if wall else 0.0,
+        "goodput_rps": round(len(ok) / wall, 3) if wall else 0.0,
+        "audio_realtime_factor": round(sum(s["audio_s"] for s in samples) / wall, 2) if wall else 0.0,
+        "latency_s": {
+            "p50": round(_quantile(latencies, 0.50), 3),
+            "p90": round(_quantile(latencies, 0.90), 3),
+            "p95": round(_quantile(latencies, 0.95), 3),
+            "p99": round(_quantile(latencies, 0.99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        "status": {k: sum(1 for s in samples if s["status"] == k) for k in ("ok", "degraded", "failed")},
+        "max_in_flight": max_in_flight,
+        "server": server.stats(),
+        "batching": batch_stats(),
+    }
+
+
+def print_report(rows: List[Dict]) -> None:
+    print("\n📊 REPORT DI CARICO")
+    print(f"{'offerto/s':>9} {'ottenuto/s':>10} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'ok':>4} {'degr':>4} {'fail':>4} {'coda ms':>8}")
+    for row in rows:
+        offered = f"{row['offered_rate']:g}" if row["offered_rate"] else "burst"
+        lat = row["latency_s"]
+        print(f"{offered:>9} {row['throughput_rps']:>10.2f} {lat['p50']:>7.2f} {lat['p95']:>7.2f} "
+              f"{lat['p99']:>7.2f} {row['status']['ok']:>4} {row['status']['degraded']:>4} "
+              f"{row['status']['failed']:>4} {row['server']['avg_queue_wait_ms']:>8.0f}")
+        for key, stats in row.get("batching", {}).items():
+            if stats["requests"]:
+                print(f"{'':>9} 📦 {key}: {stats['items']} elementi in {stats['requests']} richieste "
+                      f"({stats['split_misses']} ripetuti da soli)")
+
+    if len(rows) < 2:
+        return
+    # Curve di saturazione: il throughput si appiattisce, la p95 esplode
+    top_rps = max(r["throughput_rps"] for r in rows) or 1.0
+    top_p95 = max(r["latency_s"]["p95"] for r in rows) or 1.0
+    print("\n📈 Saturazione (█ throughput, ░ latenza p95)")
+    for row in rows:
+        offered = f"{row['offered_rate']:g}/s" if row["offered_rate"] else "burst"
+        print(f"{offered:>9} █{'█' * round(30 * row['throughput_rps'] / top_rps):<30} "
+              f"{row['throughput_rps']:.2f}/s")
+        print(f"{'':>9} ░{'░' * round(30 * row['latency_s']['p95'] / top_p95):<30} "
+              f"{row['latency_s']['p95']:.2f}s")
+
+
+async def main(args: argparse.Namespace) -> Dict:
+    low, _, high = args.length.partition("-")
+    lengths = (float(low), float(high or low))
+    rates = [float(r) for r in args.rates.split(",") if r.strip()]
+
+    server = StubModelServer(latency_ms=args.latency_ms, jitter=args.jitter, error_rate=args.error_rate,
+                             quota_rate=args.quota_rate, capacity=args.capacity, seed=args.seed)
+    use_client_factory(server.client)
+
+    with tempfile.TemporaryDirectory(prefix="vibetalking-load-") as tmp:
+        work = Path(tmp)
+        # Niente stato persistente dell'utente: ogni passaggio parte da zero
+        Config.CHECKPOINTS_ENABLED = False
+        Config.DEDUP_ENABLED = False
+        Config.ROUTING_LOG = work / "routing.jsonl"
+        Config.ROUTING_STATS = work / "routing_stats.json"
+        Config.GOOGLE_API_KEYS = ",".join(f"stub-key-{i}" for i in range(args.keys))
+        if args.batch_size is not None:
+            Config.BATCH_MAX_SIZE = args.batch_size
+        if args.threads:
+            Config.MODEL_CALL_WORKERS = args.threads
+        if args.batch_wait_ms is not None:
+            Config.BATCH_MAX_WAIT_MS = args.batch_wait_ms
+
+        from .datapizza_analyzer import DataPizzaAudioAnalyzer
+
+        print(f"🎛️ Sintesi di {args.recordings} registrazioni ({lengths[0]:g}-{lengths[1]:g} s)...")
+        recordings = await synthesize_recordings(args.recordings, lengths, args.sample_rate, args.seed, work)
+
+        # L'output della pipeline (decine di righe per registrazione) viene scartato
+        quiet = io.StringIO()
+        pipeline_output = contextlib.nullcontext if args.verbose else lambda: contextlib.redirect_stdout(quiet)
+        with pipeline_output():
+            analyzer = DataPizzaAudioAnalyzer()
+        rows = []
+        for rate in rates:
+            label = f"{rate:g}/s" if rate else "burst"
+            print(f"🚀 Carico {label}...", flush=True)
+            with pipeline_output():
+                rows.append(await run_load(analyzer, server, recordings, rate, args.seed))
+            quiet.seek(0)
+            quiet.truncate()
+        # Le statistiche di routing in sospeso vanno scritte prima di rimuovere la cartella
+        get_router().flush()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parameters": {k: v for k, v in vars(args).items() if k != "report"},
+        "profile": Config.profile_snapshot(),
+        "runs": rows,
+    }
+    print_report(rows)
+    report_path = Path(args.report) if args.report else Config.OUTPUT_DIR / "loadgen" / f"loadgen_{new_id()}.json"
+    atomic_write_bytes(report_path, json.dumps(report, indent=2, ensure_ascii=False).encode("utf-8"))
+    print(f"\n💾 Report salvato: {report_path}")
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Test di carico della pipeline VibeTalking")
+    parser.add_argument("--recordings", type=int, default=50, help="registrazioni per passaggio")
+    parser.add_argument("--rates", default="0",
+                        help="arrivi al secondo, separati da virgola (0 = tutte insieme)")
+    parser.add_argument("--length", default="5-30", help="durata in secondi, es. 10 o 5-30")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="latenza mediana del modello")
+    parser.add_argument("--jitter", type=float, default=0.3, help="dispersione log-normale della latenza")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="frazione di errori 503")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="frazione di errori 429")
+    parser.add_argument("--capacity", type=int, default=16, help="richieste servite insieme dal modello")
+    parser.add_argument("--keys", type=int, default=1, help="API key finte nel pool")
+    parser.add_argument("--threads", type=int, default=0, help="thread per le chiamate ai modelli (0 = dal profilo)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="registrazioni per richiesta raggruppata (default dal profilo, 1 = spento)")
+    parser.add_argument("--batch-wait-ms", type=float, default=None, help="attesa massima per riempire un gruppo")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report", default=None, help="percorso del report JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostra l'output della pipeline")
+    return parser
+
+
+if __name__ == "__main__":
+    asyncio.run(main(build_parser().parse_args()))
@@ -0,0 +1,211 @@
+"""
+Benchmark di memoria della pipeline di analisi
+
+``bench`` analizza registrazioni sintetiche di durate diverse con il profilo
+di memoria attivo (``utils.memprofile``) e con il modello finto locale, poi:
+
+- confronta il picco di ogni durata con il budget
+  ``MEMORY_BUDGET_BASE_MB + MEMORY_BUDGET_MB_PER_MINUTE × minuti``;
+- mostra le differenze per stadio rispetto a un report precedente
+  (``--baseline last`` usa l'ultimo salvato);
+- termina con codice 1 se un budget (o ``--max-regression-pct``) è superato.
+
+``report`` riassume invece ``recordings/memory_profile.jsonl``, scritto
+dalle analisi normali con ``MEMORY_PROFILE=true``: per fascia di durata
+confronta le prime e le ultime analisi per vedere se l'RSS cresce nel tempo.
+
+    python -m src.ai.membench bench --lengths 10,60,180 --baseline last
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ..config import Config
+from ..utils.memprofile import load_records, memory_budget_mb
+from ..utils.storage import atomic_write_bytes, new_id
+from .client_pool import use_client_factory
+from .loadgen import synthesize_recordings
+from .routing import get_router
+from .stub_server import StubModelServer
+
+REPORT_DIR_NAME = "memprofile"
+
+
+def peak_mb(record: Dict) -> float:
+    """Picco usato per il budget: il maggiore tra allocazioni Python e crescita dell'RSS"""
+    total = record["total"]
+    return max(total["traced_peak_mb"], total["rss_growth_mb"])
+
+
+async def run_bench(lengths: List[float], runs: int, sample_rate: int, seed: int) -> List[Dict]:
+    server = StubModelServer(latency_ms=5.0, jitter=0.0, capacity=64, seed=seed)
+    use_client_factory(server.client)
+
+    records: List[Dict] = []
+    with tempfile.TemporaryDirectory(prefix="vibetalking-mem-") as tmp:
+        work = Path(tmp)
+        # Stato dell'utente intatto: checkpoint spenti, log e indice dei
+        # fingerprint (lo stadio resta misurato) in una cartella temporanea
+        Config.MEMORY_PROFILE = True
+        Config.MEMORY_PROFILE_LOG = work / "memory_profile.jsonl"
+        Config.CHECKPOINTS_ENABLED = False
+        Config.FINGERPRINT_DB = work / "fingerprints.sqlite3"
+        Config.ROUTING_LOG = work / "routing.jsonl"
+        Config.ROUTING_STATS = work / "routing_stats.json"
+        Config.GOOGLE_API_KEYS = "stub-key"
+
+        from .datapizza_analyzer import DataPizzaAudioAnalyzer
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            analyzer = DataPizzaAudioAnalyzer()
+        for length in lengths:
+            (path, duration), = await synthesize_recordings(1, (length, length), sample_rate, seed,
+                                                            work)
+            for run in range(runs):
+                print(f"🧪 {length:g} s, esecuzione {run + 1}/{runs}...", flush=True)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results = await analyzer.analyze_audio_file(str(path), use_dedup=False)
+                memory = results["memory"]
+                records.append({"length_s": length, "run": run + 1, **memory})
+            path.unlink()
+        # Le statistiche di routing in sospeso vanno scritte prima di rimuovere la cartella
+        get_router().flush()
+    return records
+
+
+def summarize(records: List[Dict]) -> Dict[str, Dict]:
+    """Per durata: picco peggiore, budget e picchi per stadio"""
+    by_length: Dict[str, Dict] = {}
+    for record in records:
+        key = f"{record['length_s']:g}"
+        entry = by_length.setdefault(key, {"length_s": record["length_s"], "peak_mb": 0.0,
+                                           "budget_mb": round(memory_budget_mb(record["length_s"]), 1),
+                                           "stages": {}})
+        entry["peak_mb"] = max(entry["peak_mb"], peak_mb(record))
+        for stage, stats in record["stages"].items():
+            previous = entry["stages"].get(stage, 0.0)
+            entry["stages"][stage] = max(previous, stats["traced_peak_mb"], stats["rss_growth_mb"])
+        entry["over_budget"] = entry["peak_mb"] > entry["budget_mb"]
+    return by_length
+
+
+def _find_baseline(spec: Optional[str], directory: Path, exclude: Path) -> Optional[Path]:
+    if not spec:
+        return None
+    if spec != "last":
+        return Path(spec)
+    reports = sorted(p for p in directory.glob("bench_*.json") if p != exclude)
+    return reports[-1] if reports else None
+
+
+def print_diff(current: Dict[str, Dict], baseline: Dict[str, Dict]) -> float:
+    """Differenze per durata e stadio; restituisce la regressione peggiore in %"""
+    worst = 0.0
+    print("\n🔀 Confronto con il baseline (MB, + = più memoria)")
+    for key, entry in current.items():
+        old = baseline.get(key)
+        if not old:
+            continue
+        delta = entry["peak_mb"] - old["peak_mb"]
+        pct = 100 * delta / old["peak_mb"] if old["peak_mb"] else 0.0
+        worst = max(worst, pct)
+        print(f"  {key:>6} s  totale {old['peak_mb']:7.1f} → {entry['peak_mb']:7.1f} ({delta:+.1f}, {pct:+.0f}%)")
+        for stage, value in entry["stages"].items():
+            before = old["stages"].get(stage)
+            if before is not None and abs(value - before) >= 0.5:
+                print(f"           {stage:<14} {before:7.1f} → {value:7.1f} ({value - before:+.1f})")
+    return worst
+
+
+def bench(args: argparse.Namespace) -> int:
+    lengths = [float(x) for x in args.lengths.split(",") if x.strip()]
+    records = asyncio.run(run_bench(lengths, args.runs, args.sample_rate, args.seed))
+    summary = summarize(records)
+
+    print("\n🧠 PICCHI DI MEMORIA PER DURATA")
+    for key, entry in summary.items():
+        status = "❌ oltre il budget" if entry["over_budget"] else "✅"
+        stages = ", ".join(f"{s} {v:.1f}" for s, v in sorted(entry["stages"].items(), key=lambda kv: -kv[1])[:4])
+        print(f"  {key:>6} s  picco {entry['peak_mb']:7.1f} MB / budget {entry['budget_mb']:7.1f} MB  {status}")
+        print(f"           {stages}")
+
+    directory = Config.OUTPUT_DIR / REPORT_DIR_NAME
+    report_path = directory / f"bench_{new_id()}.json"
+    report = {"sample_rate": args.sample_rate, "profile": Config.profile_snapshot(),
+              "summary": summary, "records": records}
+
+    failed = any(entry["over_budget"] for entry in summary.values())
+    baseline_path = _find_baseline(args.baseline, directory, report_path)
+    if baseline_path and baseline_path.exists():
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            worst = print_diff(summary, json.load(f)["summary"])
+        report["baseline"] = str(baseline_path)
+        if args.max_regression_pct is not None and worst > args.max_regression_pct:
+            print(f"❌ Regressione del {worst:.0f}% oltre il limite del {args.max_regression_pct:g}%")
+            failed = True
+    elif args.baseline:
+        print("ℹ️ Nessun report precedente da confrontare")
+
+    atomic_write_bytes(report_path, json.dumps(report, indent=2, ensure_ascii=False).encode("utf-8"))
+    print(f"\n💾 Report salvato: {report_path}")
+    return 1 if failed else 0
+
+
+def report(args: argparse.Namespace) -> int:
+    records = [r for r in load_records() if r.get("duration_s")]
+    if not records:
+        print("📂 Nessun profilo di memoria (attiva MEMORY_PROFILE=true e analizza qualche audio)")
+        return 0
+
+    buckets: Dict[int, List[Dict]] = defaultdict(list)
+    for record in records:
+        buckets[int(record["duration_s"] // 60)].append(record)
+
+    print("🧠 PROFILI DI MEMORIA DELLE ANALISI")
+    over = 0
+    for minute in sorted(buckets):
+        group = buckets[minute]
+        peaks = [peak_mb(r) for r in group]
+        rss = [r["total"]["rss_peak_mb"] for r in group]
+        budget = memory_budget_mb((minute + 1) * 60)
+        over += sum(1 for p in peaks if p > budget)
+        head, tail = group[: max(1, len(group) // 4)], group[-max(1, len(group) // 4):]
+        trend = (sum(r["total"]["rss_peak_mb"] for r in tail) / len(tail)
+                 - sum(r["total"]["rss_peak_mb"] for r in head) / len(head))
+        print(f"  {minute}-{minute + 1} min: {len(group)} analisi, picco max {max(peaks):.1f} MB "
+              f"(budget {budget:.0f}), RSS {min(rss):.0f}-{max(rss):.0f} MB, tendenza {trend:+.1f} MB")
+
+    latest = records[-1]
+    if latest.get("top_growth"):
+        print("\n📍 Crescita maggiore nell'ultima analisi:")
+        for line in latest["top_growth"][:5]:
+            print(f"   {line}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profilo di memoria della pipeline VibeTalking")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bench_parser = sub.add_parser("bench", help="benchmark su registrazioni sintetiche")
+    bench_parser.add_argument("--lengths", default="10,60,180", help="durate in secondi, separate da virgola")
+    bench_parser.add_argument("--runs", type=int, default=2, help="esecuzioni per durata")
+    bench_parser.add_argument("--sample-rate", type=int, default=Config.SAMPLE_RATE)
+    bench_parser.add_argument("--seed", type=int, default=1)
+    bench_parser.add_argument("--baseline", default=None, help="report da confrontare, o 'last'")
+    bench_parser.add_argument("--max-regression-pct", type=float, default=None,
+                              help="fallisce se un picco cresce oltre questa percentuale")
+
+    sub.add_parser("report", help="riepilogo di recordings/memory_profile.jsonl")
+
+    args = parser.parse_args()
+    sys.exit(bench(args) if args.command == "bench" else report(args))
@@ -0,0 +1,58 @@
+"""
+Ri-analisi in blocco delle registrazioni del catalogo
+
+Ripete ``analyze_audio_file`` su tutte le registrazioni ancora presenti su
+disco o nell'archivio compresso, senza deduplicazione. Grazie ai checkpoint degli stadi, dopo un cambio
+del prompt del tono o del riassunto la trascrizione viene riusata e si pagano
+solo le chiamate testuali. ``--force`` ricalcola comunque gli stadi indicati.
+
+    python -m src.ai.reanalyze --force tone
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional
+
+from ..utils.archive import recording_available
+from ..utils.catalog import get_catalog
+from .checkpoints import STAGES
+from .datapizza_analyzer import DataPizzaAudioAnalyzer
+
+
+async def reanalyze_all(force_stages: Iterable[str] = (), limit: Optional[int] = None) -> Counter:
+    """Ri-analizza e salva; restituisce quanti stadi sono stati riusati/ricalcolati"""
+    analyzer = DataPizzaAudioAnalyzer()
+    paths = [p for p in get_catalog().recording_paths() if recording_available(p)]
+    if limit:
+        paths = paths[-limit:]
+
+    totals: Counter = Counter()
+    for i, path in enumerate(paths, 1):
+        print(f"\n[{i}/{len(paths)}] {Path(path).name}")
+        results = await analyzer.analyze_audio_file(path, force_stages=force_stages, use_dedup=False)
+        analyzer.save_analysis_results(results)
+        for stage, status in results.get("stages", {}).items():
+            totals[(stage, status)] += 1
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ri-analisi delle registrazioni VibeTalking")
+    parser.add_argument("--force", default="",
+                        help=f"stadi da ricalcolare comunque, separati da virgola ({', '.join(STAGES)})")
+    parser.add_argument("--limit", type=int, default=None, help="solo le ultime N registrazioni")
+    args = parser.parse_args()
+
+    force = [s.strip() for s in args.force.split(",") if s.strip()]
+    unknown = set(force) - set(STAGES)
+    if unknown:
+        parser.error(f"stadi sconosciuti: {', '.join(sorted(unknown))}")
+
+    totals = asyncio.run(reanalyze_all(force, args.limit))
+    print("\n📊 Stadi:")
+    for stage in STAGES:
+        print(f"   {stage:<14} riusati {totals[(stage, 'reused')]:>4}  ricalcolati {totals[(stage, 'computed')]:>4}"
+              f"  fallback {totals[(stage, 'fallback')]:>4}")
@@ -0,0 +1,246 @@
+"""
+Routing dei modelli per stadio e dimensione dell'input
+
+Per ogni stadio il router sceglie tra più backend, dal più economico:
+
+- ``local``:   analisi lessicale locale, per testi troppo corti per valere una chiamata
+- ``light``:   modello leggero (``Config.MODEL_LIGHT``) per tono e riassunto
+- ``default``: il modello standard (``Config.MODEL_DEFAULT``)
+- ``long``:    modello a contesto lungo (``Config.MODEL_LONG_CONTEXT``) per audio lunghi
+
+Tra i candidati ammessi per l'input si prende il primo il cui p90 di latenza
+misurata rispetta ``Config.ROUTING_SLO_MS``; se nessuno lo rispetta, quello con
+p90 più basso. Un backend senza misure è considerato nei limiti, così viene
+provato e inizia ad accumulare campioni.
+
+Le latenze sono istogrammi a bucket logaritmici per (stadio, modello), salvati
+in ``recordings/routing_stats.json`` dalla coda di scritture in background (al
+più una scrittura in sospeso, più l'ultima all'uscita). Ogni decisione viene aggiunta a
+``recordings/routing.jsonl`` con candidati, stime e latenza osservata.
+"""
+from __future__ import annotations
+
+import atexit
+import bisect
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from ..config import Config
+from ..utils.storage import atomic_write_bytes, get_write_queue
+
+# Limiti superiori dei bucket in millisecondi (l'ultimo raccoglie il resto)
+BUCKETS_MS = [50 * 2 ** (i / 2) for i in range(24)]
+
+LOCAL = "local"
+LIGHT = "light"
+DEFAULT = "default"
+LONG = "long"
+
+
+class LatencyHistogram:
+    """Istogramma delle latenze a bucket esponenziali"""
+
+    def __init__(self, counts: Optional[List[int]] = None) -> None:
+        self.counts = list(counts) if counts else [0] * (len(BUCKETS_MS) + 1)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def record(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Limite superiore del bucket che contiene il quantile ``q``"""
+        total = self.total
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else BUCKETS_MS[-1] * 2
+        return BUCKETS_MS[-1] * 2
+
+
+class RouteDecision(NamedTuple):
+    stage: str
+    backend: str
+    model: Optional[str]
+    reason: str
+    input_size: float
+    estimates: Dict[str, Optional[float]]
+
+
+class ModelRouter:
+    """Sceglie il backend di ogni stadio sotto uno SLO di latenza"""
+
+    def __init__(self, stats_path: Optional[Path] = None, log_path: Optional[Path] = None) -> None:
+        self.stats_path = Path(stats_path or Config.ROUTING_STATS)
+        self.log_path = Path(log_path or Config.ROUTING_LOG)
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._dirty = False
+        self._flush_pending = False
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                for key, counts in json.load(f).items():
+                    if len(counts) == len(BUCKETS_MS) + 1:
+                        self.histograms[key] = LatencyHistogram(counts)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def model_for(backend: str) -> Optional[str]:
+        return {
+            LIGHT: Config.MODEL_LIGHT,
+            DEFAULT: Config.MODEL_DEFAULT,
+            LONG: Config.MODEL_LONG_CONTEXT,
+        }.get(backend)
+
+    def _candidates(self, stage: str, input_size: float) -> List[str]:
+        """Backend ammessi per lo stadio, dal più economico"""
+        if stage == "transcription":
+            # input_size = durata in secondi: oltre la soglia serve il contesto lungo
+            return [LONG] if input_size > Config.ROUTING_LONG_AUDIO_SECONDS else [DEFAULT, LONG]
+        # input_size = numero di parole della trascrizione
+        if input_size < Config.ROUTING_SHORT_TEXT_WORDS:
+            return [LOCAL]
+        return [LIGHT, DEFAULT]
+
+    def estimate(self, stage: str, backend: str) -> Optional[float]:
+        """p90 della latenza misurata in ms (None se mancano campioni)"""
+        if backend == LOCAL:
+            return 0.0
+        with self._lock:
+            histogram = self.histograms.get(f"{stage}:{self.model_for(backend)}")
+        return histogram.quantile(0.9) if histogram else None
+
+    def choose(self, stage: str, input_size: float) -> RouteDecision:
+        if not Config.ROUTING_ENABLED:
+            return RouteDecision(stage, DEFAULT, Config.MODEL_DEFAULT, "routing disattivato", input_size, {})
+
+        candidates = self._candidates(stage, input_size)
+        estimates = {backend: self.estimate(stage, backend) for backend in candidates}
+        slo = Config.ROUTING_SLO_MS
+
+        for backend in candidates:
+            p90 = estimates[backend]
+            if p90 is None or p90 <= slo:
+                if backend == LOCAL:
+                    reason = f"input corto ({input_size:g} < {Config.ROUTING_SHORT_TEXT_WORDS} parole)"
+                elif backend == LONG and len(candidates) == 1:
+                    reason = f"audio lungo ({input_size:.0f}s > {Config.ROUTING_LONG_AUDIO_SECONDS}s)"
+                elif p90 is None:
+                    reason = "nessuna misura, esplorazione"
+                else:
+                    reason = f"p90 {p90:.0f}ms entro SLO {slo}ms"
+                return RouteDecision(stage, backend, self.model_for(backend), reason, input_size, estimates)
+
+        backend = min(candidates, key=lambda b: estimates[b])
+        return RouteDecision(stage, backend, self.model_for(backend),
+                             f"nessun backend entro SLO {slo}ms, p90 minimo {estimates[backend]:.0f}ms",
+                             input_size, estimates)
+
+    def observe(self, decision: RouteDecision, latency_ms: Optional[float],
+                audio_path: Optional[str] = None, status: str = "computed") -> None:
+        """Registra la latenza di uno stadio eseguito e scrive la decisione nel log"""
+        # Una scadenza è una misura per difetto: basta a spostare le stime verso l'alto
+        if latency_ms is not None and decision.model and status in ("computed", "timeout"):
+            with self._lock:
+                key = f"{decision.stage}:{decision.model}"
+                self.histograms.setdefault(key, LatencyHistogram()).record(latency_ms)
+                self._dirty = True
+            self._schedule_flush()
+
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "audio_path": audio_path,
+            "stage": decision.stage,
+            "input_size": decision.input_size,
+            "backend": decision.backend,
+            "model": decision.model,
+            "reason": decision.reason,
+            "estimates_p90_ms": decision.estimates,
+            "status": status,
+            "latency_ms": round(latency_ms, 1) if latency_ms is not None else None,
+        }
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(self.log_path), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"⚠️ Decisione di routing non registrata: {e}")
+
+    def _snapshot(self) -> bytes:
+        """Istogrammi serializzati; azzera il flag di modifica (da chiamare con il lock)"""
+        self._dirty = False
+        return json.dumps({k: h.counts for k, h in self.histograms.items()}).encode("utf-8")
+
+    def _schedule_flush(self) -> None:
+        """Accoda la scrittura delle statistiche, se non ce n'è già una in sospeso"""
+        with self._lock:
+            if self._flush_pending or not self._dirty:
+                return
+            self._flush_pending = True
+            data = self._snapshot()
+        future = get_write_queue().submit(self.stats_path, data)
+        future.add_done_callback(self._flushed)
+
+    def _flushed(self, future) -> None:
+        with self._lock:
+            self._flush_pending = False
+        if future.exception() is not None:
+            with self._lock:
+                self._dirty = True
+            print(f"⚠️ Statistiche di routing non salvate: {future.exception()}")
+
+    def flush(self) -> None:
+        """Scrive subito le statistiche modificate dopo l'ultima scrittura"""
+        if self._flush_pending:
+            # Prima la scrittura in coda, che contiene dati più vecchi
+            get_write_queue().flush()
+        with self._lock:
+            if not self._dirty:
+                return
+            data = self._snapshot()
+        try:
+            atomic_write_bytes(self.stats_path, data)
+        except OSError as e:
+            print(f"⚠️ Statistiche di routing non salvate: {e}")
+
+    def summary(self) -> Dict[str, Dict]:
+        """p50/p90 e numero di campioni per (stadio, modello)"""
+        with self._lock:
+            return {
+                key: {"n": h.total, "p50_ms": h.quantile(0.5), "p90_ms": h.quantile(0.9)}
+                for key, h in sorted(self.histograms.items())
+            }
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+            # Le misure arrivate mentre una scrittura era in sospeso
+            atexit.register(_router.flush)
+        return _router
+
+
+if __name__ == "__main__":
+    for key, info in get_router().summary().items():
+        print(f"{key:<45} n={info['n']:<5} p50={info['p50_ms']:.0f}ms  p90={info['p90_ms']:.0f}ms")
@@ -0,0 +1,190 @@
+"""
+Server di modello finto per i test di carico
+
+``StubModelServer`` risponde come Gemini ai prompt della pipeline
+(trascrizione, tono in JSON, riassunto) senza rete né quota. Latenza,
+capacità e frequenza degli errori sono iniettabili:
+
+- latenza log-normale con mediana ``latency_ms`` e dispersione ``jitter``;
+- al più ``capacity`` richieste servite insieme, le altre attendono in coda;
+- ``error_rate`` richieste falliscono con un errore del server (503) dopo la
+  latenza, ``quota_rate`` con un errore di quota (429) immediato;
+- con ``timeout`` (come il timeout di lettura di un client HTTP) una richiesta
+  che tra coda e servizio lo supera fallisce con un errore 504 allo scadere.
+
+Le richieste raggruppate di ``batching`` ricevono un array JSON con un
+elemento per registrazione, con la latenza di una richiesta singola.
+
+``StubModelServer.client`` ha la firma di ``GoogleClient`` e si installa con
+``client_pool.use_client_factory``: tutto il resto (pool, router, componenti)
+resta quello di produzione.
+"""
+from __future__ import annotations
+
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from datapizzai.type import TextBlock
+
+SENTENCES = [
+    "Oggi la riunione è andata meglio del previsto.",
+    "Non sono sicuro che riusciremo a consegnare in tempo.",
+    "Mi fa davvero piacere sentirti dopo tanto tempo.",
+    "Dobbiamo ricontrollare i numeri prima di venerdì.",
+    "Sono un po' stanco ma contento del risultato.",
+    "Questa cosa mi preoccupa parecchio, ne parliamo domani.",
+    "Perfetto, allora ci vediamo alle tre in ufficio.",
+]
+TONES = ["entusiasta", "neutrale", "preoccupato", "felice", "calmo", "triste"]
+
+
+class _StubResponse:
+    def __init__(self, text: str) -> None:
+        self.content = [TextBlock(content=text)]
+
+
+class StubClient:
+    """Client con l'interfaccia di ``GoogleClient`` verso lo stub"""
+
+    def __init__(self, server: "StubModelServer", api_key: Optional[str], model: Optional[str]) -> None:
+        self.server = server
+        self.api_key = api_key
+        self.model = model
+
+    def invoke(self, input: str, memory: Any = None, timeout: Optional[float] = None,
+               **kwargs: Any) -> _StubResponse:
+        return self.server.handle(input, self.model, timeout)
+
+
+class StubModelServer:
+    """Modello locale con latenza, capacità ed errori configurabili"""
+
+    def __init__(self, latency_ms: float = 400.0, jitter: float = 0.3, error_rate: float = 0.0,
+                 quota_rate: float = 0.0, capacity: int = 16, seed: Optional[int] = None) -> None:
+        if not 0 <= error_rate <= 1 or not 0 <= quota_rate <= 1:
+            raise ValueError("error_rate e quota_rate vanno espressi tra 0 e 1")
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota_rate = quota_rate
+        self.capacity = max(1, capacity)
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.quota_errors = 0
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.queue_wait_s = 0.0
+            self.service_s = 0.0
+
+    def client(self, api_key: Optional[str] = None, model: Optional[str] = None,
+               temperature: Optional[float] = None, **kwargs: Any) -> StubClient:
+        return StubClient(self, api_key, model)
+
+    # -- Servizio ----------------------------------------------------------
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            self.requests += 1
+            roll = self._rng.random()
+            latency = self.latency_ms * math.exp(self.jitter * self._rng.gauss(0.0, 1.0)) / 1000
+            return roll, latency, self._rng.random()
+
+    def handle(self, prompt: str, model: Optional[str], timeout: Optional[float] = None) -> _StubResponse:
+        roll, latency, pick = self._draw()
+        if roll < self.quota_rate:
+            time.sleep(latency * 0.05)
+            with self._lock:
+                self.quota_errors += 1
+            raise RuntimeError("429 RESOURCE_EXHAUSTED: quota superata (stub)")
+
+        queued = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.errors += 1
+                self.queue_wait_s += time.perf_counter() - queued
+            raise TimeoutError("504 DEADLINE_EXCEEDED: timeout in coda (stub)")
+        try:
+            started = time.perf_counter()
+            with self._lock:
+                self.queue_wait_s += started - queued
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            budget = None if timeout is None else timeout - (started - queued)
+            try:
+                time.sleep(latency if budget is None else max(0.0, min(latency, budget)))
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                    self.service_s += time.perf_counter() - started
+        finally:
+            self._slots.release()
+        if budget is not None and latency > budget:
+            with self._lock:
+                self.errors += 1
+            raise TimeoutError("504 DEADLINE_EXCEEDED: timeout della richiesta (stub)")
+
+        if roll < self.quota_rate + self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise RuntimeError("503 UNAVAILABLE: errore del server (stub)")
+        return _StubResponse(self._answer(prompt, pick))
+
+    @classmethod
+    def _answer(cls, prompt: str, pick: float) -> str:
+        batch = re.search(r"array JSON di oggetti, id da 1 a (\d+)", prompt)
+        if batch:
+            return cls._batch_answer(prompt, int(batch.group(1)), pick)
+        if "JSON" in prompt:
+            tone = TONES[int(pick * len(TONES))]
+            return json.dumps({
+                "tono_principale": tone,
+                "intensità": "media",
+                "confidenza": 60 + int(pick * 40),
+                "emozioni_secondarie": [],
+                "descrizione": f"Tono {tone} (stub)",
+                "suggerimenti": [],
+            }, ensure_ascii=False)
+        start = int(pick * len(SENTENCES))
+        text = " ".join(SENTENCES[(start + i) % len(SENTENCES)] for i in range(3))
+        if "Testo:" in prompt or "riassunto" in prompt.lower():
+            return text.split(".")[0] + "."
+        return text
+
+    @classmethod
+    def _batch_answer(cls, prompt: str, n: int, pick: float) -> str:
+        # Stessa risposta di una richiesta singola, per ogni id
+        single = prompt.replace("array JSON", "").replace("Trascrivi", "")
+        if "tono_principale" in prompt:
+            single += " JSON"
+        field = "testo" if "Trascrivi" in prompt else "riassunto"
+        items = []
+        for i in range(n):
+            answer = cls._answer(single, (pick + 0.37 * i) % 1.0)
+            item = json.loads(answer) if "tono_principale" in prompt else {field: answer}
+            items.append({"id": i + 1, **item})
+        return json.dumps(items, ensure_ascii=False)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            served = self.requests - self.quota_errors
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "quota_errors": self.quota_errors,
+                "max_in_flight": self.max_in_flight,
+                "capacity": self.capacity,
+                "avg_queue_wait_ms": round(1000 * self.queue_wait_s / served, 1) if served else 0.0,
+                "avg_service_ms": round(1000 * self.service_s / served, 1) if served else 0.0,
+            }
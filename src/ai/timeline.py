@@ -0,0 +1,82 @@
+"""
+Timeline del tono per segmenti
+
+Per registrazioni lunghe un'unica etichetta di tono non dice molto: l'audio
+viene diviso su pause e cambi di energia (``audio.segmenter``), ogni segmento
+viene trascritto e analizzato in parallelo e ``rollup`` ricava il tono
+complessivo pesando i segmenti per durata.
+"""
+from __future__ import annotations
+
+import hashlib
+import wave
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from ..audio.wav_reader import WavFile
+
+
+def format_offset(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def write_segment(wav: WavFile, start: float, end: float, target: Path) -> str:
+    """Scrive il segmento come WAV autonomo e ne restituisce il digest del PCM"""
+    pcm = wav.slice(start, end)
+    with wave.open(str(target), "wb") as out:
+        out.setnchannels(wav.channels)
+        out.setsampwidth(wav.sample_width)
+        out.setframerate(wav.sample_rate)
+        out.writeframes(pcm)
+    digest = hashlib.sha256(pcm).hexdigest()
+    pcm.release()
+    return digest
+
+
+def rollup(timeline: List[Dict]) -> Dict:
+    """Tono complessivo dai segmenti, pesati per durata"""
+    tone_weight: Dict[str, float] = defaultdict(float)
+    intensity_weight: Dict[str, float] = defaultdict(float)
+    confidence_sum = confidence_weight = 0.0
+    emotions: List[str] = []
+    suggestions: List[str] = []
+
+    for segment in timeline:
+        weight = max(segment["end"] - segment["start"], 1e-3)
+        tone = segment["tone_analysis"]
+        tone_weight[tone.get("tono_principale") or "sconosciuto"] += weight
+        if tone.get("intensità"):
+            intensity_weight[tone["intensità"]] += weight
+        if isinstance(tone.get("confidenza"), (int, float)):
+            confidence_sum += tone["confidenza"] * weight
+            confidence_weight += weight
+        emotions += [e for e in tone.get("emozioni_secondarie", []) if e not in emotions]
+        suggestions += [s for s in tone.get("suggerimenti", []) if s not in suggestions]
+
+    total = sum(tone_weight.values()) or 1.0
+    ranked = sorted(tone_weight, key=tone_weight.get, reverse=True)
+    main = ranked[0] if ranked else "neutrale"
+
+    changes = []
+    previous = None
+    for segment in timeline:
+        current = segment["tone_analysis"].get("tono_principale")
+        if previous is not None and current != previous:
+            changes.append(f"{previous} → {current} al {format_offset(segment['start'])}")
+        previous = current
+
+    description = f"Tono prevalente {main} ({100 * tone_weight[main] / total:.0f}% della durata)"
+    if changes:
+        description += "; cambi: " + ", ".join(changes)
+
+    return {
+        "tono_principale": main,
+        "intensità": max(intensity_weight, key=intensity_weight.get) if intensity_weight else "media",
+        "confidenza": round(confidence_sum / confidence_weight) if confidence_weight else 50,
+        "emozioni_secondarie": ranked[1:] + [e for e in emotions if e not in ranked],
+        "descrizione": description,
+        "suggerimenti": suggestions[:5],
+        "cambi_di_tono": len(changes),
+    }
@@ -0,0 +1,159 @@
+"""
+Riscaldamento dei client mentre l'utente registra
+
+La prima richiesta dopo una registrazione paga risoluzione DNS, handshake
+TCP/TLS e inizializzazione pigra del client. ``ClientWarmup`` parte in
+background all'inizio della registrazione e, finché questa dura:
+
+1. risolve ``WARMUP_HOST`` e apre (e chiude) una connessione TLS, misurando
+   DNS e handshake;
+2. crea i pool dei modelli che l'analisi userà (``get_client_pool``);
+3. con ``WARMUP_PROBE=true`` invia a ogni chiave una richiesta minima due
+   volte: la prima misura il costo a freddo, la seconda quello a caldo;
+4. ogni ``WARMUP_KEEPALIVE_SECONDS`` ripete la richiesta minima, al più
+   ``WARMUP_MAX_KEEPALIVES`` volte, così la connessione del client non scade
+   prima dell'analisi.
+
+Le richieste minime consumano quota, quindi sono spente per default
+(``WARMUP_PROBE=false`` si limita ai passi 1-2). Rispettano ``MODEL_MAX_RPM``
+(un ping senza slot libero viene saltato) e un errore di quota esclude la
+chiave. I tempi finiscono in ``recordings/warmup_log.jsonl``.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import ssl
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from ..config import Config
+from .client_pool import get_client_pool
+
+PROBE_PROMPT = "Rispondi solo con: ok"
+
+
+def _ms(started: float) -> float:
+    return round(1000 * (time.perf_counter() - started), 1)
+
+
+class ClientWarmup:
+    """Riscalda DNS, connessione e client dei modelli in un thread"""
+
+    def __init__(self, models: Iterable[str], temperature: float,
+                 host: Optional[str] = None, probe: Optional[bool] = None,
+                 keepalive_s: Optional[float] = None) -> None:
+        self.models = list(dict.fromkeys(m for m in models if m))
+        self.temperature = temperature
+        self.host = host if host is not None else Config.WARMUP_HOST
+        self.probe = Config.WARMUP_PROBE if probe is None else probe
+        self.keepalive_s = Config.WARMUP_KEEPALIVE_SECONDS if keepalive_s is None else keepalive_s
+        self.timings: Dict = {"models": {}, "keepalives": 0, "errors": []}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ClientWarmup":
+        self._stop.clear()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="client-warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> Dict:
+        """Ferma i ping (senza attendere una richiesta in corso) e salva i tempi"""
+        self._stop.set()
+        self.timings["duration_s"] = round(time.perf_counter() - self._started, 3)
+        self._append()
+        return self.timings
+
+    @property
+    def ready(self) -> bool:
+        """True quando tutti i passi iniziali sono terminati"""
+        return self.timings.get("ready_ms") is not None
+
+    # -- Passi -------------------------------------------------------------
+
+    def _run(self) -> None:
+        if self.host:
+            self._warm_network()
+        for model in self.models:
+            if self._stop.is_set():
+                return
+            self._warm_model(model)
+        self.timings["ready_ms"] = _ms(self._started)
+
+        while (self.probe and self.keepalive_s > 0 and self.timings["keepalives"] < Config.WARMUP_MAX_KEEPALIVES
+               and not self._stop.wait(self.keepalive_s)):
+            for model in self.models:
+                get_client_pool(model, self.temperature).warm_up(PROBE_PROMPT)
+            self.timings["keepalives"] += 1
+
+    def _warm_network(self) -> None:
+        try:
+            started = time.perf_counter()
+            address = socket.getaddrinfo(self.host, 443, type=socket.SOCK_STREAM)[0][4]
+            self.timings["dns_ms"] = _ms(started)
+
+            started = time.perf_counter()
+            context = ssl.create_default_context()
+            with socket.create_connection(address[:2], timeout=10) as sock:
+                with context.wrap_socket(sock, server_hostname=self.host):
+                    pass
+            self.timings["tls_connect_ms"] = _ms(started)
+        except OSError as e:
+            self.timings["errors"].append(f"{self.host}: {e}")
+
+    def _warm_model(self, model: str) -> None:
+        entry: Dict = {}
+        try:
+            started = time.perf_counter()
+            pool = get_client_pool(model, self.temperature)
+            entry["client_init_ms"] = _ms(started)
+            if self.probe:
+                entry["cold"] = pool.warm_up(PROBE_PROMPT)
+                entry["warm"] = pool.warm_up(PROBE_PROMPT)
+        except Exception as e:
+            self.timings["errors"].append(f"{model}: {e}")
+        self.timings["models"][model] = entry
+
+    # -- Report ------------------------------------------------------------
+
+    @staticmethod
+    def _mean_ms(rows: List[Dict]) -> Optional[float]:
+        values = [r["ms"] for r in rows if r.get("ms") is not None]
+        return sum(values) / len(values) if values else None
+
+    def summary(self) -> str:
+        parts = []
+        if "dns_ms" in self.timings:
+            parts.append(f"DNS {self.timings['dns_ms']:.0f} ms")
+        if "tls_connect_ms" in self.timings:
+            parts.append(f"TCP+TLS {self.timings['tls_connect_ms']:.0f} ms")
+        for model, entry in list(self.timings["models"].items()):
+            text = f"{model} (client {entry.get('client_init_ms', 0):.0f} ms"
+            cold, warm = self._mean_ms(entry.get("cold", [])), self._mean_ms(entry.get("warm", []))
+            if cold is not None and warm is not None:
+                text += f", richiesta {cold:.0f} ms a freddo → {warm:.0f} ms a caldo"
+            parts.append(text + ")")
+        if not self.ready:
+            parts.append("ancora in corso")
+        if self.timings["errors"]:
+            parts.append(f"{len(self.timings['errors'])} errori")
+        return ", ".join(parts) or "nessun dato"
+
+    def _append(self) -> None:
+        # Copie: il thread può ancora aggiungere tempi mentre si serializza
+        record = {"timestamp": datetime.now().isoformat(), "host": self.host, "probe": self.probe,
+                  **dict(self.timings), "models": dict(self.timings["models"])}
+        try:
+            Config.WARMUP_LOG.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(Config.WARMUP_LOG), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"⚠️ Tempi di riscaldamento non salvati: {e}")
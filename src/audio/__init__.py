@@ -24,4 +24,10 @@ except Exception as e:
     from .recorder_demo import AudioRecorder  # type: ignore
     print(f"⚠️ Errore backend audio ({e}), uso demo")
 
-__all__ = ['AudioRecorder']
\ No newline at end of file
+from .fanout import AudioBus, OverflowPolicy, Subscription
+from .process_pool import AudioStageRunner, get_stage_runner
+from .wav_reader import WavFile, WavFormatError, wav_info
+
+__all__ = ['AudioRecorder', 'AudioBus', 'OverflowPolicy', 'Subscription',
+           'AudioStageRunner', 'get_stage_runner',
+           'WavFile', 'WavFormatError', 'wav_info']
\ No newline at end of file
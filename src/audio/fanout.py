@@ -0,0 +1,234 @@
+"""
+Distribuzione dei chunk audio a più consumatori
+
+Il thread che legge dal registratore chiama solo ``AudioBus.publish``: ogni
+sottoscrittore ha una coda limitata e il proprio criterio di overflow, quindi
+un consumatore lento non ferma la lettura da ``arecord`` (e non provoca
+overrun ALSA) né rallenta gli altri.
+
+Criteri di overflow:
+
+- ``block``:       il publisher attende spazio fino a ``AUDIO_BUS_BLOCK_TIMEOUT``
+                   secondi, poi scarta il chunk (conteggiato come drop);
+- ``drop_oldest``: scarta il chunk più vecchio in coda (default, adatto ai
+                   monitor che vogliono l'audio più recente);
+- ``drop_newest``: scarta il chunk appena arrivato.
+
+Per ogni sottoscrittore si tengono chunk consegnati, scartati, ritardo
+corrente e massimo (chunk in coda). Le sottoscrizioni si consumano da thread
+(``get``, iterazione, ``AudioBus.attach_callback``) o da asyncio (``aget``,
+``async for``).
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from ..config import Config
+
+
+class OverflowPolicy:
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+    ALL = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+
+class Subscription:
+    """Coda limitata di un sottoscrittore del bus"""
+
+    def __init__(self, name: str, maxsize: int, policy: str,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        if policy not in OverflowPolicy.ALL:
+            raise ValueError(f"criterio di overflow non valido: {policy}")
+        self.name = name
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self._queue: Deque[bytes] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._loop = loop
+        self._event = asyncio.Event() if loop is not None else None
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.max_lag = 0
+        self.blocked_s = 0.0
+
+    @property
+    def lag(self) -> int:
+        return len(self._queue)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    # -- Lato publisher ----------------------------------------------------
+
+    def _put(self, chunk: bytes) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self.published += 1
+            if len(self._queue) >= self.maxsize:
+                if self.policy == OverflowPolicy.DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                if self.policy == OverflowPolicy.DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    started = time.monotonic()
+                    deadline = started + Config.AUDIO_BUS_BLOCK_TIMEOUT
+                    while len(self._queue) >= self.maxsize and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    self.blocked_s += time.monotonic() - started
+                    if len(self._queue) >= self.maxsize or self._closed:
+                        self.dropped += 1
+                        return
+            self._queue.append(chunk)
+            self.max_lag = max(self.max_lag, len(self._queue))
+            self._cond.notify_all()
+        self._wake_async()
+
+    def _wake_async(self) -> None:
+        if self._loop is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._event.set)
+            except RuntimeError:
+                pass
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._wake_async()
+
+    # -- Lato consumatore (thread) -----------------------------------------
+
+    def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Prossimo chunk; None a sottoscrizione chiusa e svuotata o a timeout"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._queue or self._closed, timeout):
+                return None
+            if not self._queue:
+                return None
+            chunk = self._queue.popleft()
+            self.delivered += 1
+            self._cond.notify_all()
+            return chunk
+
+    def __iter__(self):
+        while True:
+            chunk = self.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    # -- Lato consumatore (asyncio) ----------------------------------------
+
+    async def aget(self) -> Optional[bytes]:
+        if self._event is None:
+            raise RuntimeError("sottoscrizione creata senza event loop")
+        while True:
+            with self._cond:
+                if self._queue:
+                    chunk = self._queue.popleft()
+                    self.delivered += 1
+                    self._cond.notify_all()
+                    return chunk
+                if self._closed:
+                    return None
+                self._event.clear()
+            await self._event.wait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        chunk = await self.aget()
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "policy": self.policy,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+            "blocked_s": round(self.blocked_s, 3),
+        }
+
+
+class AudioBus:
+    """Fan-out dei chunk del registratore verso più sottoscrittori"""
+
+    def __init__(self) -> None:
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, name: str, maxsize: Optional[int] = None, policy: Optional[str] = None,
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        """Nuova coda; passare ``loop`` (o chiamare da una coroutine) per consumarla con asyncio"""
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+        return self._add(Subscription(name, maxsize or Config.AUDIO_BUS_QUEUE_CHUNKS,
+                                      policy or Config.AUDIO_BUS_POLICY, loop))
+
+    def _add(self, subscription: Subscription) -> Subscription:
+        with self._lock:
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+
+    def attach_callback(self, callback: Callable[[bytes], None], name: str = "callback",
+                        maxsize: Optional[int] = None, policy: Optional[str] = None) -> Subscription:
+        """Sottoscrizione servita da un thread dedicato che chiama ``callback``
+
+        Non è mai legata a un event loop, anche se creata da una coroutine: il
+        loop potrebbe essere bloccato proprio dalla registrazione.
+        """
+        subscription = self._add(Subscription(name, maxsize or Config.AUDIO_BUS_QUEUE_CHUNKS,
+                                              policy or Config.AUDIO_BUS_POLICY, None))
+
+        def _dispatch() -> None:
+            for chunk in subscription:
+                try:
+                    callback(chunk)
+                except Exception as e:
+                    print(f"\n⚠️ Errore nel consumatore audio '{name}': {e}")
+
+        threading.Thread(target=_dispatch, name=f"audio-bus-{name}", daemon=True).start()
+        return subscription
+
+    def publish(self, chunk: bytes) -> None:
+        # Copia della lista: subscribe/unsubscribe non bloccano la pubblicazione
+        for subscription in self._subscriptions:
+            subscription._put(chunk)
+
+    def stats(self) -> List[Dict]:
+        return [s.stats() for s in self._subscriptions]
+
+    def close(self) -> None:
+        with self._lock:
+            subscriptions, self._subscriptions = self._subscriptions, []
+        for subscription in subscriptions:
+            subscription.close()
@@ -0,0 +1,281 @@
+"""
+Fingerprint audio per riconoscere registrazioni duplicate
+
+Schema a "landmark" su picchi spettrali: il segnale viene portato a 8 kHz mono,
+si calcola la STFT (tutti i frame in un colpo solo con NumPy), si tengono i
+massimi locali più forti di ogni frame e si codificano coppie di picchi vicini
+come hash a 24 bit ``(f1, f2, Δt)``. Gli hash sopravvivono a ricodifiche e
+piccoli cambi di volume, a differenza di un hash dei byte.
+
+L'indice (``recordings/fingerprints.sqlite3``) associa gli hash alle analisi già
+eseguite: una registrazione è un duplicato quando abbastanza hash coincidono
+con lo stesso offset temporale rispetto a un'altra di durata simile.
+Richiede NumPy; senza, la deduplicazione si disattiva.
+"""
+from __future__ import annotations
+
+import importlib.util
+import json
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from ..config import Config
+
+TARGET_RATE = 8000
+N_FFT = 512
+HOP = 256
+PEAK_TIME_RADIUS = 3      # frame
+PEAK_FREQ_RADIUS = 4      # bin
+PEAKS_PER_FRAME = 5
+FAN_OUT = 8
+MAX_DT = 63               # 6 bit
+FRAMES_PER_SECOND = TARGET_RATE / HOP
+
+
+def fingerprint_available() -> bool:
+    return importlib.util.find_spec("numpy") is not None
+
+
+# ---------------------------------------------------------------------------
+# Calcolo (eseguito nel pool di processi)
+# ---------------------------------------------------------------------------
+
+def _to_mono(pcm, sample_rate: int, channels: int, sample_width: int):
+    import numpy as np
+
+    dtype = {1: "u1", 2: "<i2", 4: "<i4"}[sample_width]
+    x = np.frombuffer(pcm, dtype=dtype).astype(np.float32)
+    if sample_width == 1:
+        x -= 128.0
+    x = x[: len(x) - len(x) % channels].reshape(-1, channels).mean(axis=1)
+
+    if sample_rate != TARGET_RATE and len(x):
+        factor = sample_rate / TARGET_RATE
+        if factor > 1:
+            # Filtro passa-basso grezzo (media mobile) contro l'aliasing
+            k = int(round(factor))
+            x = np.convolve(x, np.ones(k, dtype=np.float32) / k, mode="same")
+        n_out = int(len(x) / factor)
+        x = np.interp(np.arange(n_out) * factor, np.arange(len(x)), x).astype(np.float32)
+    return x
+
+
+def _spectrogram(x):
+    import numpy as np
+
+    n_frames = 1 + (len(x) - N_FFT) // HOP if len(x) >= N_FFT else 0
+    if n_frames <= 0:
+        return np.zeros((0, N_FFT // 2 + 1), dtype=np.float32)
+    index = np.arange(N_FFT)[None, :] + HOP * np.arange(n_frames)[:, None]
+    frames = x[index] * np.hanning(N_FFT).astype(np.float32)
+    return np.log1p(np.abs(np.fft.rfft(frames, axis=1))).astype(np.float32)
+
+
+def _max_filter(spec, radius: int, axis: int):
+    import numpy as np
+
+    out = spec.copy()
+    n = spec.shape[axis]
+    for shift in range(1, radius + 1):
+        if shift >= n:
+            break
+        lead = [slice(None)] * 2
+        lag = [slice(None)] * 2
+        lead[axis], lag[axis] = slice(shift, None), slice(None, -shift)
+        np.maximum(out[tuple(lag)], spec[tuple(lead)], out=out[tuple(lag)])
+        np.maximum(out[tuple(lead)], spec[tuple(lag)], out=out[tuple(lead)])
+    return out
+
+
+def _peaks(spec):
+    import numpy as np
+
+    if spec.size == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    spec = spec[:, 1:]  # niente componente continua
+    neighborhood = _max_filter(_max_filter(spec, PEAK_TIME_RADIUS, 0), PEAK_FREQ_RADIUS, 1)
+    # Soglia robusta rispetto a rumore di fondo e silenzi: mediana + 2 × (p90 - mediana)
+    median = np.median(spec)
+    floor = median + 2 * (np.percentile(spec, 90) - median)
+    t, f = np.nonzero((spec == neighborhood) & (spec > floor))
+    values = spec[t, f]
+
+    # Al più PEAKS_PER_FRAME picchi per frame, i più forti
+    order = np.lexsort((-values, t))
+    t, f = t[order], f[order]
+    rank = np.arange(len(t)) - np.searchsorted(t, t)
+    keep = rank < PEAKS_PER_FRAME
+    t, f = t[keep], f[keep] + 1
+    order = np.lexsort((f, t))
+    return t[order].astype(np.int64), f[order].astype(np.int64)
+
+
+def _landmarks(t, f) -> Tuple:
+    import numpy as np
+
+    hashes, anchors = [], []
+    for j in range(1, FAN_OUT + 1):
+        if j >= len(t):
+            break
+        dt = t[j:] - t[:-j]
+        ok = (dt > 0) & (dt <= MAX_DT)
+        hashes.append((f[:-j][ok] << 15) | (f[j:][ok] << 6) | dt[ok])
+        anchors.append(t[:-j][ok])
+    if not hashes:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    return np.concatenate(hashes), np.concatenate(anchors)
+
+
+def stage_fingerprint(pcm, sample_rate: int, channels: int, sample_width: int) -> Dict:
+    """Stadio per ``AudioStageRunner``: PCM → hash e tempi di ancoraggio"""
+    x = _to_mono(pcm, sample_rate, channels, sample_width)
+    hashes, anchors = _landmarks(*_peaks(_spectrogram(x)))
+    return {
+        "hashes": hashes.tolist(),
+        "times": anchors.tolist(),
+        "duration": len(x) / TARGET_RATE,
+    }
+
+
+async def fingerprint_file(audio_file_path: str) -> Optional[Dict]:
+    """Fingerprint di un WAV, calcolato fuori dall'event loop"""
+    from .process_pool import get_stage_runner
+    from .wav_reader import WavFile
+
+    with WavFile(audio_file_path) as wav:
+        return await get_stage_runner().run(
+            stage_fingerprint, wav.pcm,
+            sample_rate=wav.sample_rate, channels=wav.channels, sample_width=wav.sample_width,
+        )
+
+
+# ---------------------------------------------------------------------------
+# Indice
+# ---------------------------------------------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id         INTEGER PRIMARY KEY,
+    audio_path TEXT NOT NULL,
+    duration   REAL NOT NULL,
+    n_hashes   INTEGER NOT NULL,
+    n_window   INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    results    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fingerprints_duration ON fingerprints(duration);
+
+CREATE TABLE IF NOT EXISTS hashes (
+    hash  INTEGER NOT NULL,
+    fp_id INTEGER NOT NULL REFERENCES fingerprints(id) ON DELETE CASCADE,
+    t     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_hashes_hash ON hashes(hash);
+CREATE INDEX IF NOT EXISTS idx_hashes_fp ON hashes(fp_id);
+"""
+
+
+class FingerprintIndex:
+    """Indice SQLite dei fingerprint con i risultati associati"""
+
+    # Durata massima considerata in ricerca e tolleranza sulla durata
+    QUERY_SECONDS = 30
+    DURATION_TOLERANCE = 0.05
+
+    def __init__(self, db_path: Optional[Path] = None) -> None:
+        self.db_path = Path(db_path or Config.FINGERPRINT_DB)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        if Config.SQLITE_CACHE_KB:
+            self.conn.execute(f"PRAGMA cache_size=-{Config.SQLITE_CACHE_KB}")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def add(self, audio_path: str, fingerprint: Dict, results: Dict) -> int:
+        max_t = self.QUERY_SECONDS * FRAMES_PER_SECOND
+        n_window = sum(1 for t in fingerprint["times"] if t < max_t)
+        with self._lock, self.conn:
+            # Una nuova analisi dello stesso file sostituisce la precedente
+            self.conn.execute("DELETE FROM fingerprints WHERE audio_path = ?", (audio_path,))
+            cur = self.conn.execute(
+                "INSERT INTO fingerprints (audio_path, duration, n_hashes, n_window, created_at, results) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (audio_path, fingerprint["duration"], len(fingerprint["hashes"]), n_window,
+                 datetime.now().isoformat(), json.dumps(results, ensure_ascii=False)),
+            )
+            fp_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO hashes (hash, fp_id, t) VALUES (?, ?, ?)",
+                ((h, fp_id, t) for h, t in zip(fingerprint["hashes"], fingerprint["times"])),
+            )
+        return fp_id
+
+    def lookup(self, fingerprint: Dict) -> Optional[Dict]:
+        """Analisi precedente più simile, con ``similarity`` in [0, 1]"""
+        max_t = self.QUERY_SECONDS * FRAMES_PER_SECOND
+        query = defaultdict(list)
+        for h, t in zip(fingerprint["hashes"], fingerprint["times"]):
+            if t < max_t:
+                query[h].append(t)
+        n_query = sum(len(v) for v in query.values())
+        if not n_query:
+            return None
+
+        duration = fingerprint["duration"]
+        low, high = duration * (1 - self.DURATION_TOLERANCE), duration * (1 + self.DURATION_TOLERANCE)
+        offsets: Counter = Counter()
+        keys = list(query)
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self.conn.execute(
+                    f"""
+                    SELECT h.hash, h.fp_id, h.t FROM hashes h
+                    JOIN fingerprints f ON f.id = h.fp_id
+                    WHERE h.hash IN ({','.join('?' * len(chunk))})
+                      AND f.duration BETWEEN ? AND ?
+                    """,
+                    (*chunk, low, high),
+                )
+                for h, fp_id, t in rows:
+                    for qt in query[h]:
+                        offsets[(fp_id, t - qt)] += 1
+        if not offsets:
+            return None
+
+        best_per_fp: Dict[int, int] = {}
+        for (fp_id, _), count in offsets.items():
+            best_per_fp[fp_id] = max(best_per_fp.get(fp_id, 0), count)
+        fp_id, best = max(best_per_fp.items(), key=lambda item: item[1])
+
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT audio_path, results, n_window FROM fingerprints WHERE id = ?", (fp_id,)
+            ).fetchone()
+        # Rispetto al fingerprint con meno hash: il rumore aggiunto da una
+        # ricodifica crea hash extra che non devono penalizzare la somiglianza
+        return {
+            "audio_path": row[0],
+            "results": json.loads(row[1]),
+            "similarity": min(1.0, best / max(1, min(n_query, row[2]))),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+_index: Optional[FingerprintIndex] = None
+
+
+def get_fingerprint_index() -> FingerprintIndex:
+    global _index
+    if _index is None:
+        _index = FingerprintIndex()
+    return _index
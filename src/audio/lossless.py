@@ -0,0 +1,295 @@
+"""
+Formato compresso senza perdita per l'archivio delle registrazioni
+
+Una *voce* ``VTLA`` contiene un file WAV intero, ricostruibile byte per byte:
+header originale, PCM compresso a blocchi e gli eventuali byte dopo i dati.
+
+    "VTLA" u16 versione u64 lunghezza_voce
+    blocco 1 … blocco N
+    indice JSON (formato, blocchi, header/coda del WAV in base64, sha256)
+    u64 offset_indice u32 lunghezza_indice "VTLA"
+
+Ogni blocco (``ARCHIVE_BLOCK_SECONDS`` di audio) è indipendente: con NumPy e
+PCM intero a 16/32 bit si salva il residuo di un predittore fisso (differenze
+successive di ordine 1-3, nulle a inizio blocco; per blocco si sceglie
+l'ordine con il residuo più piccolo), nel tipo intero più stretto che lo
+contiene, con i byte separati per piano e compressi con zlib. Senza NumPy,
+o per altri formati, il blocco è il PCM compresso con zlib. La decodifica di
+un intervallo legge e decomprime solo i blocchi che lo coprono.
+
+Le voci si possono concatenare in un *pack*: ``scan_entries`` le ritrova
+seguendo le lunghezze, senza un indice esterno.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import importlib.util
+import json
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from .wav_reader import WAVE_FORMAT_PCM, WavFile, WavFormatError
+
+PathLike = Union[str, Path]
+
+MAGIC = b"VTLA"
+VERSION = 1
+_HEADER = struct.Struct("<4sHQ")
+_FOOTER = struct.Struct("<QI4s")
+
+MODE_RAW = 0        # PCM + zlib
+MAX_ORDER = 3       # modi 1-3: residuo del predittore fisso di quell'ordine + piani di byte + zlib
+
+_HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+class ArchiveFormatError(ValueError):
+    """Voce d'archivio assente, troncata o non interpretabile"""
+
+
+# -- Blocchi -------------------------------------------------------------------
+
+def _encode_block(pcm: memoryview, channels: int, sample_width: int, format_tag: int,
+                  level: int) -> Tuple[bytes, int, int]:
+    """(dati, modo, byte per residuo) di un blocco"""
+    if _HAS_NUMPY and format_tag == WAVE_FORMAT_PCM and sample_width in (2, 4):
+        import numpy as np
+
+        residual = np.frombuffer(pcm, dtype=f"<i{sample_width}").reshape(-1, channels).astype(np.int64)
+        best, order, cost = residual, 0, None
+        for candidate in range(1, MAX_ORDER + 1):
+            residual = np.diff(residual, axis=0, prepend=0)
+            candidate_cost = int(np.abs(residual).sum())
+            if cost is None or candidate_cost < cost:
+                best, order, cost = residual, candidate, candidate_cost
+        residual = best
+        width = 8
+        for candidate in (2, 4):
+            info = np.iinfo(f"i{candidate}")
+            if residual.size == 0 or (residual.min() >= info.min and residual.max() <= info.max):
+                width = candidate
+                break
+        planes = residual.astype(f"<i{width}").view(np.uint8).reshape(-1, width).T
+        return zlib.compress(planes.tobytes(), level), order, width
+    return zlib.compress(bytes(pcm), level), MODE_RAW, 0
+
+
+def _decode_block(data: bytes, mode: int, width: int, frames: int, channels: int,
+                  sample_width: int) -> bytes:
+    raw = zlib.decompress(data)
+    if mode == MODE_RAW:
+        return raw
+    if not 1 <= mode <= MAX_ORDER:
+        raise ArchiveFormatError(f"modo di blocco sconosciuto: {mode}")
+    if not _HAS_NUMPY:
+        raise ArchiveFormatError("la decodifica di questo archivio richiede NumPy")
+    import numpy as np
+
+    planes = np.frombuffer(raw, dtype=np.uint8).reshape(width, -1)
+    residual = planes.T.copy().view(f"<i{width}").reshape(frames, channels).astype(np.int64)
+    x = residual
+    for _ in range(mode):
+        x = np.cumsum(x, axis=0)
+    return x.astype(f"<i{sample_width}").tobytes()
+
+
+# -- Scrittura -----------------------------------------------------------------
+
+def write_entry(f: BinaryIO, wav_path: PathLike, source: str, block_seconds: float = 1.0,
+                level: int = 6, extra: Optional[Dict] = None) -> Tuple[int, int]:
+    """Aggiunge in fondo a ``f`` (aperto in ``r+b``/``w+b``) la voce di ``wav_path``
+
+    Legge il WAV un blocco alla volta. Restituisce (offset, lunghezza) della voce.
+    """
+    f.seek(0, os.SEEK_END)
+    start = f.tell()
+    f.write(_HEADER.pack(MAGIC, VERSION, 0))
+
+    sha = hashlib.sha256()
+    with WavFile(wav_path) as wav:
+        info = wav.info
+        raw = wav.raw()
+        data_end = info.data_offset + info.n_frames * info.frame_size
+        prefix, trailer = bytes(raw[:info.data_offset]), bytes(raw[data_end:])
+        sha.update(prefix)
+
+        block_frames = max(1, int(block_seconds * info.sample_rate))
+        blocks: List[List[int]] = []
+        for first in range(0, info.n_frames, block_frames):
+            frames = min(block_frames, info.n_frames - first)
+            pcm = wav.pcm[first * info.frame_size:(first + frames) * info.frame_size]
+            sha.update(pcm)
+            data, mode, width = _encode_block(pcm, info.channels, info.sample_width, info.format_tag, level)
+            blocks.append([f.tell() - start, frames, len(data), mode, width])
+            f.write(data)
+        sha.update(trailer)
+        size = len(raw)
+
+    index = {
+        "source": source,
+        "size": size,
+        "sha256": sha.hexdigest(),
+        "sample_rate": info.sample_rate,
+        "channels": info.channels,
+        "sample_width": info.sample_width,
+        "format_tag": info.format_tag,
+        "n_frames": info.n_frames,
+        "block_frames": block_frames,
+        "prefix": base64.b64encode(prefix).decode("ascii"),
+        "trailer": base64.b64encode(trailer).decode("ascii"),
+        "blocks": blocks,
+        **(extra or {}),
+    }
+    encoded = json.dumps(index, ensure_ascii=False).encode("utf-8")
+    index_offset = f.tell() - start
+    f.write(encoded)
+    f.write(_FOOTER.pack(index_offset, len(encoded), MAGIC))
+    length = f.tell() - start
+    f.seek(start)
+    f.write(_HEADER.pack(MAGIC, VERSION, length))
+    f.seek(0, os.SEEK_END)
+    return start, length
+
+
+# -- Lettura -------------------------------------------------------------------
+
+def scan_entries(path: PathLike) -> Iterator[Tuple[int, int]]:
+    """(offset, lunghezza) delle voci di un pack, in ordine; si ferma a una voce troncata"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + _HEADER.size <= size:
+            f.seek(offset)
+            magic, _, length = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or length < _HEADER.size + _FOOTER.size or offset + length > size:
+                return
+            yield offset, length
+            offset += length
+
+
+class ArchiveEntry:
+    """Voce d'archivio con lettura in streaming del PCM"""
+
+    def __init__(self, path: PathLike, offset: int = 0, length: Optional[int] = None) -> None:
+        self.path = str(path)
+        self.offset = offset
+        self._file = open(self.path, "rb")
+        try:
+            self.index = self._read_index(length)
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self) -> "ArchiveEntry":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _read_index(self, length: Optional[int]) -> Dict:
+        self._file.seek(self.offset)
+        header = self._file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ArchiveFormatError("voce troncata")
+        magic, version, stored_length = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ArchiveFormatError(f"voce VTLA non valida in {self.path}@{self.offset}")
+        length = length or stored_length
+        self._file.seek(self.offset + length - _FOOTER.size)
+        index_offset, index_length, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        if magic != MAGIC:
+            raise ArchiveFormatError(f"voce VTLA incompleta in {self.path}@{self.offset}")
+        self._file.seek(self.offset + index_offset)
+        return json.loads(self._file.read(index_length).decode("utf-8"))
+
+    # -- Metadati ----------------------------------------------------------
+
+    @property
+    def source(self) -> str:
+        return self.index["source"]
+
+    @property
+    def sample_rate(self) -> int:
+        return self.index["sample_rate"]
+
+    @property
+    def channels(self) -> int:
+        return self.index["channels"]
+
+    @property
+    def n_frames(self) -> int:
+        return self.index["n_frames"]
+
+    @property
+    def duration(self) -> float:
+        return self.n_frames / float(self.sample_rate) if self.sample_rate else 0.0
+
+    # -- Dati --------------------------------------------------------------
+
+    def iter_pcm(self, start: float = 0.0, end: Optional[float] = None) -> Iterator[bytes]:
+        """PCM tra ``start`` ed ``end`` secondi, un blocco alla volta"""
+        frame_size = self.channels * self.index["sample_width"]
+        first = max(0, min(self.n_frames, int(start * self.sample_rate)))
+        last = self.n_frames if end is None else max(first, min(self.n_frames, int(end * self.sample_rate)))
+        block_first = 0
+        for offset, frames, length, mode, width in self.index["blocks"]:
+            block_last = block_first + frames
+            if block_last > first and block_first < last:
+                self._file.seek(self.offset + offset)
+                pcm = _decode_block(self._file.read(length), mode, width, frames, self.channels,
+                                    self.index["sample_width"])
+                lo, hi = max(first, block_first) - block_first, min(last, block_last) - block_first
+                yield pcm[lo * frame_size:hi * frame_size]
+            if block_last >= last:
+                break
+            block_first = block_last
+
+    def iter_file(self) -> Iterator[bytes]:
+        """Il file WAV originale, byte per byte, a blocchi"""
+        yield base64.b64decode(self.index["prefix"])
+        yield from self.iter_pcm()
+        yield base64.b64decode(self.index["trailer"])
+
+    def verify(self) -> bool:
+        """True se la decodifica riproduce lo sha256 del file originale"""
+        sha = hashlib.sha256()
+        for chunk in self.iter_file():
+            sha.update(chunk)
+        return sha.hexdigest() == self.index["sha256"]
+
+    def restore(self, dst: PathLike) -> None:
+        """Riscrive il WAV originale in ``dst`` (via un ``.part`` univoco, verificando lo sha256)"""
+        from ..utils.storage import finalize_file
+
+        Path(dst).parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=str(Path(dst).parent), prefix=f".{Path(dst).name}.", suffix=".part")
+        sha = hashlib.sha256()
+        try:
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "wb") as out:
+                for chunk in self.iter_file():
+                    sha.update(chunk)
+                    out.write(chunk)
+            if sha.hexdigest() != self.index["sha256"]:
+                raise ArchiveFormatError(f"sha256 non corrispondente per {self.source}")
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        finalize_file(tmp, dst)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def archive_info(path: PathLike, offset: int = 0) -> Dict:
+    """Formato e durata di una voce (solo l'indice, nessun blocco decodificato)"""
+    try:
+        with ArchiveEntry(path, offset) as entry:
+            return {"duration": entry.duration, "sample_rate": entry.sample_rate, "channels": entry.channels}
+    except (OSError, ArchiveFormatError, WavFormatError, ValueError, struct.error):
+        return {"duration": None, "sample_rate": None, "channels": None}
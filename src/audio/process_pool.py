@@ -0,0 +1,197 @@
+"""
+Runner a processi per gli stadi audio CPU-bound
+
+Gli stadi che elaborano un'intera registrazione (impronta acustica in
+``fingerprint``, segmentazione in ``segmenter``, sintesi delle registrazioni
+del generatore di carico con ``stage_synthesize``) girano in un
+ProcessPoolExecutor dedicato, così non competono per il GIL con l'event loop.
+La lettura dei WAV e il segnale del registratore demo, prodotto a chunk in
+tempo reale, restano nel processo principale: il passaggio a un worker
+costerebbe più del lavoro. I buffer PCM viaggiano in ``multiprocessing.shared_memory``:
+il processo principale copia il PCM una sola volta in un blocco condiviso e il
+worker lo legge come ``memoryview`` senza passare da pickle. Se lo stadio
+restituisce a sua volta un buffer, il worker lo riconsegna nello stesso modo.
+
+Gli stadi devono essere funzioni top-level (serializzabili per riferimento) con
+firma ``stage(pcm: Optional[memoryview], **params)`` e non devono trattenere
+viste sul buffer dopo il ritorno.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Optional, Union
+
+from ..config import Config
+
+BufferLike = Union[bytes, bytearray, memoryview]
+
+
+class SharedPCM:
+    """Riferimento serializzabile a un buffer PCM in memoria condivisa"""
+
+    __slots__ = ("name", "nbytes")
+
+    def __init__(self, name: str, nbytes: int) -> None:
+        self.name = name
+        self.nbytes = nbytes
+
+    def consume(self) -> bytes:
+        """Copia il contenuto e libera il blocco condiviso"""
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            return bytes(shm.buf[:self.nbytes])
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+def _share_buffer(data: BufferLike) -> Optional[shared_memory.SharedMemory]:
+    """Copia un buffer in un nuovo blocco di memoria condivisa"""
+    view = memoryview(data).cast("B")
+    if view.nbytes == 0:
+        return None
+    shm = shared_memory.SharedMemory(create=True, size=view.nbytes)
+    shm.buf[:view.nbytes] = view
+    return shm
+
+
+def _release(shm: Optional[shared_memory.SharedMemory]) -> None:
+    if shm is None:
+        return
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _execute_stage(stage: Callable[..., Any], shm_name: Optional[str],
+                   nbytes: int, params: dict) -> Any:
+    """Entry point eseguito nel worker"""
+    shm = shared_memory.SharedMemory(name=shm_name) if shm_name else None
+    view = shm.buf[:nbytes] if shm else None
+    try:
+        result = stage(view, **params)
+    finally:
+        if view is not None:
+            view.release()
+        if shm is not None:
+            shm.close()
+
+    if isinstance(result, (bytes, bytearray, memoryview)):
+        out = _share_buffer(result)
+        if out is None:
+            return b""
+        ref = SharedPCM(out.name, memoryview(result).nbytes)
+        out.close()
+        return ref
+    return result
+
+
+class AudioStageRunner:
+    """Esegue stadi audio CPU-bound in un pool di processi dedicato"""
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self._fixed_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_workers = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self) -> int:
+        # Senza un valore esplicito segue AUDIO_WORKERS del profilo attivo
+        return self._fixed_workers or Config.AUDIO_WORKERS or os.cpu_count() or 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is not None and self._executor_workers != self.max_workers:
+                # Profilo cambiato: i lavori già accodati finiscono sul pool vecchio
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._executor is None:
+                # Il tracker condiviso evita che un worker "ripulisca" blocchi
+                # ancora in uso dal processo principale
+                resource_tracker.ensure_running()
+                self._executor_workers = self.max_workers
+                self._executor = ProcessPoolExecutor(max_workers=self._executor_workers)
+            return self._executor
+
+    def submit(self, stage: Callable[..., Any], pcm: Optional[BufferLike] = None,
+               **params: Any) -> Future:
+        """Accoda uno stadio e restituisce un Future con il risultato materializzato"""
+        shm = _share_buffer(pcm) if pcm is not None else None
+        nbytes = memoryview(pcm).nbytes if shm is not None else 0
+        try:
+            inner = self._get_executor().submit(
+                _execute_stage, stage, shm.name if shm else None, nbytes, params
+            )
+        except Exception:
+            _release(shm)
+            raise
+
+        outer: Future = Future()
+
+        def _on_done(f: Future) -> None:
+            _release(shm)
+            if f.cancelled():
+                outer.cancel()
+                return
+            exc = f.exception()
+            try:
+                if exc is not None:
+                    outer.set_exception(exc)
+                    return
+                value = f.result()
+                # Il blocco di output va liberato anche se nessuno attende più
+                if isinstance(value, SharedPCM):
+                    value = value.consume()
+                outer.set_result(value)
+            except InvalidStateError:
+                pass
+
+        inner.add_done_callback(_on_done)
+        outer.add_done_callback(lambda o: o.cancelled() and inner.cancel())
+        return outer
+
+    async def run(self, stage: Callable[..., Any], pcm: Optional[BufferLike] = None,
+                  **params: Any) -> Any:
+        """Versione asincrona di ``submit``"""
+        return await asyncio.wrap_future(self.submit(stage, pcm, **params))
+
+    def run_sync(self, stage: Callable[..., Any], pcm: Optional[BufferLike] = None,
+                 **params: Any) -> Any:
+        """Versione bloccante di ``submit`` per i thread di lavoro"""
+        return self.submit(stage, pcm, **params).result()
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+
+_default_runner: Optional[AudioStageRunner] = None
+
+
+def get_stage_runner() -> AudioStageRunner:
+    """Runner condiviso dall'applicazione"""
+    global _default_runner
+    if _default_runner is None:
+        _default_runner = AudioStageRunner()
+    return _default_runner
+
+
+# ---------------------------------------------------------------------------
+# Stadi predefiniti
+# ---------------------------------------------------------------------------
+
+def stage_synthesize(pcm: None, n_samples: int, sample_rate: int,
+                     start_time: float = 0.0, seed: Optional[int] = None) -> bytes:
+    """Genera il segnale sintetico del registratore demo"""
+    from .synth import DemoSignal
+
+    return DemoSignal(sample_rate, seed, round(start_time * sample_rate)).read(n_samples)
@@ -0,0 +1,128 @@
+"""
+Caratteristiche prosodiche di una finestra audio
+
+Energia (dBFS), variabilità dell'energia, frazione di pause, ritmo (picchi di
+energia al secondo, un'approssimazione delle sillabe) e, con NumPy, altezza
+media e variabilità dell'intonazione stimate per autocorrelazione.
+``prosodic_tone`` le traduce in un tono provvisorio con le stesse etichette
+dell'analisi completa. Tutto è locale e costa pochi millisecondi per finestra.
+"""
+from __future__ import annotations
+
+import importlib.util
+import math
+from typing import Dict, List, Optional
+
+FRAME_MS = 20
+PITCH_MIN_HZ = 75
+PITCH_MAX_HZ = 400
+
+_HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+def _frame_rms_db(samples, frame_len: int) -> List[float]:
+    if _HAS_NUMPY:
+        import numpy as np
+
+        x = np.asarray(samples, dtype=np.float64) / 32768.0
+        n = len(x) // frame_len
+        if n == 0:
+            return []
+        rms = np.sqrt(np.mean(x[: n * frame_len].reshape(n, frame_len) ** 2, axis=1))
+        return (20 * np.log10(np.maximum(rms, 1e-6))).tolist()
+
+    db = []
+    for start in range(0, len(samples) - frame_len + 1, frame_len):
+        acc = 0
+        for s in samples[start:start + frame_len]:
+            acc += s * s
+        db.append(20 * math.log10(max(math.sqrt(acc / frame_len) / 32768.0, 1e-6)))
+    return db
+
+
+def _pitch_track(samples, sample_rate: int, voiced: List[bool], frame_len: int) -> List[float]:
+    """F0 per i frame con voce (autocorrelazione via FFT su finestre di 40 ms, tutte insieme)"""
+    import numpy as np
+
+    x = np.asarray(samples, dtype=np.float64)
+    lag_min = max(1, sample_rate // PITCH_MAX_HZ)
+    lag_max = sample_rate // PITCH_MIN_HZ
+    window = 2 * frame_len
+    if window <= lag_max:
+        return []
+    starts = [i * frame_len for i, v in enumerate(voiced) if v and i * frame_len + window <= len(x)]
+    if not starts:
+        return []
+    frames = x[np.asarray(starts)[:, None] + np.arange(window)[None, :]]
+    frames -= frames.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(frames, n=2 * window, axis=1)
+    corr = np.fft.irfft(np.abs(spectrum) ** 2, axis=1)[:, :lag_max]
+    energy = corr[:, 0]
+    lags = lag_min + np.argmax(corr[:, lag_min:lag_max], axis=1)
+    strength = corr[np.arange(len(lags)), lags] / np.maximum(energy, 1e-12)
+    ok = (energy > 0) & (strength > 0.3)
+    return (sample_rate / lags[ok]).tolist()
+
+
+def prosody_features(samples, sample_rate: int) -> Optional[Dict[str, float]]:
+    """Caratteristiche di una finestra di campioni mono a 16 bit"""
+    frame_len = max(1, sample_rate * FRAME_MS // 1000)
+    db = _frame_rms_db(samples, frame_len)
+    if len(db) < 5:
+        return None
+
+    loud = sorted(db)[int(0.95 * (len(db) - 1))]
+    threshold = max(loud - 25.0, -55.0)
+    voiced = [v >= threshold for v in db]
+    speech = [v for v, is_voiced in zip(db, voiced) if is_voiced]
+
+    # Picchi locali di energia sopra soglia: circa una sillaba ciascuno
+    peaks = sum(
+        1 for i in range(1, len(db) - 1)
+        if voiced[i] and db[i] > db[i - 1] and db[i] >= db[i + 1] and db[i] > threshold + 6
+    )
+    seconds = len(db) * FRAME_MS / 1000
+
+    mean_db = sum(speech) / len(speech) if speech else min(db)
+    features = {
+        "energy_db": mean_db,
+        "energy_std_db": math.sqrt(sum((v - mean_db) ** 2 for v in speech) / len(speech)) if speech else 0.0,
+        "pause_ratio": 1 - len(speech) / len(db),
+        "rate": peaks / seconds,
+        "pitch_hz": 0.0,
+        "pitch_std_st": 0.0,
+    }
+
+    if _HAS_NUMPY and speech:
+        pitches = _pitch_track(samples, sample_rate, voiced, frame_len)
+        if len(pitches) >= 3:
+            mean_pitch = sum(pitches) / len(pitches)
+            semitones = [12 * math.log2(p / mean_pitch) for p in pitches]
+            features["pitch_hz"] = mean_pitch
+            features["pitch_std_st"] = math.sqrt(sum(s * s for s in semitones) / len(semitones))
+    return features
+
+
+def prosodic_tone(features: Dict[str, float]) -> Dict:
+    """Tono provvisorio da energia, intonazione e ritmo"""
+    energy, rate = features["energy_db"], features["rate"]
+    lively = features["pitch_std_st"] > 3.0 or features["energy_std_db"] > 8.0
+    pauses = features["pause_ratio"]
+
+    if pauses > 0.9:
+        tone, confidence = "neutrale", 30          # quasi solo silenzio
+    elif energy > -18 and lively and rate > 4:
+        tone, confidence = "eccitato", 60
+    elif energy > -18 and not lively:
+        tone, confidence = "arrabbiato", 50
+    elif energy > -26 and lively:
+        tone, confidence = "entusiasta", 55
+    elif energy < -34 and pauses > 0.5 and rate < 2.5:
+        tone, confidence = "triste", 45
+    elif energy < -28:
+        tone, confidence = "calmo", 50
+    else:
+        tone, confidence = "neutrale", 45
+
+    intensity = "alta" if energy > -18 else "bassa" if energy < -32 else "media"
+    return {"tono_principale": tone, "intensità": intensity, "confidenza": confidence}
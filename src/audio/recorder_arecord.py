@@ -2,16 +2,35 @@
 Registratore audio reale basato su arecord (ALSA)
 
 Richiede che 'arecord' sia disponibile nel sistema.
+
+Buffer e periodo ALSA sono configurabili (``ALSA_BUFFER_TIME_US``,
+``ALSA_PERIOD_TIME_US``). Gli avvisi di overrun che arecord scrive su stderr
+vengono contati; se arecord termina durante una registrazione viene
+riavviato (al più ``ARECORD_MAX_RESTARTS`` volte) e il nuovo audio continua
+nello stesso file, con il buco riempito di silenzio e annotato nel log
+``recordings/capture_log.jsonl``.
 """
 from __future__ import annotations
 
+import json
+import os
+import re
 import subprocess
 import threading
+import time
+import wave
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Callable
+from typing import Callable, Deque, Dict, List, Optional
 
 from ..config import Config
+from .fanout import AudioBus, Subscription
+from ..utils.catalog import get_catalog
+from ..utils.storage import finalize_file, new_path
+
+# es. "overrun!!! (at least 12.345 ms long)"
+_XRUN_RE = re.compile(r"(overrun|underrun)!!!(?: \(at least ([\d.]+) ms long\))?")
 
 
 class AudioRecorder:
@@ -21,45 +40,37 @@ class AudioRecorder:
         self.process: Optional[subprocess.Popen] = None
         self.is_recording: bool = False
         self.current_filepath: Optional[str] = None
+        self._partial_filepath: Optional[str] = None
         self.callback: Optional[Callable[[bytes], None]] = None
         self._reader_thread: Optional[threading.Thread] = None
+        # I consumatori ricevono i chunk tramite il bus, mai sul thread di lettura
+        self.bus = AudioBus()
+        self._callback_subscription: Optional[Subscription] = None
+        # Avvio/arresto di arecord e riavvii automatici non devono sovrapporsi
+        self._process_lock = threading.Lock()
+        self._stderr_tail: Deque[str] = deque(maxlen=10)
+        self.telemetry: Dict = {}
 
-    def set_callback(self, callback: Callable[[bytes], None]) -> None:
+    def set_callback(self, callback: Optional[Callable[[bytes], None]]) -> None:
+        if self._callback_subscription is not None:
+            self.bus.unsubscribe(self._callback_subscription)
+            self._callback_subscription = None
         self.callback = callback
+        if callback:
+            self._callback_subscription = self.bus.attach_callback(callback)
 
-    def _reader_loop(self) -> None:
-        assert self.process is not None
-        try:
-            while self.is_recording:
-                chunk = self.process.stdout.read(Config.CHUNK_SIZE * 2)
-                if not chunk:
-                    break
-                if self.callback:
-                    self.callback(chunk)
-        except Exception:
-            pass
-
-    def start_recording(self) -> str:
-        if self.is_recording:
-            return ""
-
-        # Assicura la cartella output
-        Config.OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"recording_{timestamp}.{Config.AUDIO_FORMAT}"
-        filepath = Config.OUTPUT_DIR / filename
-        self.current_filepath = str(filepath)
+    # -- Processo arecord --------------------------------------------------
 
+    @staticmethod
+    def build_command() -> List[str]:
         # Comando arecord (16-bit little-endian, mono, sample rate da config)
         # -f S16_LE: formato 16-bit PCM
         # -c 1: mono (usa Config.CHANNELS se serve)
         # -r <rate>: sample rate
-        # -t wav: output WAV
-        # -q: quiet
+        # -t raw: PCM su stdout, il WAV lo scrive il thread di lettura
+        # niente -q: gli avvisi di overrun su stderr servono alla telemetria
         cmd = [
             "arecord",
-            "-q",
             "-f",
             "S16_LE",
             "-c",
@@ -67,24 +78,144 @@ class AudioRecorder:
             "-r",
             str(Config.SAMPLE_RATE),
             "-t",
-            "wav",
-            self.current_filepath,
+            "raw",
         ]
+        if Config.ALSA_DEVICE:
+            cmd += ["-D", Config.ALSA_DEVICE]
+        if Config.ALSA_BUFFER_TIME_US:
+            cmd.append(f"--buffer-time={Config.ALSA_BUFFER_TIME_US}")
+        if Config.ALSA_PERIOD_TIME_US:
+            cmd.append(f"--period-time={Config.ALSA_PERIOD_TIME_US}")
+        return cmd
+
+    def _spawn(self) -> subprocess.Popen:
+        process = subprocess.Popen(
+            self.build_command(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        threading.Thread(target=self._stderr_loop, args=(process,), daemon=True).start()
+        return process
+
+    def _stderr_loop(self, process: subprocess.Popen) -> None:
+        """Conta gli xrun segnalati da arecord e tiene le ultime righe di errore"""
+        for raw in iter(process.stderr.readline, b""):
+            line = raw.decode("utf-8", "replace").strip()
+            if not line:
+                continue
+            match = _XRUN_RE.search(line)
+            if match:
+                self.telemetry["xruns"] += 1
+                self.telemetry["xrun_ms"] += float(match.group(2) or 0.0)
+            elif not line.startswith("Recording "):
+                self._stderr_tail.append(line)
+
+    # -- Lettura e scrittura -----------------------------------------------
+
+    def _reader_loop(self) -> None:
+        """Legge il PCM da arecord, lo scrive nel WAV e lo pubblica sul bus
+
+        Il ciclo termina solo a fine stream (anche dopo stop_recording), così
+        i dati ancora nel pipe finiscono comunque nel file. Se arecord muore
+        mentre si registra, viene riavviato e la cattura prosegue nello
+        stesso WAV.
+        """
+        frame_size = 2 * Config.CHANNELS
+        chunk_bytes = Config.CHUNK_SIZE * frame_size
+        frames_written = 0
+        started = time.monotonic()
+        try:
+            with wave.open(self._partial_filepath, "wb") as wav:
+                wav.setnchannels(Config.CHANNELS)
+                wav.setsampwidth(2)
+                wav.setframerate(Config.SAMPLE_RATE)
+                process = self.process
+                gap_reason: Optional[str] = None
+                while process is not None:
+                    for chunk in iter(lambda: process.stdout.read(chunk_bytes), b""):
+                        if gap_reason is not None:
+                            frames_written += self._splice_gap(wav, frames_written, started, gap_reason)
+                            gap_reason = None
+                        chunk = chunk[: len(chunk) - len(chunk) % frame_size]
+                        wav.writeframesraw(chunk)
+                        self.bus.publish(chunk)
+                        frames_written += len(chunk) // frame_size
+
+                    process.wait()
+                    gap_reason = f"arecord terminato (codice {process.returncode})"
+                    if self._stderr_tail:
+                        gap_reason += f": {self._stderr_tail[-1]}"
+                    process = self._restart(gap_reason)
+        except Exception as e:
+            print(f"\n❌ Errore lettura audio: {e}")
+
+    def _restart(self, reason: str) -> Optional[subprocess.Popen]:
+        """Nuovo processo arecord, oppure None se la registrazione è finita"""
+        if not self.is_recording:
+            return None
+        restarts = self.telemetry["restarts"]
+        if restarts >= Config.ARECORD_MAX_RESTARTS:
+            with self._process_lock:
+                if self.is_recording:
+                    print(f"\n❌ {reason} - troppi riavvii, registrazione interrotta")
+            return None
+        time.sleep(min(0.1 * 2 ** restarts, 2.0))
+        with self._process_lock:
+            if not self.is_recording:
+                return None
+            print(f"\n⚠️ {reason} - riavvio cattura ({restarts + 1}/{Config.ARECORD_MAX_RESTARTS})")
+            try:
+                self.process = self._spawn()
+            except Exception as e:
+                print(f"❌ Riavvio arecord fallito: {e}")
+                return None
+            self.telemetry["restarts"] += 1
+            return self.process
+
+    def _splice_gap(self, wav: wave.Wave_write, frames_written: int, started: float, reason: str) -> int:
+        """Allinea il file al tempo reale dopo un riavvio; restituisce i frame di silenzio aggiunti"""
+        expected = int((time.monotonic() - started) * Config.SAMPLE_RATE)
+        missing = max(0, expected - frames_written)
+        gap = {
+            "at_s": round(frames_written / Config.SAMPLE_RATE, 3),
+            "gap_ms": round(1000 * missing / Config.SAMPLE_RATE, 1),
+            "reason": reason,
+        }
+        self.telemetry["gaps"].append(gap)
+        print(f"⚠️ Buco di {gap['gap_ms']:.0f} ms a {gap['at_s']:.1f}s nella registrazione")
+        if not Config.ARECORD_FILL_GAPS or not missing:
+            return 0
+        silence = bytes(2 * Config.CHANNELS * min(missing, Config.SAMPLE_RATE))
+        remaining = missing
+        while remaining > 0:
+            n = min(remaining, Config.SAMPLE_RATE)
+            wav.writeframesraw(silence[: n * 2 * Config.CHANNELS])
+            remaining -= n
+        return missing
+
+    # -- API del registratore ----------------------------------------------
+
+    def start_recording(self) -> str:
+        if self.is_recording:
+            return ""
+
+        # ID univoco in una cartella per data; il WAV viene scritto su un file
+        # temporaneo che diventa definitivo solo in stop_recording
+        self.current_filepath = str(new_path("recording", Config.AUDIO_FORMAT))
+        self._partial_filepath = self.current_filepath + ".part"
+        self._stderr_tail.clear()
+        self.telemetry = {"xruns": 0, "xrun_ms": 0.0, "restarts": 0, "gaps": []}
 
         try:
             # Avvio processo arecord
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                bufsize=0,
-            )
-            self.is_recording = True
-
-            # Thread che legge stdout per callback (quando si usa -t wav, i dati non sempre arrivano su stdout)
-            if self.process.stdout and self.callback:
-                self._reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
-                self._reader_thread.start()
+            with self._process_lock:
+                self.process = self._spawn()
+                self.is_recording = True
+
+            # Thread che legge stdout, scrive il file e alimenta il bus
+            self._reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
+            self._reader_thread.start()
 
             print("🎤 Registrazione iniziata (arecord)...")
             return self.current_filepath
@@ -103,17 +234,23 @@ class AudioRecorder:
             return None
 
         try:
-            self.is_recording = False
-            if self.process and self.process.poll() is None:
-                self.process.terminate()
+            with self._process_lock:
+                self.is_recording = False
+                process = self.process
+            if process and process.poll() is None:
+                process.terminate()
                 try:
-                    self.process.wait(timeout=3)
+                    process.wait(timeout=3)
                 except subprocess.TimeoutExpired:
-                    self.process.kill()
+                    process.kill()
 
             if self._reader_thread and self._reader_thread.is_alive():
-                self._reader_thread.join(timeout=1.0)
+                self._reader_thread.join(timeout=3.0)
+
+            finalize_file(self._partial_filepath, self.current_filepath)
 
+            self._report_telemetry()
+            self._register_in_catalog(self.current_filepath)
             print(f"💾 Registrazione salvata: {self.current_filepath}")
             return self.current_filepath
         except Exception as e:
@@ -123,11 +260,40 @@ class AudioRecorder:
             self.process = None
             self._reader_thread = None
 
+    def _report_telemetry(self) -> None:
+        """Riepilogo xrun/riavvii e riga nel log di cattura"""
+        t = self.telemetry
+        if t["xruns"] or t["restarts"]:
+            print(f"⚠️ Cattura: {t['xruns']} overrun ({t['xrun_ms']:.0f} ms), "
+                  f"{t['restarts']} riavvii, {len(t['gaps'])} buchi")
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "path": self.current_filepath,
+            "buffer_time_us": Config.ALSA_BUFFER_TIME_US or None,
+            "period_time_us": Config.ALSA_PERIOD_TIME_US or None,
+            **t,
+        }
+        try:
+            log_path = Path(Config.CAPTURE_LOG)
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(log_path), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"⚠️ Log di cattura non aggiornato: {e}")
+
+    def _register_in_catalog(self, filepath: str) -> None:
+        try:
+            get_catalog().add_recording(filepath)
+        except Exception as e:
+            print(f"⚠️ Catalogo non aggiornato: {e}")
+
     def cleanup(self) -> None:
         if self.is_recording:
             self.stop_recording()
+        self.bus.close()
 
     def __del__(self) -> None:
         self.cleanup()
-
-
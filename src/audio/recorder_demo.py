@@ -1,16 +1,24 @@
 """
 Registratore audio demo - simulazione senza PyAudio per evitare crash Linux
+
+Il segnale (``synth.DemoSignal``) è deterministico a parità di seed
+(``DEMO_SEED``) e il ritmo è agganciato al numero di campioni prodotti, senza
+deriva. ``DEMO_SPEED`` sceglie il ritmo: 1 = tempo reale, N = N volte più
+veloce, 0 = il più veloce possibile. Con ``record_for`` si ottiene un file di
+durata esatta, es. un'ora di audio di test in pochi secondi.
 """
+import secrets
 import time
-import math
-import struct
 import wave
-from datetime import datetime
 from pathlib import Path
 from typing import Optional, Callable
 import threading
 
 from ..config import Config
+from .fanout import AudioBus, Subscription
+from .synth import DemoSignal
+from ..utils.catalog import get_catalog
+from ..utils.storage import finalize_file, new_path
 
 
 class AudioRecorder:
@@ -18,29 +26,44 @@ class AudioRecorder:
     
     def __init__(self):
         self.is_recording = False
-        self.frames: list[bytes] = []
         self.callback: Optional[Callable[[bytes], None]] = None
         self.recording_thread: Optional[threading.Thread] = None
         self.start_time = 0.0
         self.current_filepath: Optional[str] = None
+        self._partial_filepath: Optional[str] = None
+        self.seed: Optional[int] = None
+        self.speed = Config.DEMO_SPEED
+        self.frames_written = 0
+        self._max_frames: Optional[int] = None
+        # I consumatori ricevono i chunk tramite il bus, mai sul thread di generazione
+        self.bus = AudioBus()
+        self._callback_subscription: Optional[Subscription] = None
         
-    def set_callback(self, callback: Callable[[bytes], None]) -> None:
-        """Imposta callback per i dati audio"""
+    def set_callback(self, callback: Optional[Callable[[bytes], None]]) -> None:
+        """Imposta callback per i dati audio (servito da un thread del bus)"""
+        if self._callback_subscription is not None:
+            self.bus.unsubscribe(self._callback_subscription)
+            self._callback_subscription = None
         self.callback = callback
+        if callback:
+            self._callback_subscription = self.bus.attach_callback(callback)
     
     def start_recording(self) -> str:
         """Avvia la registrazione simulata"""
         if self.is_recording:
             return ""
             
-        # Crea il percorso del file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"recording_{timestamp}.{Config.AUDIO_FORMAT}"
-        filepath = Config.OUTPUT_DIR / filename
-        self.current_filepath = str(filepath)
+        # Crea il percorso del file (ID univoco, cartella per data); l'audio
+        # va su un file temporaneo che diventa definitivo in stop_recording
+        self.current_filepath = str(new_path("recording", Config.AUDIO_FORMAT))
+        self._partial_filepath = self.current_filepath + ".part"
+        
+        # Seed fisso da configurazione, altrimenti nuovo ma riportato nel log
+        self.seed = int(Config.DEMO_SEED) if Config.DEMO_SEED else secrets.randbits(32)
+        self.speed = Config.DEMO_SPEED
         
         # Avvia la simulazione
-        self.frames = []
+        self.frames_written = 0
         self.is_recording = True
         self.start_time = time.time()
         
@@ -48,9 +71,21 @@ class AudioRecorder:
         self.recording_thread.daemon = True
         self.recording_thread.start()
         
-        print("🎤 Registrazione iniziata (simulazione)...")
+        pace = "tempo reale" if self.speed == 1 else f"{self.speed:g}×" if self.speed > 0 else "massima velocità"
+        print(f"🎤 Registrazione iniziata (simulazione, seed {self.seed}, {pace})...")
         return self.current_filepath
     
+    def record_for(self, seconds: float) -> Optional[str]:
+        """Registra esattamente ``seconds`` secondi di segnale e salva il file"""
+        self._max_frames = int(seconds * Config.SAMPLE_RATE)
+        try:
+            if not self.start_recording():
+                return None
+            self.recording_thread.join()
+            return self.stop_recording()
+        finally:
+            self._max_frames = None
+    
     def stop_recording(self) -> Optional[str]:
         """Ferma la registrazione e salva il file"""
         if not self.is_recording or not self.current_filepath:
@@ -58,18 +93,15 @@ class AudioRecorder:
             
         self.is_recording = False
         
-        # Aspetta che il thread finisca
+        # Aspetta che il thread finisca (e chiuda il WAV)
         if self.recording_thread:
             self.recording_thread.join(timeout=2.0)
         
-        # Salva il file WAV
+        # Rende definitivo il file WAV (fsync + rename)
         try:
-            with wave.open(self.current_filepath, 'wb') as wf:
-                wf.setnchannels(Config.CHANNELS)
-                wf.setsampwidth(2)  # 16 bit = 2 bytes
-                wf.setframerate(Config.SAMPLE_RATE)
-                wf.writeframes(b''.join(self.frames))
+            finalize_file(self._partial_filepath, self.current_filepath)
             
+            self._register_in_catalog(self.current_filepath)
             print(f"💾 Registrazione salvata: {self.current_filepath}")
             return self.current_filepath
             
@@ -77,57 +109,74 @@ class AudioRecorder:
             print(f"❌ Errore salvataggio: {e}")
             return None
     
+    def _register_in_catalog(self, filepath: str) -> None:
+        """Aggiunge la registrazione al catalogo"""
+        try:
+            get_catalog().add_recording(filepath)
+        except Exception as e:
+            print(f"⚠️ Catalogo non aggiornato: {e}")
+    
     def _simulate_recording(self):
         """Simula la registrazione generando audio sintetico"""
-        chunk_duration = Config.CHUNK_SIZE / Config.SAMPLE_RATE
+        signal = DemoSignal(Config.SAMPLE_RATE, self.seed)
+        channels = Config.CHANNELS
+        started = time.monotonic()
         
-        while self.is_recording:
-            # Genera un chunk di audio
-            audio_data = []
-            current_time = time.time() - self.start_time
+        with wave.open(self._partial_filepath, 'wb') as wf:
+            wf.setnchannels(channels)
+            wf.setsampwidth(2)  # 16 bit = 2 bytes
+            wf.setframerate(Config.SAMPLE_RATE)
             
-            for i in range(Config.CHUNK_SIZE):
-                t = current_time + (i / Config.SAMPLE_RATE)
-                
-                # Genera un segnale complesso più realistico
-                # Tono base a 440Hz (La)
-                base_tone = math.sin(2 * math.pi * 440 * t)
-                
-                # Aggiunge armoniche per rendere più realistico
-                harmonic1 = 0.3 * math.sin(2 * math.pi * 880 * t)  # Ottava
-                harmonic2 = 0.2 * math.sin(2 * math.pi * 1320 * t)  # Quinta
+            while self.is_recording:
+                count = Config.CHUNK_SIZE
+                if self._max_frames is not None:
+                    count = min(count, self._max_frames - self.frames_written)
+                    if count <= 0:
+                        break
                 
-                # Modulazione di ampiezza per variazione
-                amplitude_mod = 0.8 + 0.2 * math.sin(2 * math.pi * 0.5 * t)
+                # Genera un chunk di audio (stesso segnale su tutti i canali)
+                audio_bytes = signal.read(count)
+                if channels > 1:
+                    audio_bytes = b''.join(audio_bytes[i:i + 2] * channels
+                                           for i in range(0, len(audio_bytes), 2))
+                wf.writeframesraw(audio_bytes)
+                self.frames_written += count
                 
-                # Rumore per realismo
-                import random
-                noise = 0.1 * (random.random() - 0.5)
+                # Distribuisce il chunk ai sottoscrittori
+                self.bus.publish(audio_bytes)
                 
-                # Combina tutti i segnali
-                sample = amplitude_mod * (base_tone + harmonic1 + harmonic2) + noise
-                
-                # Scala e converte a 16-bit
-                sample_16bit = int(sample * 15000)  # Ampiezza ragionevole
-                sample_16bit = max(-32768, min(32767, sample_16bit))  # Clamp
-                
-                audio_data.append(sample_16bit)
-            
-            # Converte in bytes
-            audio_bytes = struct.pack('<' + 'h' * len(audio_data), *audio_data)
-            self.frames.append(audio_bytes)
-            
-            # Chiama il callback se presente
-            if self.callback:
-                self.callback(audio_bytes)
-            
-            # Aspetta per simulare il tempo reale
-            time.sleep(chunk_duration)
+                # Ritmo agganciato ai campioni prodotti: il tempo di generazione
+                # non si accumula come deriva
+                if self.speed > 0:
+                    due = started + self.frames_written / Config.SAMPLE_RATE / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
     
     def cleanup(self):
         """Pulisce le risorse"""
         if self.is_recording:
             self.stop_recording()
+        self.bus.close()
     
     def __del__(self):
         self.cleanup()
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Genera audio di test con il segnale demo")
+    parser.add_argument("seconds", type=float, help="durata in secondi")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--speed", type=float, default=0.0, help="1 = tempo reale, 0 = massima velocità")
+    args = parser.parse_args()
+    
+    if args.seed is not None:
+        Config.DEMO_SEED = str(args.seed)
+    Config.DEMO_SPEED = args.speed
+    recorder = AudioRecorder()
+    started = time.perf_counter()
+    path = recorder.record_for(args.seconds)
+    print(f"⏱️ {args.seconds:g} s di audio in {time.perf_counter() - started:.2f} s")
+    recorder.cleanup()
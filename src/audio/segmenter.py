@@ -0,0 +1,155 @@
+"""
+Segmentazione dell'audio su pause e cambi di energia
+
+L'energia viene calcolata per frame da 20 ms in dB. Sono punti di taglio:
+
+- le pause, cioè sequenze di frame sotto la soglia di silenzio lunghe almeno
+  ``min_pause_ms`` (si taglia a metà della pausa);
+- i cambi di energia, dove la media di 1 s prima e dopo differisce di più di
+  ``change_db`` (ad esempio chi parla alza la voce).
+
+Poi i segmenti troppo corti vengono uniti al vicino e quelli troppo lunghi
+divisi nel punto più silenzioso. Lo stadio gira nel pool di processi.
+"""
+from __future__ import annotations
+
+import importlib.util
+import math
+from typing import List, Optional, Tuple
+
+from ..config import Config
+
+FRAME_MS = 20
+CHANGE_WINDOW_FRAMES = 50    # 1 s
+
+_HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+def _frame_db(pcm, sample_rate: int, channels: int, sample_width: int, frame_ms: int) -> List[float]:
+    """Energia in dBFS per frame (media dei canali)"""
+    frame_len = max(1, sample_rate * frame_ms // 1000)
+    if _HAS_NUMPY:
+        import numpy as np
+
+        dtype = {1: "u1", 2: "<i2", 4: "<i4"}[sample_width]
+        x = np.frombuffer(pcm, dtype=dtype).astype(np.float64)
+        if sample_width == 1:
+            x -= 128.0
+        x /= float(2 ** (8 * sample_width - 1))
+        x = x[: len(x) - len(x) % channels].reshape(-1, channels).mean(axis=1)
+        n = len(x) // frame_len
+        if n == 0:
+            return []
+        rms = np.sqrt(np.mean(x[: n * frame_len].reshape(n, frame_len) ** 2, axis=1))
+        return (20 * np.log10(np.maximum(rms, 1e-6))).tolist()
+
+    if sample_width != 2:
+        raise ValueError("senza NumPy la segmentazione supporta solo PCM a 16 bit")
+    samples = memoryview(pcm).cast("h")
+    try:
+        step = frame_len * channels
+        db = []
+        for start in range(0, len(samples) - step + 1, step):
+            frame = samples[start:start + step]
+            acc = 0
+            for s in frame:
+                acc += s * s
+            frame.release()
+            db.append(20 * math.log10(max(math.sqrt(acc / step) / 32768.0, 1e-6)))
+        return db
+    finally:
+        samples.release()
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _cut_points(db: List[float], min_pause_frames: int, change_db: float) -> List[int]:
+    """Frame in cui tagliare, in ordine"""
+    floor, loud = _percentile(db, 0.1), _percentile(db, 0.95)
+    silence = max(floor + 6.0, loud - 30.0)
+
+    cuts = []
+    run_start: Optional[int] = None
+    for i, value in enumerate(db + [silence + 1.0]):
+        if value < silence:
+            if run_start is None:
+                run_start = i
+        elif run_start is not None:
+            if i - run_start >= min_pause_frames and run_start > 0 and i < len(db):
+                cuts.append((run_start + i) // 2)
+            run_start = None
+
+    # Cambi di energia tra finestre adiacenti (somme prefisse: O(n))
+    w = CHANGE_WINDOW_FRAMES
+    prefix = [0.0]
+    for value in db:
+        prefix.append(prefix[-1] + value)
+    i = w
+    while i <= len(db) - w:
+        before = (prefix[i] - prefix[i - w]) / w
+        after = (prefix[i + w] - prefix[i]) / w
+        if abs(after - before) > change_db:
+            cuts.append(i)
+            i += w
+        else:
+            i += 1
+    return sorted(set(cuts))
+
+
+def _enforce_lengths(bounds: List[int], db: List[float], min_frames: int, max_frames: int) -> List[int]:
+    """Unisce i segmenti corti e divide quelli lunghi nel frame più silenzioso"""
+    merged = [bounds[0]]
+    for b in bounds[1:-1]:
+        if b - merged[-1] >= min_frames and bounds[-1] - b >= min_frames:
+            merged.append(b)
+    merged.append(bounds[-1])
+
+    result = [merged[0]]
+    for end in merged[1:]:
+        start = result[-1]
+        while end - start > max_frames:
+            lo, hi = start + min_frames, min(start + max_frames, end - min_frames)
+            if lo >= hi:
+                break
+            cut = min(range(lo, hi), key=lambda j: db[j])
+            result.append(cut)
+            start = cut
+        result.append(end)
+    return result
+
+
+def stage_segment(pcm, sample_rate: int, channels: int, sample_width: int,
+                  min_pause_ms: int = 600, change_db: float = 10.0,
+                  min_segment_s: float = 5.0, max_segment_s: float = 60.0) -> List[Tuple[float, float]]:
+    """Stadio per ``AudioStageRunner``: PCM → lista di (inizio, fine) in secondi"""
+    db = _frame_db(pcm, sample_rate, channels, sample_width, FRAME_MS)
+    if not db:
+        return []
+    duration = len(memoryview(pcm)) / (sample_rate * channels * sample_width)
+    frames_per_s = 1000 / FRAME_MS
+
+    cuts = _cut_points(db, max(1, min_pause_ms // FRAME_MS), change_db)
+    bounds = _enforce_lengths([0, *cuts, len(db)], db,
+                              max(1, int(min_segment_s * frames_per_s)),
+                              max(2, int(max_segment_s * frames_per_s)))
+    seconds = [b / frames_per_s for b in bounds]
+    seconds[-1] = duration
+    return [(round(a, 3), round(b, 3)) for a, b in zip(seconds, seconds[1:]) if b > a]
+
+
+async def segment_file(audio_file_path: str) -> List[Tuple[float, float]]:
+    """Segmenti di un WAV, calcolati fuori dall'event loop"""
+    from .process_pool import get_stage_runner
+    from .wav_reader import WavFile
+
+    with WavFile(audio_file_path) as wav:
+        return await get_stage_runner().run(
+            stage_segment, wav.pcm,
+            sample_rate=wav.sample_rate, channels=wav.channels, sample_width=wav.sample_width,
+            min_pause_ms=Config.SEGMENT_MIN_PAUSE_MS,
+            min_segment_s=Config.SEGMENT_MIN_SECONDS,
+            max_segment_s=Config.SEGMENT_MAX_SECONDS,
+        )
@@ -0,0 +1,65 @@
+"""
+Segnale sintetico del registratore demo
+
+Tono a 440 Hz con due armoniche, modulazione d'ampiezza lenta e rumore.
+Il tempo è ricavato dal contatore dei campioni, non dall'orologio, e il
+rumore viene da un generatore con seed: a parità di seed (e di presenza di
+NumPy) l'output è identico byte per byte, qualunque sia la dimensione dei
+chunk letti e la velocità con cui vengono letti.
+"""
+from __future__ import annotations
+
+import importlib.util
+import math
+import random
+import struct
+from typing import Optional
+
+_HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+AMPLITUDE = 15000
+
+
+class DemoSignal:
+    """Sorgente del segnale demo, letta a chunk"""
+
+    def __init__(self, sample_rate: int, seed: Optional[int] = None, start_sample: int = 0) -> None:
+        self.sample_rate = sample_rate
+        self.seed = seed
+        self.position = start_sample
+        if _HAS_NUMPY:
+            import numpy as np
+            self._rng = np.random.default_rng(seed)
+        else:
+            self._rng = random.Random(seed)
+
+    def read(self, count: int) -> bytes:
+        """I prossimi ``count`` campioni mono 16-bit little-endian"""
+        start = self.position
+        self.position += count
+        if _HAS_NUMPY:
+            return self._read_numpy(start, count)
+
+        audio_data = []
+        two_pi = 2 * math.pi
+        for i in range(count):
+            t = (start + i) / self.sample_rate
+            tone = (math.sin(two_pi * 440 * t)
+                    + 0.3 * math.sin(two_pi * 880 * t)     # Ottava
+                    + 0.2 * math.sin(two_pi * 1320 * t))   # Quinta
+            amplitude_mod = 0.8 + 0.2 * math.sin(two_pi * 0.5 * t)
+            sample = amplitude_mod * tone + 0.1 * (self._rng.random() - 0.5)
+            audio_data.append(max(-32768, min(32767, int(sample * AMPLITUDE))))
+        return struct.pack('<' + 'h' * len(audio_data), *audio_data)
+
+    def _read_numpy(self, start: int, count: int) -> bytes:
+        import numpy as np
+
+        t = (start + np.arange(count, dtype=np.float64)) / self.sample_rate
+        two_pi = 2 * np.pi
+        tone = (np.sin(two_pi * 440 * t)
+                + 0.3 * np.sin(two_pi * 880 * t)
+                + 0.2 * np.sin(two_pi * 1320 * t))
+        amplitude_mod = 0.8 + 0.2 * np.sin(two_pi * 0.5 * t)
+        sample = amplitude_mod * tone + 0.1 * (self._rng.random(count) - 0.5)
+        return np.clip(np.trunc(sample * AMPLITUDE), -32768, 32767).astype("<i2").tobytes()
@@ -0,0 +1,222 @@
+"""
+Accesso condiviso ai file WAV
+
+``wav_info`` legge solo gli header RIFF (poche decine di byte, con seek tra i
+chunk) e restituisce formato e durata. ``WavFile`` mappa il file con ``mmap`` e
+serve il PCM come ``memoryview`` (o vista NumPy, se disponibile) senza copie;
+``slice`` restituisce una finestra temporale in O(1).
+
+Il parser percorre i chunk invece di assumere l'header canonico da 44 byte:
+gestisce chunk ``LIST``/``fact``/``JUNK`` prima o dopo ``fmt``, padding dei
+chunk dispari, ``WAVE_FORMAT_EXTENSIBLE`` e dimensioni ``data`` non finalizzate
+(0 o 0xFFFFFFFF, ad esempio di un ``arecord`` interrotto).
+"""
+from __future__ import annotations
+
+import importlib.util
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, Optional, Union
+
+PathLike = Union[str, Path]
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+_HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+class WavFormatError(ValueError):
+    """File non WAV o header non interpretabile"""
+
+
+class WavInfo(NamedTuple):
+    sample_rate: int
+    channels: int
+    sample_width: int      # byte per campione
+    format_tag: int
+    data_offset: int
+    data_size: int
+
+    @property
+    def frame_size(self) -> int:
+        return self.channels * self.sample_width
+
+    @property
+    def n_frames(self) -> int:
+        return self.data_size // self.frame_size if self.frame_size else 0
+
+    @property
+    def duration(self) -> float:
+        return self.n_frames / float(self.sample_rate) if self.sample_rate else 0.0
+
+
+def _parse_header(f: BinaryIO, file_size: int) -> WavInfo:
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        raise WavFormatError("header RIFF/WAVE mancante")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        body = offset + 8
+
+        if chunk_id == b"fmt ":
+            if chunk_size < 16:
+                raise WavFormatError("chunk fmt troppo corto")
+            raw = f.read(min(chunk_size, 40))
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", raw[:16])
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(raw) >= 26:
+                format_tag = struct.unpack("<H", raw[24:26])[0]
+            fmt = (format_tag, channels, sample_rate, (bits + 7) // 8)
+
+        elif chunk_id == b"data":
+            if fmt is None:
+                # data prima di fmt: cerca fmt più avanti e torna qui
+                rest = _find_fmt_after(f, body + chunk_size + (chunk_size & 1), file_size)
+                if rest is None:
+                    raise WavFormatError("chunk fmt mancante")
+                fmt = rest
+            available = file_size - body
+            # Header non finalizzato: usa quanto effettivamente presente su disco
+            if chunk_size == 0 or chunk_size == 0xFFFFFFFF or chunk_size > available:
+                chunk_size = available
+            format_tag, channels, sample_rate, sample_width = fmt
+            if channels <= 0 or sample_rate <= 0 or sample_width <= 0:
+                raise WavFormatError("parametri fmt non validi")
+            return WavInfo(sample_rate, channels, sample_width, format_tag, body, chunk_size)
+
+        # I chunk sono allineati a 2 byte
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise WavFormatError("chunk data mancante")
+
+
+def _find_fmt_after(f: BinaryIO, offset: int, file_size: int):
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        if chunk_id == b"fmt " and chunk_size >= 16:
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", f.read(16))
+            return (format_tag, channels, sample_rate, (bits + 7) // 8)
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def wav_info(path: PathLike) -> WavInfo:
+    """Metadati dal solo header, senza leggere il PCM"""
+    with open(path, "rb") as f:
+        return _parse_header(f, os.fstat(f.fileno()).st_size)
+
+
+class WavFile:
+    """WAV mappato in memoria con accesso zero-copy al PCM"""
+
+    def __init__(self, path: PathLike) -> None:
+        self.path = str(path)
+        self._file = open(self.path, "rb")
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            self.info = _parse_header(self._file, size)
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        except Exception:
+            self._file.close()
+            raise
+        self._view: Optional[memoryview] = None
+
+    def __enter__(self) -> "WavFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -- Metadati ----------------------------------------------------------
+
+    @property
+    def sample_rate(self) -> int:
+        return self.info.sample_rate
+
+    @property
+    def channels(self) -> int:
+        return self.info.channels
+
+    @property
+    def sample_width(self) -> int:
+        return self.info.sample_width
+
+    @property
+    def n_frames(self) -> int:
+        return self.info.n_frames
+
+    @property
+    def duration(self) -> float:
+        return self.info.duration
+
+    # -- Dati --------------------------------------------------------------
+
+    def raw(self) -> memoryview:
+        """L'intero file (header compresi), ad esempio per l'upload"""
+        if self._mmap is None:
+            return memoryview(b"")
+        if self._view is None:
+            self._view = memoryview(self._mmap)
+        return self._view
+
+    @property
+    def pcm(self) -> memoryview:
+        """Byte PCM del chunk data, troncati all'ultimo frame completo"""
+        start = self.info.data_offset
+        return self.raw()[start:start + self.info.n_frames * self.info.frame_size]
+
+    def slice(self, start: float = 0.0, end: Optional[float] = None) -> memoryview:
+        """PCM tra ``start`` ed ``end`` secondi (O(1), nessuna copia)"""
+        frame_size = self.info.frame_size
+        first = max(0, min(self.n_frames, int(start * self.sample_rate)))
+        last = self.n_frames if end is None else max(first, min(self.n_frames, int(end * self.sample_rate)))
+        return self.pcm[first * frame_size:last * frame_size]
+
+    def samples(self, start: float = 0.0, end: Optional[float] = None):
+        """Campioni interleaved: array NumPy (frames, canali) se disponibile, altrimenti memoryview tipizzata"""
+        view = self.slice(start, end)
+        if self.info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            dtype, code = "<f%d" % self.sample_width, {4: "f", 8: "d"}.get(self.sample_width)
+        else:
+            # PCM a 8 bit è unsigned, gli altri signed little-endian
+            dtype = "u1" if self.sample_width == 1 else "<i%d" % self.sample_width
+            code = {1: "B", 2: "h", 4: "i"}.get(self.sample_width)
+        if _HAS_NUMPY:
+            import numpy as np
+            return np.frombuffer(view, dtype=dtype).reshape(-1, self.channels)
+        if code is None:
+            raise WavFormatError(f"campioni a {self.sample_width} byte richiedono NumPy")
+        return view.cast(code)
+
+    def close(self) -> None:
+        if self._view is not None:
+            try:
+                self._view.release()
+            except BufferError:
+                pass
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Ci sono ancora viste esportate: la mappa si chiude con l'ultima
+                pass
+            self._mmap = None
+        self._file.close()
+
+
+def audio_duration(path: PathLike, default: Optional[float] = None) -> Optional[float]:
+    """Durata in secondi dall'header; ``default`` se il file non è leggibile"""
+    try:
+        return wav_info(path).duration
+    except (OSError, WavFormatError, struct.error) as e:
+        print(f"⚠️ Header WAV non leggibile ({Path(path).name}): {e}")
+        return default
@@ -2,45 +2,285 @@
 Configurazione dell'applicazione VibeTalking
 """
 import os
-from dotenv import load_dotenv
+from dotenv import dotenv_values, load_dotenv
 from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Variabili impostate dalla shell: hanno la precedenza sul file .env anche
+# quando il profilo viene ricaricato
+_SHELL_ENV = set(os.environ)
 
 # Carica le variabili d'ambiente
 load_dotenv()
 
+# Profili di prestazioni: ogni profilo fissa i valori predefiniti di worker,
+# dimensioni dei chunk, limiti delle cache, timeout e limiti di frequenza.
+# Una variabile d'ambiente con lo stesso nome ha sempre la precedenza.
+PERFORMANCE_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Uso dalla console: latenza bassa, comportamento storico
+    "interactive": {
+        "AUDIO_WORKERS": 0,              # 0 = numero di CPU
+        "SEGMENT_CONCURRENCY": 8,
+        "CHUNK_SIZE": 1024,
+        "AUDIO_BUS_QUEUE_CHUNKS": 256,
+        "AUDIO_BUS_BLOCK_TIMEOUT": 1.0,
+        "CHECKPOINT_MAX_ENTRIES": 0,     # 0 = nessun limite
+        "SQLITE_CACHE_KB": 2048,
+        "HTTP_TIMEOUT_SECONDS": 60.0,
+        "MODEL_MAX_RPM": 0,              # 0 = nessun limite
+        "MODEL_CALL_WORKERS": 16,        # thread per le chiamate ai modelli
+        "ANALYSIS_DEADLINE_SECONDS": 90.0,  # 0 = nessuna scadenza
+        "BATCH_MAX_SIZE": 1,             # 1 = richieste non raggruppate
+        "BATCH_MAX_WAIT_MS": 0.0,
+    },
+    # Rianalisi e import massivi: più parallelismo, richieste dosate sulla quota
+    "batch": {
+        "AUDIO_WORKERS": 0,
+        "SEGMENT_CONCURRENCY": 16,
+        "CHUNK_SIZE": 4096,
+        "AUDIO_BUS_QUEUE_CHUNKS": 1024,
+        "AUDIO_BUS_BLOCK_TIMEOUT": 5.0,
+        "CHECKPOINT_MAX_ENTRIES": 0,
+        "SQLITE_CACHE_KB": 16384,
+        "HTTP_TIMEOUT_SECONDS": 300.0,
+        "MODEL_MAX_RPM": 60,
+        "MODEL_CALL_WORKERS": 32,
+        "ANALYSIS_DEADLINE_SECONDS": 900.0,
+        "BATCH_MAX_SIZE": 8,
+        "BATCH_MAX_WAIT_MS": 250.0,
+    },
+    # Dispositivi piccoli (es. Raspberry Pi)
+    "low-memory": {
+        "AUDIO_WORKERS": 1,
+        "SEGMENT_CONCURRENCY": 2,
+        "CHUNK_SIZE": 1024,
+        "AUDIO_BUS_QUEUE_CHUNKS": 64,
+        "AUDIO_BUS_BLOCK_TIMEOUT": 1.0,
+        "CHECKPOINT_MAX_ENTRIES": 5000,
+        "SQLITE_CACHE_KB": 512,
+        "HTTP_TIMEOUT_SECONDS": 60.0,
+        "MODEL_MAX_RPM": 0,
+        "MODEL_CALL_WORKERS": 4,
+        "ANALYSIS_DEADLINE_SECONDS": 180.0,
+        "BATCH_MAX_SIZE": 4,
+        "BATCH_MAX_WAIT_MS": 100.0,
+    },
+}
+
+# Tipo e intervallo ammesso per ogni parametro dei profili
+PROFILE_SETTINGS: Dict[str, tuple] = {
+    "AUDIO_WORKERS": (int, 0, 256),
+    "SEGMENT_CONCURRENCY": (int, 1, 256),
+    "CHUNK_SIZE": (int, 64, 65536),
+    "AUDIO_BUS_QUEUE_CHUNKS": (int, 1, 1_000_000),
+    "AUDIO_BUS_BLOCK_TIMEOUT": (float, 0.0, 60.0),
+    "CHECKPOINT_MAX_ENTRIES": (int, 0, None),
+    "SQLITE_CACHE_KB": (int, 0, 1_048_576),
+    "HTTP_TIMEOUT_SECONDS": (float, 1.0, 3600.0),
+    "MODEL_MAX_RPM": (int, 0, 100_000),
+    "MODEL_CALL_WORKERS": (int, 1, 1024),
+    "ANALYSIS_DEADLINE_SECONDS": (float, 0.0, 86400.0),
+    "BATCH_MAX_SIZE": (int, 1, 64),
+    "BATCH_MAX_WAIT_MS": (float, 0.0, 10000.0),
+}
+
+
+def resolve_profile(name: str) -> Dict[str, Any]:
+    """Valori del profilo ``name`` con gli override dall'ambiente
+    
+    Solleva ValueError elencando tutti i parametri non validi.
+    """
+    if name not in PERFORMANCE_PROFILES:
+        raise ValueError(f"profilo di prestazioni sconosciuto: {name!r} "
+                         f"(disponibili: {', '.join(PERFORMANCE_PROFILES)})")
+    values: Dict[str, Any] = {}
+    errors = []
+    for key, (kind, minimum, maximum) in PROFILE_SETTINGS.items():
+        raw = os.getenv(key, PERFORMANCE_PROFILES[name].get(key))
+        try:
+            value = kind(raw)
+        except (TypeError, ValueError):
+            errors.append(f"{key}={raw!r} non è un {kind.__name__}")
+            continue
+        if value < minimum or (maximum is not None and value > maximum):
+            errors.append(f"{key}={value} fuori dall'intervallo [{minimum}, {maximum if maximum is not None else '∞'}]")
+            continue
+        values[key] = value
+    if errors:
+        raise ValueError(f"profilo {name!r} non valido: " + "; ".join(errors))
+    return values
+
 class Config:
     """Classe per la gestione della configurazione"""
     
     # API Keys
     GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+    GOOGLE_API_KEYS = os.getenv('GOOGLE_API_KEYS', '')  # "chiave1,chiave2:peso" per il pool
+    CLIENT_POOL_STRATEGY = os.getenv('CLIENT_POOL_STRATEGY', 'least_loaded')  # o round_robin
+    CLIENT_POOL_EJECT_SECONDS = float(os.getenv('CLIENT_POOL_EJECT_SECONDS', 60))
     
     # Configurazione Audio
     SAMPLE_RATE = int(os.getenv('DEFAULT_SAMPLE_RATE', 44100))
     CHANNELS = int(os.getenv('DEFAULT_CHANNELS', 1))
     AUDIO_FORMAT = os.getenv('AUDIO_FORMAT', 'wav')
-    CHUNK_SIZE = 1024
+    AUDIO_BUS_POLICY = os.getenv('AUDIO_BUS_POLICY', 'drop_oldest')  # block, drop_oldest, drop_newest
+    DEMO_SEED = os.getenv('DEMO_SEED', '')  # vuoto = seed nuovo a ogni registrazione demo
+    DEMO_SPEED = float(os.getenv('DEMO_SPEED', 1.0))  # 1 = tempo reale, N = N× più veloce, 0 = massimo
+    
+    # Cattura ALSA (arecord): buffer/periodo più ampi riducono gli overrun
+    ALSA_DEVICE = os.getenv('ALSA_DEVICE', '')  # vuoto = dispositivo predefinito
+    ALSA_BUFFER_TIME_US = int(os.getenv('ALSA_BUFFER_TIME_US', 500000))  # 0 = default di arecord
+    ALSA_PERIOD_TIME_US = int(os.getenv('ALSA_PERIOD_TIME_US', 100000))
+    ARECORD_MAX_RESTARTS = int(os.getenv('ARECORD_MAX_RESTARTS', 5))
+    ARECORD_FILL_GAPS = os.getenv('ARECORD_FILL_GAPS', 'true').lower() == 'true'  # silenzio nei buchi
+    
+    # Configurazione Prestazioni: i parametri di PROFILE_SETTINGS (CHUNK_SIZE,
+    # AUDIO_WORKERS, SEGMENT_CONCURRENCY, ...) arrivano dal profilo attivo
+    PERF_PROFILE = os.getenv('PERF_PROFILE', 'interactive')  # interactive, batch, low-memory
+    _profile_values: Dict[str, Any] = resolve_profile(PERF_PROFILE)
+    AUDIO_WORKERS = _profile_values['AUDIO_WORKERS']  # processi per gli stadi audio
+    SEGMENT_CONCURRENCY = _profile_values['SEGMENT_CONCURRENCY']  # segmenti analizzati in parallelo
+    CHUNK_SIZE = _profile_values['CHUNK_SIZE']  # frame per chunk di registrazione
+    AUDIO_BUS_QUEUE_CHUNKS = _profile_values['AUDIO_BUS_QUEUE_CHUNKS']  # coda per sottoscrittore
+    AUDIO_BUS_BLOCK_TIMEOUT = _profile_values['AUDIO_BUS_BLOCK_TIMEOUT']
+    CHECKPOINT_MAX_ENTRIES = _profile_values['CHECKPOINT_MAX_ENTRIES']  # output di stadio conservati
+    SQLITE_CACHE_KB = _profile_values['SQLITE_CACHE_KB']  # cache pagine per database, 0 = default
+    HTTP_TIMEOUT_SECONDS = _profile_values['HTTP_TIMEOUT_SECONDS']
+    MODEL_MAX_RPM = _profile_values['MODEL_MAX_RPM']  # richieste al minuto per modello
+    MODEL_CALL_WORKERS = _profile_values['MODEL_CALL_WORKERS']  # thread per le chiamate ai modelli
+    ANALYSIS_DEADLINE_SECONDS = _profile_values['ANALYSIS_DEADLINE_SECONDS']  # budget per analisi
+    BATCH_MAX_SIZE = _profile_values['BATCH_MAX_SIZE']  # registrazioni per richiesta raggruppata
+    BATCH_MAX_WAIT_MS = _profile_values['BATCH_MAX_WAIT_MS']  # attesa massima per riempire il gruppo
+    # Solo gli input brevi vengono raggruppati
+    BATCH_MAX_AUDIO_SECONDS = float(os.getenv('BATCH_MAX_AUDIO_SECONDS', 15))
+    BATCH_MAX_TEXT_WORDS = int(os.getenv('BATCH_MAX_TEXT_WORDS', 200))
+    # Quota del budget residuo per stadio (gli stadi non elencati non hanno scadenza)
+    DEADLINE_STAGE_WEIGHTS = os.getenv('DEADLINE_STAGE_WEIGHTS',
+                                       'fingerprint:1,segmentation:1,transcription:10,tone:4,summary:4')
+    
+    # Modelli e routing per stadio
+    MODEL_DEFAULT = os.getenv('MODEL_DEFAULT', 'gemini-2.0-flash-exp')
+    MODEL_LIGHT = os.getenv('MODEL_LIGHT', 'gemini-2.0-flash-lite')
+    MODEL_LONG_CONTEXT = os.getenv('MODEL_LONG_CONTEXT', 'gemini-1.5-pro')
+    ROUTING_ENABLED = os.getenv('ROUTING_ENABLED', 'true').lower() == 'true'
+    ROUTING_SLO_MS = int(os.getenv('ROUTING_SLO_MS', 8000))
+    ROUTING_SHORT_TEXT_WORDS = int(os.getenv('ROUTING_SHORT_TEXT_WORDS', 6))
+    ROUTING_LONG_AUDIO_SECONDS = int(os.getenv('ROUTING_LONG_AUDIO_SECONDS', 600))
+    
+    # Profilo di memoria (tracemalloc + RSS per registrazione e stadio)
+    MEMORY_PROFILE = os.getenv('MEMORY_PROFILE', 'false').lower() == 'true'
+    MEMORY_BUDGET_BASE_MB = float(os.getenv('MEMORY_BUDGET_BASE_MB', 64))
+    MEMORY_BUDGET_MB_PER_MINUTE = float(os.getenv('MEMORY_BUDGET_MB_PER_MINUTE', 16))
     
     # Configurazione Analisi
     TONE_ANALYSIS_ENABLED = os.getenv('TONE_ANALYSIS_ENABLED', 'true').lower() == 'true'
+    DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() == 'true'
+    DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', 0.3))  # similarità minima 0-1
     ANIMATION_ENABLED = os.getenv('ANIMATION_ENABLED', 'true').lower() == 'true'
     
+    # Timeline del tono per segmenti (solo audio lunghi)
+    SEGMENT_TIMELINE = os.getenv('SEGMENT_TIMELINE', 'true').lower() == 'true'
+    SEGMENT_MIN_AUDIO_SECONDS = float(os.getenv('SEGMENT_MIN_AUDIO_SECONDS', 60))
+    SEGMENT_MIN_SECONDS = float(os.getenv('SEGMENT_MIN_SECONDS', 5))
+    SEGMENT_MAX_SECONDS = float(os.getenv('SEGMENT_MAX_SECONDS', 60))
+    SEGMENT_MIN_PAUSE_MS = int(os.getenv('SEGMENT_MIN_PAUSE_MS', 600))
+    
+    # Monitor del tono durante "Registra fino a INVIO"
+    LIVE_MONITOR = os.getenv('LIVE_MONITOR', 'true').lower() == 'true'
+    LIVE_MONITOR_MODEL = os.getenv('LIVE_MONITOR_MODEL', 'false').lower() == 'true'
+    LIVE_WINDOW_SECONDS = float(os.getenv('LIVE_WINDOW_SECONDS', 5))
+    LIVE_INTERVAL_SECONDS = float(os.getenv('LIVE_INTERVAL_SECONDS', 2))
+    LIVE_CPU_BUDGET = float(os.getenv('LIVE_CPU_BUDGET', 0.2))  # frazione dell'intervallo
+    
+    # Riscaldamento dei client durante la registrazione
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_PROBE = os.getenv('WARMUP_PROBE', 'false').lower() == 'true'  # richiesta minima al modello
+    WARMUP_KEEPALIVE_SECONDS = float(os.getenv('WARMUP_KEEPALIVE_SECONDS', 20))  # 0 = nessun ping
+    WARMUP_MAX_KEEPALIVES = int(os.getenv('WARMUP_MAX_KEEPALIVES', 6))  # ping per registrazione
+    WARMUP_HOST = os.getenv('WARMUP_HOST', 'generativelanguage.googleapis.com')
+    
+    # Motori degli stadi (auto = scelta di src.ai.enginebench, altrimenti gemini)
+    TRANSCRIPTION_ENGINE = os.getenv('TRANSCRIPTION_ENGINE', 'auto')  # gemini, speech, demo
+    TONE_ENGINE = os.getenv('TONE_ENGINE', 'auto')  # gemini, keywords
+    SUMMARY_ENGINE = os.getenv('SUMMARY_ENGINE', 'auto')  # gemini, extractive
+    ENGINE_MIN_TRANSCRIPTION_ACCURACY = float(os.getenv('ENGINE_MIN_TRANSCRIPTION_ACCURACY', 0.8))  # 1 - WER
+    ENGINE_MIN_TONE_ACCURACY = float(os.getenv('ENGINE_MIN_TONE_ACCURACY', 0.7))  # tono principale
+    ENGINE_MIN_SUMMARY_ACCURACY = float(os.getenv('ENGINE_MIN_SUMMARY_ACCURACY', 0.3))  # F1 parole
+    
     # Configurazione Output
     OUTPUT_DIR = Path(os.getenv('OUTPUT_DIR', './recordings'))
     SAVE_TRANSCRIPTION = os.getenv('SAVE_TRANSCRIPTION', 'true').lower() == 'true'
     SAVE_TONE_ANALYSIS = os.getenv('SAVE_TONE_ANALYSIS', 'true').lower() == 'true'
+    STORAGE_SHARDING = os.getenv('STORAGE_SHARDING', 'true').lower() == 'true'  # AAAA/MM/GG
+    WRITE_BEHIND = os.getenv('WRITE_BEHIND', 'false').lower() == 'true'
+    CATALOG_PATH = Path(os.getenv('CATALOG_PATH', str(OUTPUT_DIR / 'catalog.sqlite3')))
+    FINGERPRINT_DB = Path(os.getenv('FINGERPRINT_DB', str(OUTPUT_DIR / 'fingerprints.sqlite3')))
+    CHECKPOINTS_ENABLED = os.getenv('CHECKPOINTS_ENABLED', 'true').lower() == 'true'
+    CHECKPOINT_DB = Path(os.getenv('CHECKPOINT_DB', str(OUTPUT_DIR / 'checkpoints.sqlite3')))
+    MEMORY_PROFILE_LOG = Path(os.getenv('MEMORY_PROFILE_LOG', str(OUTPUT_DIR / 'memory_profile.jsonl')))
+    CAPTURE_LOG = Path(os.getenv('CAPTURE_LOG', str(OUTPUT_DIR / 'capture_log.jsonl')))
+    WARMUP_LOG = Path(os.getenv('WARMUP_LOG', str(OUTPUT_DIR / 'warmup_log.jsonl')))
+    ROUTING_LOG = Path(os.getenv('ROUTING_LOG', str(OUTPUT_DIR / 'routing.jsonl')))
+    ROUTING_STATS = Path(os.getenv('ROUTING_STATS', str(OUTPUT_DIR / 'routing_stats.json')))
+    ENGINE_SELECTION_PATH = Path(os.getenv('ENGINE_SELECTION_PATH', str(OUTPUT_DIR / 'engine_selection.json')))
+    
+    # Archivio compresso delle registrazioni vecchie (python -m src.utils.archive)
+    ARCHIVE_DIR = Path(os.getenv('ARCHIVE_DIR', str(OUTPUT_DIR / 'archive')))
+    ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+    ARCHIVE_PACK_MB = float(os.getenv('ARCHIVE_PACK_MB', 256))  # 0 = un file .vtla per registrazione
+    ARCHIVE_BLOCK_SECONDS = float(os.getenv('ARCHIVE_BLOCK_SECONDS', 1.0))  # granularità delle letture
+    ARCHIVE_COMPRESSION_LEVEL = int(os.getenv('ARCHIVE_COMPRESSION_LEVEL', 6))  # zlib 1-9
+    
+    # Log append-only dei risultati
+    RESULTS_JSON_FILES = os.getenv('RESULTS_JSON_FILES', 'true').lower() == 'true'
+    RESULTS_LOG_ENABLED = os.getenv('RESULTS_LOG_ENABLED', 'true').lower() == 'true'
+    RESULTS_LOG_DIR = Path(os.getenv('RESULTS_LOG_DIR', str(OUTPUT_DIR / 'log')))
+    RESULTS_LOG_SEGMENT_BYTES = int(os.getenv('RESULTS_LOG_SEGMENT_BYTES', 16 * 1024 * 1024))
+    RESULTS_LOG_COMPACT_SEGMENTS = int(os.getenv('RESULTS_LOG_COMPACT_SEGMENTS', 8))
+    RESULTS_LOG_FSYNC = os.getenv('RESULTS_LOG_FSYNC', 'false').lower() == 'true'
     
     # Configurazione GUI
     WINDOW_WIDTH = 800
     WINDOW_HEIGHT = 600
     WINDOW_TITLE = "VibeTalking - Audio Recorder & Tone Analyzer"
     
+    @classmethod
+    def apply_profile(cls, name: Optional[str] = None) -> Dict[str, Any]:
+        """Attiva un profilo di prestazioni senza riavviare l'applicazione
+        
+        Rilegge il file .env (le variabili della shell restano prioritarie),
+        valida tutti i valori e solo allora li applica: con un profilo non
+        valido la configurazione corrente resta invariata.
+        """
+        previous = os.getenv('PERF_PROFILE')
+        for key, value in dotenv_values().items():
+            if key not in _SHELL_ENV and value is not None:
+                os.environ[key] = value
+        if name is None:
+            # Senza nome resta il profilo attivo, a meno che .env lo abbia cambiato
+            current = os.getenv('PERF_PROFILE')
+            name = current if current and current != previous else cls.PERF_PROFILE
+        values = resolve_profile(name)
+        for key, value in values.items():
+            setattr(cls, key, value)
+        cls.PERF_PROFILE = name
+        cls._profile_values = values
+        return values
+    
+    @classmethod
+    def profile_snapshot(cls) -> Dict[str, Any]:
+        """Profilo e valori effettivi, da salvare con i risultati"""
+        return {"name": cls.PERF_PROFILE, "settings": dict(cls._profile_values)}
+    
     @classmethod
     def validate_config(cls):
         """Valida la configurazione"""
         # In modalità demo, l'API key non è richiesta
-        if not cls.GOOGLE_API_KEY:
+        if not cls.GOOGLE_API_KEY and not cls.GOOGLE_API_KEYS:
             print("⚠️ GOOGLE_API_KEY non trovata - modalità demo attiva")
         
+        print(f"⚙️ Profilo prestazioni: {cls.PERF_PROFILE}")
+        
         # Crea la directory di output se non esiste
         cls.OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
         
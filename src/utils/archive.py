@@ -0,0 +1,383 @@
+"""
+Archiviazione a livelli delle registrazioni vecchie
+
+``recordings/`` conserva ogni WAV a 44.1 kHz per sempre. ``archive_old``
+sposta le registrazioni più vecchie di ``ARCHIVE_AFTER_DAYS`` giorni nel
+formato compresso senza perdita di ``audio.lossless``:
+
+- con ``ARCHIVE_PACK_MB`` > 0 le voci vengono accodate a file *pack*
+  (``archive/pack_00001.vtpk``, …) di circa quella dimensione, così l'archivio
+  non diventa milioni di file piccoli; con 0 ogni registrazione diventa un
+  ``.vtla`` accanto al percorso originale, sotto ``archive/``;
+- prima di cancellare il WAV la voce viene riletta e confrontata con lo
+  sha256 dell'originale; il catalogo registra dove si trova la voce.
+
+Le registrazioni archiviate restano nel catalogo con il loro percorso.
+``open_recording`` le rende leggibili in modo trasparente: decodifica in
+streaming, un blocco alla volta, solo quella voce e la riscrive al percorso
+originale per la durata dell'analisi (checkpoint, fingerprint e risultati
+vedono lo stesso percorso di prima). ``open_archived`` dà invece accesso
+diretto ai blocchi, ad esempio per leggere un intervallo senza ripristinare
+nulla. ``restore`` riporta una registrazione su disco in modo permanente.
+
+Chi legge una registrazione tiene un ``flock`` condiviso sul suo file di lock
+(``archive/locks/``), anche da processi diversi (console, ``reanalyze``);
+l'archiviazione lo chiede esclusivo senza attendere e salta le registrazioni
+in uso. L'ultimo lettore di un ripristino temporaneo rimuove il WAV, e l'ultimo
+a rilasciare il lock ne rimuove il file. I pack ricevono una voce alla volta:
+scrittura e verifica avvengono sotto un ``flock`` esclusivo su
+``archive/packs.lock``, anche tra processi (es. due ``archive run`` da cron).
+
+    python -m src.utils.archive run --older-than-days 30
+    python -m src.utils.archive stats
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import os
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from ..audio.lossless import ArchiveEntry, ArchiveFormatError, scan_entries, write_entry
+from ..config import Config
+from .catalog import get_catalog
+from .storage import finalize_file
+
+PACK_SUFFIX = ".vtpk"
+ENTRY_SUFFIX = ".vtla"
+
+# Un lock per percorso: la decodifica di una registrazione non blocca le altre
+_path_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+_path_locks_lock = threading.Lock()
+
+
+class RecordingInUseError(RuntimeError):
+    """La registrazione è letta da un'analisi (anche di un altro processo)"""
+
+
+# -- Lettura -------------------------------------------------------------------
+
+def iter_archive(directory: Optional[Path] = None) -> Iterator[Dict]:
+    """Voci presenti nell'archivio, con percorso originale e posizione"""
+    directory = Path(directory or Config.ARCHIVE_DIR)
+    if not directory.exists():
+        return
+    files = sorted(directory.rglob(f"*{PACK_SUFFIX}")) + sorted(directory.rglob(f"*{ENTRY_SUFFIX}"))
+    for path in files:
+        for offset, length in scan_entries(path):
+            try:
+                with ArchiveEntry(path, offset, length) as entry:
+                    index = entry.index
+                    yield {
+                        "source": index["source"],
+                        "created_at": index.get("created_at") or datetime.now().isoformat(),
+                        "archive_path": str(path),
+                        "offset": offset,
+                        "length": length,
+                        "duration": entry.duration,
+                        "sample_rate": entry.sample_rate,
+                        "channels": entry.channels,
+                        "size": index["size"],
+                    }
+            except (OSError, ArchiveFormatError, ValueError) as e:
+                print(f"⚠️ Voce d'archivio illeggibile ({path.name}@{offset}): {e}")
+
+
+def recording_available(path: str) -> bool:
+    """True se la registrazione è su disco oppure nell'archivio"""
+    return Path(path).exists() or get_catalog().archive_location(path) is not None
+
+
+def open_archived(path: str) -> ArchiveEntry:
+    """Voce d'archivio della registrazione, per letture in streaming (da chiudere)"""
+    location = get_catalog().archive_location(path)
+    if location is None:
+        raise FileNotFoundError(f"registrazione non archiviata: {path}")
+    return ArchiveEntry(location["archive_path"], location["archive_offset"], location["archive_length"])
+
+
+def _path_lock(path: str) -> threading.Lock:
+    with _path_locks_lock:
+        lock = _path_locks.get(path)
+        if lock is None:
+            lock = _path_locks[path] = threading.Lock()
+        return lock
+
+
+def _same_file(lock_file, lock_path: Path) -> bool:
+    try:
+        return os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+
+@contextlib.contextmanager
+def _usage_lock(path: str, mode: int) -> Iterator[None]:
+    """``flock`` sul file di lock della registrazione (condiviso tra processi)
+
+    Chi rilascia il lock per ultimo rimuove il file, così ``locks/`` contiene
+    solo le registrazioni in uso; chi ha aperto nel frattempo il file rimosso
+    se ne accorge dopo ``flock`` e riprova su quello nuovo.
+    """
+    lock_dir = Config.ARCHIVE_DIR / "locks"
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    lock_path = lock_dir / f"{hashlib.sha1(path.encode('utf-8')).hexdigest()}.lock"
+    while True:
+        lock_file = open(lock_path, "a")
+        try:
+            fcntl.flock(lock_file, mode)
+        except BaseException:
+            lock_file.close()
+            raise
+        if _same_file(lock_file, lock_path):
+            break
+        lock_file.close()
+    try:
+        yield
+    finally:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            pass  # altri lettori: il file resta a loro
+        else:
+            if _same_file(lock_file, lock_path):
+                lock_path.unlink()
+        lock_file.close()
+
+
+def _remove_if_unused(path: str) -> None:
+    """Rimuove un ripristino temporaneo se nessuno lo sta leggendo"""
+    lock = _path_lock(path)
+    with lock, contextlib.ExitStack() as stack:
+        try:
+            stack.enter_context(_usage_lock(path, fcntl.LOCK_EX | fcntl.LOCK_NB))
+        except BlockingIOError:
+            return  # lo rimuoverà l'ultimo lettore
+        if get_catalog().archive_location(path) is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+
+@contextlib.contextmanager
+def open_recording(path: str) -> Iterator[str]:
+    """Percorso leggibile della registrazione, ripristinata temporaneamente se archiviata
+
+    Più analisi concorrenti dello stesso file, anche in processi diversi,
+    condividono il ripristino; il WAV viene rimosso quando termina l'ultima.
+    """
+    path = str(path)
+    archived = False
+    with _usage_lock(path, fcntl.LOCK_SH):
+        with _path_lock(path):
+            location = get_catalog().archive_location(path)
+            archived = location is not None
+            if archived and not Path(path).exists():
+                print(f"📦 Decodifico dall'archivio: {Path(path).name}")
+                with ArchiveEntry(location["archive_path"], location["archive_offset"],
+                                  location["archive_length"]) as entry:
+                    entry.restore(path)
+        yield path
+    if archived:
+        _remove_if_unused(path)
+
+
+@contextlib.asynccontextmanager
+async def open_recording_async(path: str) -> AsyncIterator[str]:
+    """``open_recording`` con decodifica e pulizia in un thread, per le analisi asincrone"""
+    context = open_recording(path)
+    local_path = await asyncio.to_thread(context.__enter__)
+    try:
+        yield local_path
+    finally:
+        await asyncio.to_thread(context.__exit__, None, None, None)
+
+
+# -- Scrittura -----------------------------------------------------------------
+
+@contextlib.contextmanager
+def _pack_lock() -> Iterator[None]:
+    """``flock`` esclusivo sui pack: un solo processo alla volta vi accoda voci"""
+    Config.ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(Config.ARCHIVE_DIR / "packs.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _open_pack() -> Path:
+    """Pack a cui accodare la prossima voce (ne apre uno nuovo se l'ultimo è pieno)
+
+    Va chiamata tenendo ``_pack_lock``: una voce incompleta in fondo al pack è
+    allora davvero il resto di un crash, non la scrittura in corso di un altro
+    processo.
+    """
+    packs = sorted(Config.ARCHIVE_DIR.glob(f"pack_*{PACK_SUFFIX}"))
+    if packs:
+        last = packs[-1]
+        # Una voce interrotta da un crash viene scartata prima di accodare
+        valid_end = sum(length for _, length in scan_entries(last))
+        if valid_end != last.stat().st_size:
+            with open(last, "r+b") as f:
+                f.truncate(valid_end)
+        if valid_end < Config.ARCHIVE_PACK_MB * 1024 * 1024:
+            return last
+        number = int(last.stem.split("_")[1]) + 1
+    else:
+        number = 1
+    pack = Config.ARCHIVE_DIR / f"pack_{number:05d}{PACK_SUFFIX}"
+    pack.touch()
+    return pack
+
+
+def _entry_file(source: Path) -> Path:
+    try:
+        relative = source.resolve().relative_to(Config.OUTPUT_DIR.resolve())
+    except ValueError:
+        relative = Path(source.name)
+    return Config.ARCHIVE_DIR / relative.with_suffix(relative.suffix + ENTRY_SUFFIX)
+
+
+def archive_recording(row: Dict) -> Dict:
+    """Comprime una registrazione, verifica la voce, aggiorna il catalogo e rimuove il WAV
+
+    Solleva ``RecordingInUseError`` se un'analisi la sta leggendo.
+    """
+    try:
+        with _usage_lock(str(row["path"]), fcntl.LOCK_EX | fcntl.LOCK_NB):
+            return _archive_recording(row)
+    except BlockingIOError:
+        raise RecordingInUseError(row["path"]) from None
+
+
+def _verified_size(target: Path, offset: int, length: int, source: Path) -> int:
+    """Rilegge la voce e la confronta con l'originale; restituisce la dimensione del WAV"""
+    with ArchiveEntry(target, offset, length) as entry:
+        if not entry.verify():
+            raise ArchiveFormatError(f"verifica fallita per {source.name}: il WAV resta su disco")
+        return entry.index["size"]
+
+
+def _archive_recording(row: Dict) -> Dict:
+    source = Path(row["path"])
+    extra = {"created_at": row["created_at"]}
+    if Config.ARCHIVE_PACK_MB > 0:
+        # Scrittura e verifica sotto lo stesso lock: nessun altro processo può
+        # troncare o sovrascrivere la voce prima che il WAV venga rimosso
+        with _pack_lock():
+            target = _open_pack()
+            with open(target, "r+b") as f:
+                offset, length = write_entry(f, source, str(source), Config.ARCHIVE_BLOCK_SECONDS,
+                                             Config.ARCHIVE_COMPRESSION_LEVEL, extra)
+                f.flush()
+                os.fsync(f.fileno())
+            size = _verified_size(target, offset, length, source)
+    else:
+        target = _entry_file(source)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".part")
+        with open(tmp, "w+b") as f:
+            offset, length = write_entry(f, source, str(source), Config.ARCHIVE_BLOCK_SECONDS,
+                                         Config.ARCHIVE_COMPRESSION_LEVEL, extra)
+        finalize_file(tmp, target)
+        size = _verified_size(target, offset, length, source)
+
+    get_catalog().mark_archived(str(source), str(target), offset, length)
+    source.unlink()
+    return {"path": str(source), "archive": str(target), "size": size, "archived": length}
+
+
+def archive_old(older_than_days: Optional[float] = None, dry_run: bool = False,
+                limit: Optional[int] = None) -> Dict:
+    """Archivia le registrazioni più vecchie della soglia; restituisce i totali"""
+    days = Config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    rows = [r for r in get_catalog().archivable(cutoff) if Path(r["path"]).exists()]
+    if limit:
+        rows = rows[:limit]
+
+    totals = {"recordings": 0, "bytes_before": 0, "bytes_after": 0, "errors": 0, "in_use": 0}
+    started = time.perf_counter()
+    for row in rows:
+        if dry_run:
+            totals["recordings"] += 1
+            totals["bytes_before"] += row["size"] or 0
+            continue
+        try:
+            result = archive_recording(row)
+        except RecordingInUseError:
+            print(f"⏭️ {Path(row['path']).name} in uso da un'analisi: la archivio la prossima volta")
+            totals["in_use"] += 1
+            continue
+        except Exception as e:
+            print(f"⚠️ {Path(row['path']).name} non archiviata: {e}")
+            totals["errors"] += 1
+            continue
+        totals["recordings"] += 1
+        totals["bytes_before"] += result["size"]
+        totals["bytes_after"] += result["archived"]
+        print(f"📦 {Path(row['path']).name}: {result['size'] / 1e6:.1f} → {result['archived'] / 1e6:.1f} MB")
+    totals["elapsed_s"] = round(time.perf_counter() - started, 2)
+    return totals
+
+
+def restore(path: str) -> None:
+    """Riporta su disco in modo permanente una registrazione archiviata"""
+    with open_archived(path) as entry:
+        entry.restore(path)
+    get_catalog().add_recording(path)
+
+
+def archive_stats() -> Dict:
+    entries: List[Dict] = list(iter_archive())
+    files = {e["archive_path"] for e in entries}
+    return {
+        "recordings": len(entries),
+        "files": len(files),
+        "bytes_original": sum(e["size"] for e in entries),
+        "bytes_archived": sum(os.path.getsize(f) for f in files),
+        "hours": round(sum(e["duration"] for e in entries) / 3600, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archivio compresso delle registrazioni VibeTalking")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="archivia le registrazioni vecchie")
+    run_parser.add_argument("--older-than-days", type=float, default=None,
+                            help=f"soglia in giorni (default {Config.ARCHIVE_AFTER_DAYS:g})")
+    run_parser.add_argument("--limit", type=int, default=None, help="al più N registrazioni")
+    run_parser.add_argument("--dry-run", action="store_true", help="elenca senza archiviare")
+    restore_parser = sub.add_parser("restore", help="riporta su disco una registrazione")
+    restore_parser.add_argument("path")
+    sub.add_parser("stats", help="dimensioni dell'archivio")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        totals = archive_old(args.older_than_days, args.dry_run, args.limit)
+        verb = "da archiviare" if args.dry_run else "archiviate"
+        print(f"\n📊 {totals['recordings']} registrazioni {verb}, {totals['bytes_before'] / 1e6:.1f} MB")
+        if totals["bytes_after"]:
+            print(f"   archivio {totals['bytes_after'] / 1e6:.1f} MB "
+                  f"({100 * totals['bytes_after'] / totals['bytes_before']:.0f}%) in {totals['elapsed_s']:.1f} s")
+        if totals["in_use"]:
+            print(f"   {totals['in_use']} in uso da un'analisi, rimandate")
+        sys.exit(1 if totals["errors"] else 0)
+    elif args.command == "restore":
+        restore(args.path)
+        print(f"✅ Ripristinata: {args.path}")
+    else:
+        stats = archive_stats()
+        ratio = f" ({100 * stats['bytes_archived'] / stats['bytes_original']:.0f}%)" if stats["bytes_original"] else ""
+        print(f"📦 {stats['recordings']} registrazioni ({stats['hours']} h) in {stats['files']} file: "
+              f"{stats['bytes_original'] / 1e6:.1f} → {stats['bytes_archived'] / 1e6:.1f} MB{ratio}")
@@ -0,0 +1,445 @@
+"""
+Catalogo SQLite di registrazioni e analisi
+
+Tiene un indice di ``recordings/`` (percorso, durata, dimensione, sample rate,
+tono, analyzer, timestamp) così che "ultima registrazione" e "ultime N" siano
+lookup su indice invece di glob + sort + stat sull'intera cartella. Viene
+aggiornato in transazione dai registratori e da ``save_analysis_results``;
+``rebuild`` ricostruisce l'indice da una cartella già esistente.
+
+Trascrizioni e riassunti finiscono anche in un indice FTS5 (``analyses_fts``,
+rowid = ``analyses.id``) interrogabile con ``search``: ranking BM25, filtri su
+tono e data, stemming italiano leggero sulla query (vedi ``italian_text``).
+
+Le registrazioni archiviate (``utils.archive``) restano nel catalogo con il
+loro percorso originale; ``archive_path``/``archive_offset``/``archive_length``
+indicano la voce compressa da cui vengono decodificate su richiesta.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ..config import Config
+from . import tone_stats
+from .italian_text import query_terms
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT NOT NULL UNIQUE,
+    created_at  TEXT NOT NULL,
+    duration    REAL,
+    size        INTEGER,
+    sample_rate INTEGER,
+    channels    INTEGER,
+    archive_path   TEXT,
+    archive_offset INTEGER,
+    archive_length INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_created ON recordings(created_at);
+
+CREATE TABLE IF NOT EXISTS analyses (
+    id           INTEGER PRIMARY KEY,
+    path         TEXT NOT NULL UNIQUE,
+    recording_id INTEGER REFERENCES recordings(id) ON DELETE SET NULL,
+    audio_path   TEXT,
+    created_at   TEXT NOT NULL,
+    analyzer     TEXT,
+    tone         TEXT,
+    confidence   REAL,
+    intensity    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses(created_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_recording ON analyses(recording_id);
+CREATE INDEX IF NOT EXISTS idx_analyses_tone ON analyses(tone, created_at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(
+    transcription,
+    summary,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def _wav_info(path: Path) -> Dict:
+    """Durata e formato dall'header WAV"""
+    from ..audio.wav_reader import wav_info
+
+    try:
+        info = wav_info(path)
+        return {"duration": info.duration, "sample_rate": info.sample_rate, "channels": info.channels}
+    except Exception:
+        return {"duration": None, "sample_rate": None, "channels": None}
+
+
+class RecordingCatalog:
+    """Indice SQLite di registrazioni e analisi"""
+
+    def __init__(self, db_path: Optional[Path] = None) -> None:
+        self.db_path = Path(db_path or Config.CATALOG_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.is_new = not self.db_path.exists()
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if Config.SQLITE_CACHE_KB:
+            self.conn.execute(f"PRAGMA cache_size=-{Config.SQLITE_CACHE_KB}")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        existing = {row["name"] for row in self.conn.execute("SELECT name FROM sqlite_master")}
+        self.conn.executescript(SCHEMA)
+        self.conn.executescript(tone_stats.SCHEMA)
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(analyses)")}
+        if "intensity" not in columns:
+            self.conn.execute("ALTER TABLE analyses ADD COLUMN intensity TEXT")
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(recordings)")}
+        for column, kind in (("archive_path", "TEXT"), ("archive_offset", "INTEGER"),
+                             ("archive_length", "INTEGER")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE recordings ADD COLUMN {column} {kind}")
+        # Cataloghi creati prima dell'indice full-text o delle statistiche vanno reindicizzati
+        self.needs_rebuild = not self.is_new and not {"analyses_fts", "tone_stats"} <= existing
+
+    # -- Scrittura ---------------------------------------------------------
+
+    def _upsert_recording(self, path: Path, created_at: str) -> int:
+        info = _wav_info(path)
+        size = path.stat().st_size if path.exists() else None
+        cur = self.conn.execute(
+            """
+            INSERT INTO recordings (path, created_at, duration, size, sample_rate, channels)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                duration = excluded.duration,
+                size = excluded.size,
+                sample_rate = excluded.sample_rate,
+                channels = excluded.channels,
+                archive_path = NULL,
+                archive_offset = NULL,
+                archive_length = NULL
+            RETURNING id
+            """,
+            (str(path), created_at, info["duration"], size,
+             info["sample_rate"], info["channels"]),
+        )
+        return cur.fetchone()["id"]
+    
+    def _upsert_archived(self, path: str, created_at: str, archive_path: str, offset: int,
+                         length: int, info: Dict) -> None:
+        self.conn.execute(
+            """
+            INSERT INTO recordings (path, created_at, duration, size, sample_rate, channels,
+                                    archive_path, archive_offset, archive_length)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                archive_path = excluded.archive_path,
+                archive_offset = excluded.archive_offset,
+                archive_length = excluded.archive_length
+            """,
+            (path, created_at, info.get("duration"), info.get("size"), info.get("sample_rate"),
+             info.get("channels"), archive_path, offset, length),
+        )
+
+    def _upsert_analysis(self, path: Path, results: Dict) -> int:
+        audio_path = results.get("file_path")
+        recording_id = None
+        if audio_path:
+            row = self.conn.execute(
+                "SELECT id FROM recordings WHERE path = ?", (str(Path(audio_path)),)
+            ).fetchone()
+            recording_id = row["id"] if row else None
+
+        # Se l'analisi era già indicizzata, il vecchio contributo va tolto dagli aggregati
+        previous = self.conn.execute(
+            "SELECT created_at, tone, confidence, intensity FROM analyses WHERE path = ?",
+            (str(path),),
+        ).fetchone()
+        if previous:
+            tone_stats.apply(self.conn, previous["created_at"], previous["tone"],
+                             previous["confidence"], previous["intensity"], sign=-1)
+
+        tone = results.get("tone_analysis") or {}
+        confidence = tone.get("confidenza")
+        created_at = results.get("timestamp") or datetime.now().isoformat()
+        cur = self.conn.execute(
+            """
+            INSERT INTO analyses (path, recording_id, audio_path, created_at, analyzer, tone,
+                                  confidence, intensity)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                recording_id = excluded.recording_id,
+                audio_path = excluded.audio_path,
+                created_at = excluded.created_at,
+                analyzer = excluded.analyzer,
+                tone = excluded.tone,
+                confidence = excluded.confidence,
+                intensity = excluded.intensity
+            RETURNING id
+            """,
+            (str(path), recording_id, audio_path, created_at,
+             results.get("analyzer"), tone.get("tono_principale"),
+             confidence if isinstance(confidence, (int, float)) else None,
+             tone.get("intensità")),
+        )
+        analysis_id = cur.fetchone()["id"]
+        tone_stats.apply_results(self.conn, created_at, tone)
+        self.conn.execute("DELETE FROM analyses_fts WHERE rowid = ?", (analysis_id,))
+        self.conn.execute(
+            "INSERT INTO analyses_fts (rowid, transcription, summary) VALUES (?, ?, ?)",
+            (analysis_id, results.get("transcription") or "", results.get("summary") or ""),
+        )
+        return analysis_id
+
+    def add_recording(self, path: str, created_at: Optional[str] = None) -> int:
+        """Registra (o aggiorna) un file audio nel catalogo"""
+        with self._lock, self.conn:
+            return self._upsert_recording(Path(path), created_at or datetime.now().isoformat())
+
+    def add_analysis(self, path: str, results: Dict) -> int:
+        """Registra un file di risultati e lo collega alla sua registrazione"""
+        with self._lock, self.conn:
+            return self._upsert_analysis(Path(path), results)
+
+    def mark_archived(self, path: str, archive_path: str, offset: int, length: int) -> None:
+        """La registrazione ora vive nella voce d'archivio indicata"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE recordings SET archive_path = ?, archive_offset = ?, archive_length = ? "
+                "WHERE path = ?",
+                (str(archive_path), offset, length, str(path)),
+            )
+    
+    def archive_location(self, path: str) -> Optional[Dict]:
+        """Voce d'archivio della registrazione (None se non archiviata)"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT archive_path, archive_offset, archive_length FROM recordings "
+                "WHERE path = ? AND archive_path IS NOT NULL",
+                (str(path),),
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def archivable(self, before: str) -> List[Dict]:
+        """Registrazioni non archiviate create prima di ``before`` (ISO), dalla più vecchia"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM recordings WHERE archive_path IS NULL AND created_at < ? "
+                "ORDER BY created_at, id",
+                (before,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+    
+    def remove(self, path: str) -> None:
+        """Toglie dal catalogo una registrazione non più presente su disco
+
+        Le sue analisi restano di proposito: i file dei risultati esistono
+        ancora e restano cercabili e conteggiati nelle statistiche del tono;
+        ``recording_id`` diventa NULL (``ON DELETE SET NULL``).
+        """
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM recordings WHERE path = ?", (str(path),))
+
+    def rebuild(self, directory: Optional[Path] = None) -> Dict[str, int]:
+        """Ricostruisce il catalogo scansionando una cartella esistente"""
+        directory = Path(directory or Config.OUTPUT_DIR)
+        counts = {"recordings": 0, "analyses": 0}
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM analyses_fts")
+            self.conn.execute("DELETE FROM tone_stats")
+            self.conn.execute("DELETE FROM analyses")
+            self.conn.execute("DELETE FROM recordings")
+
+            for audio in directory.rglob(f"recording_*.{Config.AUDIO_FORMAT}"):
+                created = datetime.fromtimestamp(audio.stat().st_mtime).isoformat()
+                self._upsert_recording(audio, created)
+                counts["recordings"] += 1
+            
+            # Registrazioni archiviate: ritrovate dagli indici delle voci
+            from .archive import iter_archive
+            for entry in iter_archive():
+                if not Path(entry["source"]).exists():
+                    self._upsert_archived(entry["source"], entry["created_at"], entry["archive_path"],
+                                          entry["offset"], entry["length"], entry)
+                    counts["recordings"] += 1
+
+            for result_file in directory.rglob("*analysis_*.json"):
+                try:
+                    with open(result_file, 'r', encoding='utf-8') as f:
+                        results = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    continue
+                if not isinstance(results, dict):
+                    continue
+                self._upsert_analysis(result_file, results)
+                counts["analyses"] += 1
+
+            # Risultati presenti solo nel log append-only
+            from .results_log import ResultsLog
+            if Config.RESULTS_LOG_DIR.exists():
+                for record in ResultsLog().iter_records():
+                    if record.get("json_path") is None:
+                        self._upsert_analysis(Path(f"log:{record['id']}"), record["results"])
+                        counts["analyses"] += 1
+            self.conn.execute("INSERT INTO analyses_fts (analyses_fts) VALUES ('optimize')")
+        self.needs_rebuild = False
+        return counts
+
+    # -- Lettura -----------------------------------------------------------
+
+    def latest_recordings(self, limit: int = 5) -> List[Dict]:
+        """Ultime ``limit`` registrazioni, dalla più recente"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM recordings ORDER BY created_at DESC, id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def latest_analyses(self, limit: int = 5) -> List[Dict]:
+        """Ultime ``limit`` analisi, dalla più recente"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM analyses ORDER BY created_at DESC, id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def latest_recording(self) -> Optional[str]:
+        """Percorso dell'ultima registrazione ancora presente su disco"""
+        while True:
+            rows = self.latest_recordings(1)
+            if not rows:
+                return None
+            path = rows[0]["path"]
+            if Path(path).exists() or rows[0]["archive_path"]:
+                return path
+            self.remove(path)
+
+    def recording_paths(self) -> List[str]:
+        """Percorsi di tutte le registrazioni, dalla più vecchia"""
+        with self._lock:
+            rows = self.conn.execute("SELECT path FROM recordings ORDER BY created_at, id").fetchall()
+        return [r["path"] for r in rows]
+
+    def analyses_for(self, audio_path: str) -> List[Dict]:
+        """Analisi associate a una registrazione"""
+        with self._lock:
+            rows = self.conn.execute(
+                """
+                SELECT a.* FROM analyses a JOIN recordings r ON a.recording_id = r.id
+                WHERE r.path = ? ORDER BY a.created_at DESC
+                """,
+                (str(Path(audio_path)),),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def search(self, query: str, tone: Optional[str] = None,
+               since: Optional[str] = None, until: Optional[str] = None,
+               limit: int = 20) -> List[Dict]:
+        """Ricerca full-text su trascrizioni e riassunti
+
+        ``since``/``until`` sono date o timestamp ISO (``until`` escluso);
+        i risultati sono ordinati per rilevanza BM25.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        match = " AND ".join(f'"{t}"*' for t in terms)
+
+        sql = """
+            SELECT a.*, bm25(analyses_fts) AS score,
+                   snippet(analyses_fts, -1, '[', ']', '…', 12) AS snippet
+            FROM analyses_fts JOIN analyses a ON a.id = analyses_fts.rowid
+            WHERE analyses_fts MATCH ?
+        """
+        params: List = [match]
+        if tone:
+            sql += " AND a.tone = ?"
+            params.append(tone)
+        if since:
+            sql += " AND a.created_at >= ?"
+            params.append(since)
+        if until:
+            sql += " AND a.created_at < ?"
+            params.append(until)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(r) for r in rows]
+
+    def tone_timeline(self, granularity: str = "day", since: Optional[str] = None,
+                      until: Optional[str] = None) -> List[Dict]:
+        """Distribuzione dei toni per ora o giorno (aggregati incrementali)"""
+        with self._lock:
+            return tone_stats.query(self.conn, granularity, since, until)
+
+    def backfill_tone_stats(self) -> int:
+        """Ricalcola gli aggregati del tono con una passata sullo storico"""
+        with self._lock:
+            return tone_stats.backfill(self.conn)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "recordings": self.conn.execute("SELECT COUNT(*) FROM recordings").fetchone()[0],
+                "analyses": self.conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0],
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+_catalog: Optional[RecordingCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> RecordingCatalog:
+    """Catalogo condiviso; al primo avvio indicizza i file già presenti"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = RecordingCatalog()
+            if (_catalog.is_new or _catalog.needs_rebuild) and Config.OUTPUT_DIR.exists():
+                _catalog.rebuild()
+        return _catalog
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Catalogo registrazioni VibeTalking")
+    parser.add_argument("command", choices=["rebuild", "stats", "search", "tones", "backfill-tones"])
+    parser.add_argument("argument", nargs="?", default=None,
+                        help="cartella per rebuild, testo per search")
+    parser.add_argument("--tone", default=None)
+    parser.add_argument("--since", default=None)
+    parser.add_argument("--until", default=None)
+    parser.add_argument("--granularity", choices=["hour", "day"], default="day")
+    args = parser.parse_args()
+
+    catalog = RecordingCatalog()
+    if args.command == "rebuild":
+        result = catalog.rebuild(Path(args.argument) if args.argument else None)
+        print(f"✅ Catalogo ricostruito: {result['recordings']} registrazioni, {result['analyses']} analisi")
+    elif args.command == "search":
+        for hit in catalog.search(args.argument or "", args.tone, args.since, args.until):
+            print(f"{hit['created_at'][:19]}  {hit['tone'] or '-':<12} {Path(hit['path']).name}")
+            print(f"    {hit['snippet']}")
+    elif args.command == "tones":
+        for bucket in catalog.tone_timeline(args.granularity, args.since, args.until):
+            tones = ", ".join(f"{tone} {info['count']}" for tone, info in bucket["tones"].items())
+            print(f"{bucket['bucket']}  ({bucket['total']})  {tones}")
+    elif args.command == "backfill-tones":
+        print(f"✅ Statistiche ricalcolate su {catalog.backfill_tone_stats()} analisi")
+    else:
+        result = catalog.counts()
+        print(f"📊 {result['recordings']} registrazioni, {result['analyses']} analisi")
@@ -0,0 +1,64 @@
+"""
+Normalizzazione del testo italiano per la ricerca full-text
+
+Stemmer "leggero" a rimozione di suffissi: lo stem risultante è sempre un
+prefisso della parola (senza accenti), quindi una query a prefisso sullo stem
+trova tutte le forme flesse indicizzate da FTS5 con ``remove_diacritics``.
+"""
+import re
+import unicodedata
+from typing import List
+
+STOPWORDS = frozenset("""
+a ad al allo ai agli all alla alle anche che chi ci come con contro cui da dal
+dallo dai dagli dall dalla dalle del dello dei degli dell della delle di e ed
+è era erano essere gli ha hanno ho i il in io la le lei lo loro lui ma mi mia
+mio ne negli nei nel nello nell nella nelle noi non o per perché più quale
+quando quella quelle quelli quello questa queste questi questo se sei si sia
+siamo siete sono su sul sullo sui sugli sull sulla sulle suo sua suoi sue
+tra fra tu tua tuo un una uno vi voi
+""".split())
+
+# Suffissi derivazionali, dal più lungo al più corto
+_SUFFIXES = (
+    "amente", "azioni", "azione", "imento", "imenti", "mente", "zioni", "zione",
+    "issimo", "issima", "issimi", "issime", "abile", "abili", "ibile", "ibili",
+    "ista", "isti", "iste", "ismo", "ismi",
+)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fold_accents(text: str) -> str:
+    """Minuscolo senza diacritici"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(word: str) -> str:
+    """Stem leggero di una parola italiana"""
+    word = fold_accents(word)
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            word = word[:-len(suffix)]
+            break
+    # Vocale finale di genere/numero
+    if len(word) > 4 and word[-1] in "aeiou":
+        word = word[:-1]
+        if word.endswith(("h", "i")) and len(word) > 4:
+            word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Parole significative (senza stopword) nell'ordine originale"""
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def query_terms(query: str) -> List[str]:
+    """Stem della query, senza duplicati"""
+    seen: List[str] = []
+    for word in tokenize(query):
+        term = stem(word)
+        if term and term not in seen:
+            seen.append(term)
+    return seen
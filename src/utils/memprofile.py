@@ -0,0 +1,219 @@
+"""
+Profilo di memoria per registrazione e per stadio
+
+Con ``MEMORY_PROFILE=true`` ogni analisi registra, per l'intera registrazione
+e per ciascuno stadio della pipeline:
+
+- picco delle allocazioni Python (``tracemalloc``, include gli array NumPy)
+  sopra il livello all'ingresso dello stadio;
+- picco di RSS del processo. Su Linux il picco viene azzerato all'inizio di
+  ogni stadio (``/proc/self/clear_refs``); altrove si usa ``ru_maxrss``, che
+  è il massimo dall'avvio del processo;
+- le righe di codice con la crescita maggiore tra inizio e fine analisi.
+
+Gli stadi possono sovrapporsi (segmenti analizzati in parallelo): un picco
+viene attribuito a tutti gli stadi aperti in quel momento. Il lavoro svolto
+nel pool di processi (fingerprint, segmentazione) non pesa sull'RSS misurato,
+solo sui buffer condivisi creati qui. I record finiscono
+in ``recordings/memory_profile.jsonl``; ``python -m src.ai.membench`` li
+confronta tra esecuzioni e verifica i budget per durata.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from ..config import Config
+
+MB = 1024 * 1024
+_STATUS = Path("/proc/self/status")
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+# Stadi della registrazione in corso nel task/thread corrente
+_current_stages: ContextVar[Optional[Dict[str, Dict]]] = ContextVar("memprofile_stages", default=None)
+
+
+def _status_kb(field: str) -> Optional[int]:
+    try:
+        match = re.search(rf"^{field}:\s+(\d+) kB", _STATUS.read_text(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) if match else None
+
+
+def current_rss_mb() -> float:
+    kb = _status_kb("VmRSS")
+    if kb is None:
+        return peak_rss_mb()
+    return kb / 1024
+
+
+def peak_rss_mb() -> float:
+    kb = _status_kb("VmHWM")
+    if kb is None:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            kb //= 1024  # macOS riporta byte
+    return kb / 1024
+
+
+def reset_rss_peak() -> bool:
+    """Azzera il picco di RSS (solo Linux); False se non supportato"""
+    try:
+        _CLEAR_REFS.write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+class _Frame:
+    """Uno stadio aperto"""
+
+    def __init__(self, name: str, traced_start: int, rss_start: float) -> None:
+        self.name = name
+        self.traced_start = traced_start
+        self.rss_start = rss_start
+        self.traced_peak = traced_start
+        self.rss_peak = rss_start
+        self.started = time.perf_counter()
+
+
+class MemoryProfiler:
+    """Picchi di memoria per registrazione e per stadio"""
+
+    def __init__(self, top: int = 10, log_path: Optional[Path] = None) -> None:
+        self.top = top
+        self.log_path = Path(log_path or Config.MEMORY_PROFILE_LOG)
+        self._lock = threading.Lock()
+        self._open: List[_Frame] = []
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # -- Picchi su intervalli sovrapposti ---------------------------------
+
+    def _fold_peaks(self) -> None:
+        """Aggiorna i picchi di tutti gli stadi aperti (da chiamare con il lock)"""
+        _, traced_peak = tracemalloc.get_traced_memory()
+        rss_peak = peak_rss_mb()
+        for frame in self._open:
+            frame.traced_peak = max(frame.traced_peak, traced_peak)
+            frame.rss_peak = max(frame.rss_peak, rss_peak)
+
+    def _enter(self, name: str) -> _Frame:
+        with self._lock:
+            self._fold_peaks()
+            tracemalloc.reset_peak()
+            reset_rss_peak()
+            frame = _Frame(name, tracemalloc.get_traced_memory()[0], current_rss_mb())
+            self._open.append(frame)
+            return frame
+
+    def _exit(self, frame: _Frame) -> Dict:
+        with self._lock:
+            self._fold_peaks()
+            self._open.remove(frame)
+        return {
+            "traced_peak_mb": round((frame.traced_peak - frame.traced_start) / MB, 2),
+            "rss_peak_mb": round(frame.rss_peak, 1),
+            "rss_growth_mb": round(frame.rss_peak - frame.rss_start, 1),
+            "seconds": round(time.perf_counter() - frame.started, 3),
+        }
+
+    # -- API -------------------------------------------------------------
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Misura uno stadio; più esecuzioni dello stesso stadio vengono aggregate"""
+        frame = self._enter(name)
+        try:
+            yield
+        finally:
+            stats = self._exit(frame)
+            stages = _current_stages.get()
+            if stages is None:
+                return
+            with self._lock:
+                agg = stages.setdefault(name, {"runs": 0, "traced_peak_mb": 0.0, "rss_peak_mb": 0.0,
+                                               "rss_growth_mb": 0.0, "seconds": 0.0})
+                agg["runs"] += 1
+                for key in ("traced_peak_mb", "rss_peak_mb", "rss_growth_mb"):
+                    agg[key] = max(agg[key], stats[key])
+                agg["seconds"] = round(agg["seconds"] + stats["seconds"], 3)
+
+    @contextmanager
+    def recording(self, audio_path: str, duration_s: Optional[float] = None) -> Iterator[Dict]:
+        """Profilo di un'intera analisi; il dizionario restituito viene riempito all'uscita"""
+        record: Dict = {"path": audio_path, "duration_s": duration_s}
+        stages: Dict[str, Dict] = {}
+        token = _current_stages.set(stages)
+        before = tracemalloc.take_snapshot()
+        frame = self._enter("total")
+        try:
+            yield record
+        finally:
+            record["total"] = self._exit(frame)
+            _current_stages.reset(token)
+            record["stages"] = stages
+            # Memoria ancora occupata a fine analisi: candidati per la crescita dell'RSS
+            after = tracemalloc.take_snapshot()
+            record["top_growth"] = [
+                f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} {stat.size_diff / 1024:+.0f} KB"
+                for stat in after.compare_to(before, "lineno")[:self.top]
+                if stat.size_diff > 0
+            ]
+            record["timestamp"] = datetime.now().isoformat()
+            self._append(record)
+
+    def _append(self, record: Dict) -> None:
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(self.log_path), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"⚠️ Profilo di memoria non salvato: {e}")
+
+
+def memory_budget_mb(duration_s: float) -> float:
+    """Picco ammesso per una registrazione della durata indicata"""
+    return Config.MEMORY_BUDGET_BASE_MB + Config.MEMORY_BUDGET_MB_PER_MINUTE * duration_s / 60
+
+
+def load_records(log_path: Optional[Path] = None) -> List[Dict]:
+    path = Path(log_path or Config.MEMORY_PROFILE_LOG)
+    if not path.exists():
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # riga troncata da un crash
+    return records
+
+
+_profiler: Optional[MemoryProfiler] = None
+
+
+def get_memory_profiler() -> Optional[MemoryProfiler]:
+    """Profiler condiviso, oppure None se ``MEMORY_PROFILE`` è disattivato"""
+    global _profiler
+    if not Config.MEMORY_PROFILE:
+        return None
+    if _profiler is None:
+        _profiler = MemoryProfiler()
+    return _profiler
@@ -0,0 +1,293 @@
+"""
+Log append-only dei risultati di analisi
+
+Ogni analisi diventa una riga JSON compatta in un segmento
+``recordings/log/segment-<seq>.jsonl``; quando un segmento supera
+``Config.RESULTS_LOG_SEGMENT_BYTES`` si passa al successivo. Ogni
+``RESULTS_LOG_COMPACT_SEGMENTS`` segmenti chiusi, un thread in background li
+compatta in ``segment-<primo>-<ultimo>.jsonl.gz`` (deduplicando per ID, vince
+l'ultima versione): i compattati precedenti non vengono riletti, quindi il costo
+di ogni compattazione non cresce con lo storico. La lettura è un'unica
+scansione sequenziale, da cui derivano gli export CSV e colonnari per i report.
+
+Formato di un record::
+
+    {"id": "...", "saved_at": "...", "json_path": "..." | null, "results": {...}}
+"""
+from __future__ import annotations
+
+import csv
+import fcntl
+import gzip
+import importlib.util
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ..config import Config
+from .storage import atomic_open, new_id
+
+_SEGMENT_RE = re.compile(r"^segment-(\d{8})(?:-(\d{8}))?\.jsonl(\.gz)?$")
+
+# Colonne dell'export tabellare: (nome, funzione di estrazione dal record)
+EXPORT_COLUMNS: List[Tuple[str, Callable[[Dict], Any]]] = [
+    ("id", lambda r: r.get("id")),
+    ("saved_at", lambda r: r.get("saved_at")),
+    ("timestamp", lambda r: r["results"].get("timestamp")),
+    ("file_path", lambda r: r["results"].get("file_path")),
+    ("analyzer", lambda r: r["results"].get("analyzer")),
+    ("tono_principale", lambda r: (r["results"].get("tone_analysis") or {}).get("tono_principale")),
+    ("intensità", lambda r: (r["results"].get("tone_analysis") or {}).get("intensità")),
+    ("confidenza", lambda r: (r["results"].get("tone_analysis") or {}).get("confidenza")),
+    ("transcription", lambda r: r["results"].get("transcription")),
+    ("summary", lambda r: r["results"].get("summary")),
+]
+
+
+class ResultsLog:
+    """Log segmentato append-only dei risultati"""
+
+    def __init__(self, directory: Optional[Path] = None) -> None:
+        self.directory = Path(directory or Config.RESULTS_LOG_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_path = self.directory / ".lock"
+        self._compactor: Optional[threading.Thread] = None
+
+    @contextmanager
+    def _exclusive(self):
+        """Lock tra thread e tra processi che scrivono sullo stesso log"""
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # -- Segmenti ----------------------------------------------------------
+
+    def _segments(self) -> List[Tuple[int, int, Path]]:
+        """Segmenti ordinati come (primo seq, ultimo seq, percorso)"""
+        segments = []
+        for entry in self.directory.iterdir():
+            match = _SEGMENT_RE.match(entry.name)
+            if match:
+                first = int(match.group(1))
+                last = int(match.group(2) or first)
+                segments.append((first, last, entry))
+        segments.sort(key=lambda s: (s[0], s[1]))
+
+        # Segmenti già confluiti in un compattato più ampio (crash durante
+        # la compattazione, prima della rimozione dei vecchi segmenti)
+        compacted = [(f, l) for f, l, p in segments if p.suffix == ".gz"]
+        live = []
+        for first, last, path in segments:
+            if any(f <= first and last <= l and (f, l) != (first, last) for f, l in compacted):
+                path.unlink(missing_ok=True)
+                continue
+            live.append((first, last, path))
+        return live
+
+    def _active_segment(self) -> Path:
+        segments = self._segments()
+        if segments:
+            first, last, path = segments[-1]
+            if path.suffix != ".gz" and path.stat().st_size < Config.RESULTS_LOG_SEGMENT_BYTES:
+                return path
+            next_seq = last + 1
+        else:
+            next_seq = 1
+        return self.directory / f"segment-{next_seq:08d}.jsonl"
+
+    # -- Scrittura ---------------------------------------------------------
+
+    def append(self, results: Dict, json_path: Optional[str] = None,
+               record_id: Optional[str] = None) -> str:
+        """Aggiunge un risultato al log e ne restituisce l'ID"""
+        record = {
+            "id": record_id or new_id(),
+            "saved_at": datetime.now().isoformat(),
+            "json_path": json_path,
+            "results": results,
+        }
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+        with self._exclusive():
+            segment = self._active_segment()
+            fd = os.open(str(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, line)
+                if Config.RESULTS_LOG_FSYNC:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            rotated = segment.stat().st_size >= Config.RESULTS_LOG_SEGMENT_BYTES
+
+        if rotated:
+            self._compact_in_background()
+        return record["id"]
+
+    def _compact_in_background(self) -> None:
+        """Avvia ``maybe_compact`` fuori dal percorso di salvataggio (una alla volta)"""
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self._compact_safely, name="results-log-compact",
+                                               daemon=True)
+            self._compactor.start()
+
+    def _compact_safely(self) -> None:
+        try:
+            self.maybe_compact()
+        except Exception as e:
+            print(f"⚠️ Compattazione del log non riuscita: {e}")
+
+    def _closed_segments(self) -> List[Tuple[int, int, Path]]:
+        """Segmenti non compressi che non ricevono più scritture (tutti tranne l'ultimo)"""
+        return [s for s in self._segments()[:-1] if s[2].suffix != ".gz"]
+
+    def maybe_compact(self) -> bool:
+        """Compatta se ci sono abbastanza segmenti chiusi"""
+        if len(self._closed_segments()) < Config.RESULTS_LOG_COMPACT_SEGMENTS:
+            return False
+        return self.compact() is not None
+
+    def compact(self) -> Optional[Path]:
+        """Unisce i segmenti chiusi non compressi in un segmento gzip deduplicato
+
+        I segmenti chiusi non cambiano più, quindi vengono letti e compressi
+        senza il lock: le scritture continuano sul segmento attivo. Il lock
+        serve solo per scegliere i segmenti e per rimuoverli alla fine. I
+        record sono letti in streaming due volte (ultima posizione di ogni ID,
+        poi scrittura), senza tenerli in memoria.
+        """
+        with self._exclusive():
+            to_merge = self._closed_segments()
+        if not to_merge:
+            return None
+        first, last = to_merge[0][0], to_merge[-1][1]
+
+        last_position: Dict[str, int] = {}
+        target = self.directory / f"segment-{first:08d}-{last:08d}.jsonl.gz"
+        try:
+            position = 0
+            for _, _, path in to_merge:
+                for record in self._read_segment(path):
+                    last_position[record["id"]] = position
+                    position += 1
+
+            position = 0
+            with atomic_open(target, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                for _, _, path in to_merge:
+                    for record in self._read_segment(path):
+                        if last_position[record["id"]] == position:
+                            gz.write((json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                                     .encode("utf-8"))
+                        position += 1
+        except FileNotFoundError:
+            return None  # già compattati da un altro processo
+
+        with self._exclusive():
+            for _, _, path in to_merge:
+                path.unlink(missing_ok=True)
+        print(f"🗜️ Log compattato: {len(to_merge)} segmenti → {target.name} ({len(last_position)} record)")
+        return target
+
+    # -- Lettura -----------------------------------------------------------
+
+    @staticmethod
+    def _read_segment(path: Path) -> Iterator[Dict]:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rb") as f:
+            for raw in f:
+                # Una riga senza newline è una scrittura interrotta
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    yield json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+
+    def iter_records(self) -> Iterator[Dict]:
+        """Scansione sequenziale di tutti i record, dal più vecchio"""
+        for _, _, path in self._segments():
+            yield from self._read_segment(path)
+
+    def stats(self) -> Dict:
+        segments = self._segments()
+        return {
+            "segments": len(segments),
+            "compacted": sum(1 for s in segments if s[2].suffix == ".gz"),
+            "bytes": sum(s[2].stat().st_size for s in segments),
+        }
+
+    # -- Export ------------------------------------------------------------
+
+    def export_csv(self, output: Path) -> int:
+        """Esporta tutti i record in CSV con una sola passata"""
+        count = 0
+        with atomic_open(output, "w", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow([name for name, _ in EXPORT_COLUMNS])
+            for record in self.iter_records():
+                writer.writerow([extract(record) for _, extract in EXPORT_COLUMNS])
+                count += 1
+        return count
+
+    def export_columnar(self, output: Path) -> int:
+        """Export colonnare: Parquet se pyarrow è disponibile, altrimenti JSON gzip per colonna"""
+        columns: Dict[str, list] = {name: [] for name, _ in EXPORT_COLUMNS}
+        for record in self.iter_records():
+            for name, extract in EXPORT_COLUMNS:
+                columns[name].append(extract(record))
+        count = len(columns["id"])
+
+        if importlib.util.find_spec("pyarrow") is not None:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            with atomic_open(output, "wb") as f:
+                pq.write_table(pa.table(columns), f)
+        else:
+            with atomic_open(output, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                gz.write(json.dumps(columns, ensure_ascii=False).encode("utf-8"))
+        return count
+
+
+_results_log: Optional[ResultsLog] = None
+
+
+def get_results_log() -> ResultsLog:
+    global _results_log
+    if _results_log is None:
+        _results_log = ResultsLog()
+    return _results_log
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Log dei risultati VibeTalking")
+    parser.add_argument("command", choices=["stats", "compact", "export-csv", "export-columnar"])
+    parser.add_argument("output", nargs="?", default=None)
+    args = parser.parse_args()
+
+    log = ResultsLog()
+    if args.command == "stats":
+        info = log.stats()
+        print(f"📊 {info['segments']} segmenti ({info['compacted']} compattati), {info['bytes']:,} bytes")
+    elif args.command == "compact":
+        if not log.compact():
+            print("📂 Niente da compattare")
+    else:
+        if not args.output:
+            parser.error("specifica il file di output")
+        if args.command == "export-csv":
+            n = log.export_csv(Path(args.output))
+        else:
+            n = log.export_columnar(Path(args.output))
+        print(f"✅ Esportati {n} record in {args.output}")
@@ -0,0 +1,195 @@
+"""
+Storage su disco di registrazioni e risultati
+
+- ID univoci e ordinabili (timestamp al microsecondo + suffisso casuale), così
+  due file creati nello stesso secondo non si sovrascrivono.
+- Sottocartelle per data (``recordings/AAAA/MM/GG/``) invece di un'unica
+  cartella piatta.
+- Scritture atomiche: file temporaneo nella stessa cartella, fsync, rename.
+  Un crash lascia al più un ``.tmp`` orfano, mai un JSON troncato.
+- Coda write-behind opzionale (``Config.WRITE_BEHIND``) che sposta fsync e
+  rename su un thread dedicato.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import queue
+import secrets
+import tempfile
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, IO, Iterator, Optional, Union
+
+from ..config import Config
+from .catalog import get_catalog
+
+PathLike = Union[str, Path]
+
+# mkstemp crea file 0600: i file finali seguono invece la umask del processo
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def new_id(when: Optional[datetime] = None) -> str:
+    """ID univoco, ordinabile lessicograficamente per data"""
+    when = when or datetime.now()
+    return f"{when:%Y%m%d_%H%M%S_%f}_{secrets.token_hex(3)}"
+
+
+def shard_dir(when: Optional[datetime] = None, base: Optional[Path] = None) -> Path:
+    """Cartella di destinazione per la data indicata"""
+    base = Path(base or Config.OUTPUT_DIR)
+    if not Config.STORAGE_SHARDING:
+        return base
+    when = when or datetime.now()
+    return base / f"{when:%Y}" / f"{when:%m}" / f"{when:%d}"
+
+
+def new_path(prefix: str, extension: str, when: Optional[datetime] = None) -> Path:
+    """Percorso nuovo e non ancora usato, es. ``recording_<id>.wav``"""
+    when = when or datetime.now()
+    directory = shard_dir(when)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{prefix}_{new_id(when)}.{extension}"
+
+
+def _fsync_dir(directory: Path) -> None:
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(path: PathLike, mode: str = "wb", encoding: Optional[str] = None) -> Iterator[IO]:
+    """Apre un file temporaneo che sostituisce ``path`` solo a scrittura completata"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        os.fchmod(fd, 0o666 & ~_UMASK)
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+
+
+def atomic_write_bytes(path: PathLike, data: bytes) -> None:
+    with atomic_open(path, "wb") as f:
+        f.write(data)
+
+
+def finalize_file(tmp_path: PathLike, final_path: PathLike) -> None:
+    """Rende definitivo un file scritto da un processo esterno (es. arecord)"""
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, final_path)
+    _fsync_dir(Path(final_path).parent)
+
+
+class WriteBehindQueue:
+    """Coda di scritture atomiche eseguite da un thread in background"""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._worker, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: PathLike, data: bytes,
+               on_written: Optional[Callable[[Path], None]] = None) -> Future:
+        """Accoda una scrittura; blocca solo se la coda è piena"""
+        future: Future = Future()
+        self._queue.put((Path(path), data, on_written, future))
+        return future
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, data, on_written, future = item
+                try:
+                    atomic_write_bytes(path, data)
+                    if on_written:
+                        on_written(path)
+                    future.set_result(path)
+                except Exception as e:
+                    print(f"❌ Scrittura differita fallita ({path}): {e}")
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Attende che tutte le scritture accodate siano su disco"""
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+
+_write_queue: Optional[WriteBehindQueue] = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue() -> WriteBehindQueue:
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteBehindQueue()
+            # Le scritture pendenti vanno completate prima dell'uscita
+            atexit.register(_write_queue.close)
+        return _write_queue
+
+
+def save_results(results: Dict, prefix: str, output_file: Optional[PathLike] = None) -> str:
+    """Salva i risultati di un'analisi (file JSON e/o log) aggiornando il catalogo
+
+    Restituisce il percorso del file JSON oppure, se i file JSON sono
+    disattivati, il riferimento ``log:<id>`` al record nel log dei risultati.
+    """
+    from .results_log import get_results_log
+
+    def _register(written: PathLike) -> None:
+        try:
+            get_catalog().add_analysis(str(written), results)
+        except Exception as e:
+            print(f"⚠️ Catalogo non aggiornato: {e}")
+
+    path: Optional[Path] = None
+    if Config.RESULTS_JSON_FILES or output_file or not Config.RESULTS_LOG_ENABLED:
+        path = Path(output_file) if output_file else new_path(prefix, "json")
+        data = json.dumps(results, indent=2, ensure_ascii=False).encode("utf-8")
+        if Config.WRITE_BEHIND:
+            get_write_queue().submit(path, data, on_written=_register)
+        else:
+            atomic_write_bytes(path, data)
+            _register(path)
+
+    if Config.RESULTS_LOG_ENABLED:
+        record_id = get_results_log().append(results, json_path=str(path) if path else None)
+        if path is None:
+            path_ref = f"log:{record_id}"
+            _register(path_ref)
+            return path_ref
+    return str(path)
@@ -0,0 +1,154 @@
+"""
+Statistiche incrementali del tono per finestre temporali
+
+Per ogni bucket (ora o giorno) e tono principale mantiene conteggio, somma delle
+confidenze e istogramma delle intensità. Le tabelle vivono nel database del
+catalogo e vengono aggiornate con un UPSERT per granularità dentro la stessa
+transazione che indicizza l'analisi, quindi in O(1) per salvataggio.
+``backfill`` ricostruisce tutto con una sola passata sullo storico.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from ..config import Config
+
+GRANULARITIES = {"hour": 13, "day": 10}  # lunghezza del prefisso ISO
+INTENSITIES = ("bassa", "media", "alta")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tone_stats (
+    granularity     TEXT NOT NULL,
+    bucket          TEXT NOT NULL,
+    tone            TEXT NOT NULL,
+    count           INTEGER NOT NULL DEFAULT 0,
+    confidence_sum  REAL NOT NULL DEFAULT 0,
+    confidence_n    INTEGER NOT NULL DEFAULT 0,
+    intensity_bassa INTEGER NOT NULL DEFAULT 0,
+    intensity_media INTEGER NOT NULL DEFAULT 0,
+    intensity_alta  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket, tone)
+) WITHOUT ROWID;
+"""
+
+
+def _normalize(tone_analysis: Optional[Dict]) -> Dict:
+    tone_analysis = tone_analysis or {}
+    confidence = tone_analysis.get("confidenza")
+    intensity = tone_analysis.get("intensità")
+    return {
+        "tone": tone_analysis.get("tono_principale") or "sconosciuto",
+        "confidence": float(confidence) if isinstance(confidence, (int, float)) else None,
+        "intensity": intensity if intensity in INTENSITIES else None,
+    }
+
+
+def apply(conn: sqlite3.Connection, created_at: str, tone: Optional[str],
+          confidence: Optional[float], intensity: Optional[str], sign: int = 1) -> None:
+    """Aggiunge (sign=1) o rimuove (sign=-1) un'analisi dagli aggregati"""
+    if not created_at:
+        return
+    tone = tone or "sconosciuto"
+    has_conf = confidence is not None
+    hist = [sign if intensity == level else 0 for level in INTENSITIES]
+    for granularity, length in GRANULARITIES.items():
+        conn.execute(
+            """
+            INSERT INTO tone_stats (granularity, bucket, tone, count, confidence_sum,
+                                    confidence_n, intensity_bassa, intensity_media, intensity_alta)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(granularity, bucket, tone) DO UPDATE SET
+                count = count + excluded.count,
+                confidence_sum = confidence_sum + excluded.confidence_sum,
+                confidence_n = confidence_n + excluded.confidence_n,
+                intensity_bassa = intensity_bassa + excluded.intensity_bassa,
+                intensity_media = intensity_media + excluded.intensity_media,
+                intensity_alta = intensity_alta + excluded.intensity_alta
+            """,
+            (granularity, created_at[:length], tone, sign,
+             sign * confidence if has_conf else 0.0, sign if has_conf else 0, *hist),
+        )
+
+
+def apply_results(conn: sqlite3.Connection, created_at: str, tone_analysis: Optional[Dict],
+                  sign: int = 1) -> None:
+    values = _normalize(tone_analysis)
+    apply(conn, created_at, values["tone"], values["confidence"], values["intensity"], sign)
+
+
+def query(conn: sqlite3.Connection, granularity: str = "day", since: Optional[str] = None,
+          until: Optional[str] = None) -> List[Dict]:
+    """Distribuzione dei toni per bucket, in ordine cronologico"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularità non valida: {granularity}")
+    sql = "SELECT * FROM tone_stats WHERE granularity = ? AND count > 0"
+    params: List = [granularity]
+    if since:
+        sql += " AND bucket >= ?"
+        params.append(since[:GRANULARITIES[granularity]])
+    if until:
+        sql += " AND bucket < ?"
+        params.append(until[:GRANULARITIES[granularity]])
+    sql += " ORDER BY bucket, count DESC"
+
+    buckets: Dict[str, Dict] = {}
+    for row in conn.execute(sql, params):
+        entry = buckets.setdefault(row["bucket"], {"bucket": row["bucket"], "total": 0, "tones": {}})
+        entry["total"] += row["count"]
+        entry["tones"][row["tone"]] = {
+            "count": row["count"],
+            "confidenza_media": (row["confidence_sum"] / row["confidence_n"]) if row["confidence_n"] else None,
+            "intensità": {level: row[f"intensity_{level}"] for level in INTENSITIES},
+        }
+    return list(buckets.values())
+
+
+def _slim(results: Dict) -> Dict:
+    return {"timestamp": results.get("timestamp"), "tone_analysis": results.get("tone_analysis")}
+
+
+def _history() -> Iterable[Dict]:
+    """Storico dei risultati in un'unica passata sequenziale
+
+    Prima il log append-only, poi i soli file JSON che il log non copre
+    (ad esempio quelli salvati prima della sua introduzione). Un file JSON
+    riscritto più volte compare nel log più volte: conta solo l'ultima.
+    """
+    from .results_log import ResultsLog
+
+    by_json_path: Dict[str, Dict] = {}
+    if Config.RESULTS_LOG_DIR.exists():
+        for record in ResultsLog().iter_records():
+            if record.get("json_path"):
+                by_json_path[str(Path(record["json_path"]))] = _slim(record["results"])
+            else:
+                yield record["results"]
+    yield from by_json_path.values()
+
+    for result_file in Path(Config.OUTPUT_DIR).rglob("*analysis_*.json"):
+        if str(result_file) in by_json_path:
+            continue
+        try:
+            with open(result_file, 'r', encoding='utf-8') as f:
+                results = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if isinstance(results, dict):
+            yield results
+
+
+def backfill(conn: sqlite3.Connection, history: Optional[Iterable[Dict]] = None) -> int:
+    """Ricalcola gli aggregati da zero scansionando lo storico"""
+    count = 0
+    with conn:
+        conn.execute("DELETE FROM tone_stats")
+        for results in (history if history is not None else _history()):
+            created_at = results.get("timestamp")
+            if not isinstance(created_at, str):
+                continue
+            apply_results(conn, created_at, results.get("tone_analysis"))
+            count += 1
+    return count